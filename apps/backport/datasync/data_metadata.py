@@ -1,7 +1,7 @@
 import concurrent.futures
 import json
 from http.client import RemoteDisconnected
-from typing import Any, Dict, List, Union, cast
+from typing import Any, Callable, Dict, List, Optional, Union, cast
 from urllib.error import HTTPError, URLError
 
 import numpy as np
@@ -59,6 +59,11 @@ def variable_data_df_from_s3(engine: Engine, variable_ids: List[int] = [], worke
         return add_entity_code_and_name(session, df)
 
 
+def fetch_entities(session: Session, entity_ids: List[int]) -> pd.DataFrame:
+    """Fetch ID, name and code of given entities."""
+    return _fetch_entities(session, entity_ids)
+
+
 def _fetch_entities(session: Session, entity_ids: List[int]) -> pd.DataFrame:
     # Query entities from the database
     q = """
@@ -77,13 +82,20 @@ def _fetch_entities(session: Session, entity_ids: List[int]) -> pd.DataFrame:
     return pd.DataFrame(result_proxy.fetchall(), columns=result_proxy.keys())
 
 
-def add_entity_code_and_name(session: Session, df: pd.DataFrame) -> pd.DataFrame:
+def add_entity_code_and_name(
+    session: Session, df: pd.DataFrame, entities: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """Add entity code and name to data. Entities can be fetched in advance with `fetch_entities` for many
+    variables at once."""
     if df.empty:
         df["entityName"] = []
         df["entityCode"] = []
         return df
 
-    entities = _fetch_entities(session, list(df["entityId"].unique()))
+    if entities is None:
+        entities = _fetch_entities(session, list(df["entityId"].unique()))
+    else:
+        entities = entities[entities["entityId"].isin(df["entityId"].unique())]
 
     return pd.merge(df, entities, on="entityId")
 
@@ -96,12 +108,21 @@ def variable_data(data_df: pd.DataFrame) -> Dict[str, Any]:
             "year": "years",
         }
     )
-    data = data_df[["values", "years", "entities"]].to_dict(orient="list")
-    data["values"] = _convert_strings_to_numeric(data["values"])
+    if _is_numeric(data_df["values"]):
+        # Convert numeric values directly, without going through strings.
+        data = data_df[["years", "entities"]].to_dict(orient="list")
+        data = {"values": _convert_numeric_to_list(data_df["values"]), **data}
+    else:
+        data = data_df[["values", "years", "entities"]].to_dict(orient="list")
+        data["values"] = _convert_strings_to_numeric(data["values"])
     return data  # type: ignore
 
 
 def _load_variable(session: Session, variable_id: int) -> Dict[str, Any]:
+    return _load_variables(session, [variable_id])[variable_id]
+
+
+def _load_variables(session: Session, variable_ids: List[int]) -> Dict[int, Dict[str, Any]]:
     sql = """
     SELECT
         variables.*,
@@ -114,63 +135,86 @@ def _load_variable(session: Session, variable_id: int) -> Dict[str, Any]:
     FROM variables
     JOIN datasets ON variables.datasetId = datasets.id
     LEFT JOIN sources ON variables.sourceId = sources.id
-    WHERE variables.id = :variable_id
+    WHERE variables.id IN :variable_ids
     """
 
-    # Using the session to execute raw SQL and fetching one row as a result
-    result = session.execute(sql, {"variable_id": variable_id}).fetchone()  # type: ignore
+    # Using the session to execute raw SQL
+    result = session.execute(sql, {"variable_ids": variable_ids}).fetchall()  # type: ignore
 
-    # Ensure result exists and convert to dictionary
-    assert result, f"variableId `{variable_id}` not found"
-    return dict(result)
+    # Ensure all variables exist and convert them to dictionaries
+    rows = {row["id"]: dict(row) for row in result}
+    for variable_id in variable_ids:
+        assert variable_id in rows, f"variableId `{variable_id}` not found"
+    return rows
 
 
 def _load_topic_tags(session: Session, variable_id: int) -> List[str]:
+    return _load_topic_tags_of_variables(session, [variable_id])[variable_id]
+
+
+def _load_topic_tags_of_variables(session: Session, variable_ids: List[int]) -> Dict[int, List[str]]:
     sql = """
     SELECT
+        variableId,
         tags.name
     FROM tags_variables_topic_tags
     JOIN tags ON tags_variables_topic_tags.tagId = tags.id
-    WHERE variableId = :variable_id
-    ORDER BY displayOrder
+    WHERE variableId IN :variable_ids
+    ORDER BY variableId, displayOrder
     """
 
     # Using the session to execute raw SQL
-    result = session.execute(sql, {"variable_id": variable_id}).fetchall()  # type: ignore
+    result = session.execute(sql, {"variable_ids": variable_ids}).fetchall()  # type: ignore
 
-    # Extract tag names from the result and return as a list
-    return [row[0] for row in result]
+    # Extract tag names of each variable from the result
+    tags: Dict[int, List[str]] = {variable_id: [] for variable_id in variable_ids}
+    for row in result:
+        tags[row[0]].append(row[1])
+    return tags
 
 
 def _load_faqs(session: Session, variable_id: int) -> List[Dict[str, Any]]:
+    return _load_faqs_of_variables(session, [variable_id])[variable_id]
+
+
+def _load_faqs_of_variables(session: Session, variable_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
     sql = """
     SELECT
+        variableId,
         gdocId,
         fragmentId
     FROM posts_gdocs_variables_faqs
-    WHERE variableId = :variable_id
-    ORDER BY displayOrder
+    WHERE variableId IN :variable_ids
+    ORDER BY variableId, displayOrder
     """
 
     # Using the session to execute raw SQL
-    result = session.execute(sql, {"variable_id": variable_id}).fetchall()  # type: ignore
+    result = session.execute(sql, {"variable_ids": variable_ids}).fetchall()  # type: ignore
 
-    # Convert the result rows to a list of dictionaries
-    return [dict(row) for row in result]
+    # Convert the result rows of each variable to a list of dictionaries
+    faqs: Dict[int, List[Dict[str, Any]]] = {variable_id: [] for variable_id in variable_ids}
+    for row in result:
+        faqs[row["variableId"]].append({"gdocId": row["gdocId"], "fragmentId": row["fragmentId"]})
+    return faqs
 
 
 def _load_origins_df(session: Session, variable_id: int) -> pd.DataFrame:
+    return _load_origins_dfs(session, [variable_id])[variable_id]
+
+
+def _load_origins_dfs(session: Session, variable_ids: List[int]) -> Dict[int, pd.DataFrame]:
     sql = """
     SELECT
-        origins.*
+        origins.*,
+        origins_variables.variableId AS _variableId
     FROM origins
     JOIN origins_variables ON origins.id = origins_variables.originId
-    WHERE origins_variables.variableId = :variable_id
-    ORDER BY displayOrder
+    WHERE origins_variables.variableId IN :variable_ids
+    ORDER BY origins_variables.variableId, displayOrder
     """
 
     # Use the session to execute the raw SQL
-    result_proxy = session.execute(sql, {"variable_id": variable_id})  # type: ignore
+    result_proxy = session.execute(sql, {"variable_ids": variable_ids})  # type: ignore
 
     # Fetch the results into a DataFrame
     df = pd.DataFrame(result_proxy.fetchall(), columns=result_proxy.keys())
@@ -178,7 +222,12 @@ def _load_origins_df(session: Session, variable_id: int) -> pd.DataFrame:
     # Process the 'license' column
     df["license"] = df["license"].map(lambda x: json.loads(x) if x else None)
 
-    return df
+    # Split origins by variable
+    groups = dict(list(df.groupby("_variableId", sort=False)))
+    return {
+        variable_id: groups.get(variable_id, df.iloc[:0]).drop(columns="_variableId").reset_index(drop=True)
+        for variable_id in variable_ids
+    }
 
 
 def _variable_metadata(
@@ -320,9 +369,42 @@ def variable_metadata(session: Session, variable_id: int, variable_data: pd.Data
     )
 
 
+def variables_metadata(session: Session, variables_data: Dict[int, pd.DataFrame]) -> Dict[int, Dict[str, Any]]:
+    """Same as `variable_metadata`, but for many variables at once, with a constant number of queries."""
+    metadata = variables_metadata_loader(session, list(variables_data))
+    return {variable_id: metadata(variable_id, variable_data) for variable_id, variable_data in variables_data.items()}
+
+
+def variables_metadata_loader(
+    session: Session, variable_ids: List[int]
+) -> Callable[[int, pd.DataFrame], Dict[str, Any]]:
+    """Load metadata of many variables from DB with a constant number of queries and return a function that creates
+    metadata of one of them from its data. Data can then be processed one variable at a time."""
+    db_variable_rows = _load_variables(session, variable_ids)
+    db_origins_dfs = _load_origins_dfs(session, variable_ids)
+    db_topic_tags = _load_topic_tags_of_variables(session, variable_ids)
+    db_faqs = _load_faqs_of_variables(session, variable_ids)
+
+    def metadata(variable_id: int, variable_data: pd.DataFrame) -> Dict[str, Any]:
+        return _variable_metadata(
+            db_variable_row=db_variable_rows[variable_id],
+            variable_data=variable_data,
+            db_origins_df=db_origins_dfs[variable_id],
+            db_topic_tags=db_topic_tags[variable_id],
+            db_faqs=db_faqs[variable_id],
+        )
+
+    return metadata
+
+
 def _infer_variable_type(values: pd.Series) -> str:
     # values don't contain null values
     assert values.notnull().all(), "values must not contain nulls"
+    if _is_numeric(values):
+        # Same type as if numeric values were converted to strings first (e.g. floats always have a decimal point).
+        if values.empty:
+            return "mixed"
+        return "int" if pd.api.types.is_integer_dtype(values.dtype) else "float"
     assert values.map(lambda x: isinstance(x, str)).all(), "only works for strings"
     if values.empty:
         return "mixed"
@@ -369,5 +451,35 @@ def _convert_strings_to_numeric(lst: List[str]) -> List[Union[int, float, str]]:
     return result
 
 
+def _is_numeric(values: pd.Series) -> bool:
+    return pd.api.types.is_integer_dtype(values.dtype) or pd.api.types.is_float_dtype(values.dtype)
+
+
+def _convert_numeric_to_list(values: pd.Series) -> List[Union[int, float]]:
+    """Convert numeric values (without nulls) to a list of Python numbers, where floats that are whole numbers become
+    integers. The result is the same as `_convert_strings_to_numeric(values.astype(str).tolist())`, but it's vectorized.
+    """
+    # Nullable dtypes (Int64, Float64, ...) are converted to their NumPy dtypes.
+    arr = values.to_numpy(dtype=getattr(values.dtype, "numpy_dtype", values.dtype))
+
+    if arr.dtype.kind in "iu":
+        if len(arr) == 0 or np.abs(arr).max() <= 2**53:
+            return arr.tolist()
+        # Large integers lose precision when converted to strings and parsed as floats.
+        arr = arr.astype(np.float64)
+    elif arr.dtype != np.float64:
+        # Parse the shortest representation of smaller floats, e.g. float32 0.1 becomes 0.1 (not 0.10000000149011612).
+        arr = arr.astype(str).astype(np.float64)
+
+    is_integer = np.isfinite(arr) & (np.trunc(arr) == arr)
+    result = arr.astype(object)
+    fits_int64 = is_integer & (np.abs(arr) < 2**63)
+    result[fits_int64] = arr[fits_int64].astype(np.int64).astype(object)
+    # Integers that don't fit into int64 (very rare).
+    is_large_integer = is_integer & ~fits_int64
+    result[is_large_integer] = [int(x) for x in arr[is_large_integer]]
+    return result.tolist()
+
+
 def _omit_nullable_values(d: dict) -> dict:
     return {k: v for k, v in d.items() if v is not None and (isinstance(v, list) and len(v) or not pd.isna(v))}
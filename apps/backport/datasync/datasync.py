@@ -1,45 +1,224 @@
+import concurrent.futures
 import gzip
 import json
-from typing import Any, Dict
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import structlog
-from botocore.exceptions import EndpointConnectionError
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionClosedError, EndpointConnectionError
 from owid.catalog import s3_utils
 from tenacity import Retrying
-from tenacity.retry import retry_if_exception_type
+from tenacity.retry import retry_if_exception
 from tenacity.stop import stop_after_attempt
 from tenacity.wait import wait_exponential
 
 from etl import config
-from etl.publish import connect_s3_cached
+from etl.publish import connect_s3
 
 log = structlog.get_logger()
 
 config.enable_bugsnag()
 
+# Compression level of uploaded JSON files. Level 9 (gzip's default) is several times slower on large files with
+# millions of values, while they are only ~5% smaller.
+GZIP_COMPRESSLEVEL = 6
+
+
+def gzip_dict(d: Dict[str, Any]) -> bytes:
+    """Serialize dictionary to JSON and compress it. Compressed files don't depend on the time of compression."""
+    return gzip.compress(json.dumps(d, default=str).encode(), compresslevel=GZIP_COMPRESSLEVEL, mtime=0)
+
 
 def upload_gzip_dict(d: Dict[str, Any], s3_path: str, private: bool = False) -> None:
     """Upload compressed dictionary to S3 and return its URL."""
-    body_gzip = gzip.compress(json.dumps(d, default=str).encode())  # type: ignore
+    assert not private, "r2 does not support private files yet"
+    get_uploader().submit(d, s3_path).result()
 
-    bucket, key = s3_utils.s3_bucket_key(s3_path)
 
-    client = connect_s3_cached()
+@dataclass
+class UploadMetrics:
+    """Counters of uploads to R2."""
 
-    assert not private, "r2 does not support private files yet"
-    extra_args = {}
-
-    for attempt in Retrying(
-        wait=wait_exponential(min=5, max=100),
-        stop=stop_after_attempt(7),
-        retry=retry_if_exception_type(EndpointConnectionError),
-    ):
-        with attempt:
-            client.put_object(
-                Bucket=bucket,
-                Body=body_gzip,
-                Key=key,
-                ContentEncoding="gzip",
-                ContentType="application/json",
-                **extra_args,
-            )
+    requests: int = 0
+    bytes: int = 0
+    retries: int = 0
+    failures: int = 0
+    # total and maximum latency of successful requests in seconds
+    latency: float = 0.0
+    max_latency: float = 0.0
+
+    def __post_init__(self) -> None:
+        self._lock = Lock()
+
+    def record_request(self, size: int, latency: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+            self.latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "bytes": self.bytes,
+                "retries": self.retries,
+                "failures": self.failures,
+                "mean_latency": round(self.latency / self.requests, 3) if self.requests else None,
+                "max_latency": round(self.max_latency, 3),
+            }
+
+
+class RateLimiter:
+    """Limit the number of requests per minute shared by all threads. Requests can come in bursts of `burst`
+    requests, after that every request waits for its turn. Limit of 0 means no limit."""
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        burst: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, requests_per_minute // 60)
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # reserve a token, possibly in the future
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+
+
+def _is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (EndpointConnectionError, ConnectionClosedError)):
+        return True
+    # Cloudflare responds with 429 or 503 if we exceed its limits
+    if isinstance(e, ClientError):
+        return e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") in (429, 503) or e.response.get(
+            "Error", {}
+        ).get("Code") in ("SlowDown", "TooManyRequests")
+    return False
+
+
+class R2Uploader:
+    """Bounded pipeline of uploads of compressed dictionaries to R2. Dictionaries are compressed and uploaded in a
+    pool of threads sharing one S3 client (with a connection per thread) and a rate limit. Submitting blocks when
+    there are too many uploads in flight, so that memory stays bounded.
+
+    Use `get_uploader` to get the uploader shared by the whole process.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        workers: int = config.R2_UPLOAD_WORKERS,
+        requests_per_minute: int = config.R2_UPLOAD_REQUESTS_PER_MINUTE,
+        max_pending: Optional[int] = None,
+        max_attempts: int = 7,
+        wait: Any = wait_exponential(min=5, max=100),
+    ) -> None:
+        self.client = client or connect_s3(Config(max_pool_connections=workers))
+        self.metrics = UploadMetrics()
+        self.max_attempts = max_attempts
+        self._wait = wait
+        self._limiter = RateLimiter(requests_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="r2_upload")
+        self._pending = BoundedSemaphore(max_pending or 2 * workers)
+
+    def submit(self, d: Dict[str, Any], s3_path: str) -> "Future[None]":
+        """Compress and upload dictionary in the background."""
+        self._pending.acquire()
+        try:
+            future = self._executor.submit(self._upload, d, s3_path)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def submit_many(self, uploads: Iterable[Tuple[Dict[str, Any], str]]) -> "List[Future[None]]":
+        """Submit many (dictionary, s3_path) uploads. Dictionaries can be generated lazily, they're consumed only
+        as fast as they are uploaded."""
+        return [self.submit(d, s3_path) for d, s3_path in uploads]
+
+    @staticmethod
+    def wait(futures: "List[Future[None]]") -> None:
+        """Wait for all uploads to finish and raise the first error, if any."""
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _upload(self, d: Dict[str, Any], s3_path: str) -> None:
+        body_gzip = gzip_dict(d)
+
+        bucket, key = s3_utils.s3_bucket_key(s3_path)
+
+        try:
+            for attempt in Retrying(
+                wait=self._wait,
+                stop=stop_after_attempt(self.max_attempts),
+                retry=retry_if_exception(_is_retryable),
+                before_sleep=lambda _: self.metrics.record_retry(),
+                reraise=True,
+            ):
+                with attempt:
+                    self._limiter.acquire()
+                    start = time.perf_counter()
+                    self.client.put_object(
+                        Bucket=bucket,
+                        Body=body_gzip,
+                        Key=key,
+                        ContentEncoding="gzip",
+                        ContentType="application/json",
+                    )
+                    self.metrics.record_request(len(body_gzip), time.perf_counter() - start)
+        except Exception:
+            self.metrics.record_failure()
+            log.error("r2_upload.failed", s3_path=s3_path)
+            raise
+
+
+# Uploader shared by the process, see `get_uploader`.
+_UPLOADER: Optional[R2Uploader] = None
+_UPLOADER_PID: Optional[int] = None
+_UPLOADER_LOCK = Lock()
+
+
+def get_uploader() -> R2Uploader:
+    """Get the uploader shared by all uploads of the process (e.g. by all grapher steps of an `etl` run)."""
+    global _UPLOADER, _UPLOADER_PID
+    with _UPLOADER_LOCK:
+        # threads of the uploader don't survive forking (e.g. with FORK_STEPS), create a new one
+        if _UPLOADER is None or _UPLOADER_PID != os.getpid():
+            _UPLOADER = R2Uploader()
+            _UPLOADER_PID = os.getpid()
+        return _UPLOADER
@@ -0,0 +1,113 @@
+#
+#  build_cache.py
+#
+
+"""
+Content-addressed cache of outputs of data steps. Outputs are stored under the step's path
+and the checksum of its inputs (`DataStep.checksum_input`), so if a step with the same inputs
+was built before (e.g. before switching branches or deleting data/), its output is restored
+from the cache instead of running the step again.
+
+The cache lives in .cache/outputs and optionally also in a shared folder
+(e.g. on a network filesystem) given by BUILD_CACHE_SHARED_DIR.
+"""
+
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+import structlog
+
+from etl import config, paths
+
+log = structlog.get_logger()
+
+LOCAL_BUILD_CACHE_DIR = paths.CACHE_DIR / "outputs"
+
+
+def cache_dirs() -> List[Path]:
+    """Return folders with cached outputs, the local one first."""
+    dirs = [LOCAL_BUILD_CACHE_DIR]
+    if config.BUILD_CACHE_SHARED_DIR:
+        dirs.append(Path(config.BUILD_CACHE_SHARED_DIR))
+    return dirs
+
+
+def _entry(cache_dir: Path, step_path: str, checksum: str) -> Path:
+    return cache_dir / step_path.lstrip("/") / checksum
+
+
+def _source_checksum(dataset_dir: Path) -> Optional[str]:
+    try:
+        with open(dataset_dir / "index.json") as f:
+            return json.load(f).get("source_checksum")
+    except (OSError, ValueError):
+        return None
+
+
+def _copy_dir_atomic(src: Path, dest: Path) -> None:
+    """Copy folder to a temporary sibling first and then move it in place, so that
+    other processes never see a partial copy."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}")
+    try:
+        shutil.copytree(src, tmp)
+        if dest.exists():
+            shutil.rmtree(dest)
+        os.rename(tmp, dest)
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp)
+
+
+def restore(step_path: str, checksum: str, dest_dir: Path) -> bool:
+    """Restore output of a step built from inputs with given checksum into `dest_dir`.
+    Return True if it was found in the cache."""
+    for cache_dir in cache_dirs():
+        entry = _entry(cache_dir, step_path, checksum)
+
+        # make sure the entry is complete and was built from the same inputs
+        if _source_checksum(entry) != checksum:
+            continue
+
+        if dest_dir.exists() and not (dest_dir / "index.json").exists():
+            raise Exception(f"refuse to overwrite non-dataset dir at: {dest_dir}")
+
+        # NOTE: we copy files instead of hardlinking them, outputs are sometimes rewritten
+        # in place (e.g. by Dataset.save) which would corrupt the cached copy
+        _copy_dir_atomic(entry, dest_dir)
+        log.info("build_cache.restore", step=step_path, cache_dir=str(cache_dir))
+        return True
+
+    return False
+
+
+def store(step_path: str, checksum: str, src_dir: Path) -> None:
+    """Store output of a step built from inputs with given checksum in all cache folders."""
+    for cache_dir in cache_dirs():
+        entry = _entry(cache_dir, step_path, checksum)
+        if _source_checksum(entry) == checksum:
+            continue
+
+        try:
+            _copy_dir_atomic(src_dir, entry)
+        except OSError as e:
+            # a broken shared cache shouldn't fail the whole run
+            log.warning("build_cache.store_failed", step=step_path, cache_dir=str(cache_dir), error=str(e))
+            continue
+
+        _prune(entry.parent, keep=config.BUILD_CACHE_KEEP)
+
+
+def _prune(step_cache_dir: Path, keep: int) -> None:
+    """Only keep the most recent `keep` outputs of a step."""
+    entries = sorted(
+        (p for p in step_cache_dir.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in entries[keep:]:
+        shutil.rmtree(entry, ignore_errors=True)
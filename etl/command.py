@@ -3,33 +3,42 @@
 #  etl.py
 #
 
-import itertools
 import re
 import resource
 import sys
 import time
+from collections import defaultdict
 from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from contextlib import contextmanager
 from graphlib import TopologicalSorter
 from os import environ
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
 
 import click
 import structlog
 from ipdb import launch_ipdb_on_exception
 
-from etl import config, files, paths
-from etl.snapshot import snapshot_catalog
+from etl import config, files, paths, tracing
+from etl.prefetch import prefetch
+from etl.run_python_step import preload_modules
+from etl.scheduler import StepHistory, channel_rank, critical_paths, pick_ready, predict_makespan
+from etl.snapshot import snapshot_catalog, snapshot_metadata_files
 from etl.steps import (
     DAG,
     DataStep,
     GrapherStep,
+    SnapshotStep,
     Step,
+    WaldenStep,
     compile_steps,
+    filter_to_subgraph,
+    graph_nodes,
     load_dag,
     parse_step,
+    reverse_graph,
     select_dirty_steps,
+    traverse,
 )
 
 config.enable_bugsnag()
@@ -101,7 +110,24 @@ log = structlog.get_logger()
 @click.option(
     "--watch",
     is_flag=True,
-    help="Run ETL infinitely and update changed files.",
+    help="Run ETL infinitely and rebuild steps whose files changed together with their downstream dependencies.",
+)
+@click.option(
+    "--max-memory",
+    type=float,
+    help="Memory budget in GB for steps running in parallel. Steps are not started together if their peak memory from previous runs exceeds it.",
+    default=None,
+)
+@click.option(
+    "--fork/--no-fork",
+    type=bool,
+    help="Run Python steps in processes forked from warm workers with preloaded modules instead of a new subprocess for every step.",
+    default=config.FORK_STEPS,
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Record timeline of the run (dirty detection, queueing, imports, runs, saves, grapher upserts) and save it as Chrome trace JSON to .cache/profiles.",
 )
 @click.argument("steps", nargs=-1)
 def main_cli(
@@ -121,9 +147,14 @@ def main_cli(
     use_threads: bool = True,
     strict: Optional[bool] = None,
     watch: bool = False,
+    max_memory: Optional[float] = None,
+    fork: bool = config.FORK_STEPS,
+    profile: bool = False,
 ) -> None:
     _update_open_file_limit()
 
+    config.FORK_STEPS = fork
+
     # enable grapher channel when called with --grapher
     grapher_channel = grapher_channel or grapher
 
@@ -148,14 +179,18 @@ def main_cli(
         dag_path=dag_path,
         workers=workers,
         strict=strict,
+        max_memory=max_memory,
     )
 
-    if watch:
-        runs = itertools.chain([None], files.watch_folder(paths.STEP_DIR))
-    else:
-        runs = [None]
+    run = main_watch if watch else main
+
+    if profile:
+        events_file = tracing.PROFILES_DIR / f"trace-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        tracing.enable(events_file)
+        tracing.set_process_name("etl")
+        tracing.instrument_libraries()
 
-    for _ in runs:
+    try:
         if ipdb:
             config.IPDB_ENABLED = True
             config.GRAPHER_INSERT_WORKERS = 1
@@ -163,9 +198,15 @@ def main_cli(
             config.RUN_STEPS_WORKERS = 1
             kwargs["workers"] = 1
             with launch_ipdb_on_exception():
-                main(**kwargs)  # type: ignore
+                run(**kwargs)  # type: ignore
         else:
-            main(**kwargs)  # type: ignore
+            run(**kwargs)  # type: ignore
+    finally:
+        if profile:
+            trace_file = tracing.export_chrome_trace(events_file)
+            events_file.unlink()
+            tracing.disable()
+            print(f"--- Trace saved to {trace_file}, open it in https://ui.perfetto.dev or chrome://tracing")
 
 
 def main(
@@ -182,6 +223,7 @@ def main(
     dag_path: Path = paths.DEFAULT_DAG_FILE,
     workers: int = config.RUN_STEPS_WORKERS,
     strict: Optional[bool] = None,
+    max_memory: Optional[float] = None,
 ) -> None:
     """
     Execute all ETL steps listed in dag file.
@@ -206,9 +248,120 @@ def main(
         excludes=excludes,
         workers=workers,
         strict=strict,
+        max_memory=max_memory,
     )
 
 
+def main_watch(
+    steps: List[str],
+    dry_run: bool = False,
+    force: bool = False,
+    private: bool = False,
+    grapher_channel: bool = True,
+    grapher: bool = False,
+    backport: bool = False,
+    downstream: bool = False,
+    only: bool = False,
+    exclude: Optional[str] = None,
+    dag_path: Path = paths.DEFAULT_DAG_FILE,
+    workers: int = config.RUN_STEPS_WORKERS,
+    strict: Optional[bool] = None,
+    max_memory: Optional[float] = None,
+) -> None:
+    """
+    Execute ETL steps and then keep watching step files. On every change, rebuild only steps
+    whose files changed and their downstream dependencies. The DAG is loaded only once and
+    checksums of unchanged files stay cached between iterations.
+    """
+    if grapher:
+        sanity_check_db_settings()
+
+    dag = construct_dag(dag_path, backport=backport, private=private, grapher=grapher)
+
+    # changes outside of selected steps are ignored
+    selected = graph_nodes(filter_to_subgraph(dag, steps, downstream=downstream, only=only)) if steps else None
+
+    excludes = exclude.split(",") if exclude else []
+
+    def _run(includes: List[str], downstream: bool, only: bool, force: bool) -> None:
+        try:
+            run_dag(
+                dag,
+                includes,
+                dry_run=dry_run,
+                force=force,
+                private=private,
+                include_grapher_channel=grapher_channel,
+                downstream=downstream,
+                only=only,
+                excludes=list(excludes),
+                workers=workers,
+                strict=strict,
+                max_memory=max_memory,
+            )
+        except (Exception, SystemExit) as e:
+            # don't stop watching if a step fails
+            click.echo(f"{click.style('FAILED', fg='red')} {e}")
+
+    _run(steps, downstream=downstream, only=only, force=force)
+
+    print("--- Watching for changes...")
+    for changed_files in files.watch_folder(paths.STEP_DIR):
+        changed_steps = steps_for_changed_files(changed_files, dag)
+        if selected is not None:
+            changed_steps &= selected
+        if not changed_steps:
+            continue
+
+        print(f"--- Detected changes in {', '.join(sorted(changed_steps))}")
+        if only:
+            # rerun exactly the changed steps
+            _run(_exact_patterns(changed_steps), downstream=False, only=True, force=True)
+        else:
+            # rerun changed steps and everything downstream of them, dependencies are only
+            # executed if they're dirty
+            targets = set(traverse(reverse_graph(dag), changed_steps))
+            if selected is not None:
+                targets &= selected
+            _run(_exact_patterns(targets), downstream=False, only=False, force=force)
+        print("--- Watching for changes...")
+
+
+def _exact_patterns(step_names: Iterable[str]) -> List[str]:
+    return [f"^{re.escape(step)}$" for step in sorted(step_names)]
+
+
+def steps_for_changed_files(changed_files: Iterable[Path], dag: DAG) -> Set[str]:
+    """Return data steps from the DAG that are defined by given files. Shared files
+    (shared*) belong to all steps in the same folder."""
+    steps_by_path = defaultdict(set)
+    for step in graph_nodes(dag):
+        scheme, _, path = step.partition("://")
+        if scheme in ("data", "data-private"):
+            steps_by_path[path].add(step)
+
+    matched = set()
+    for f in changed_files:
+        for base_dir in (paths.STEP_DIR / "data", paths.STEP_DIR / "archive"):
+            if not f.is_relative_to(base_dir):
+                continue
+
+            # channel / namespace / version / dataset[.ext or /module]
+            parts = f.relative_to(base_dir).parts
+            if len(parts) < 4:
+                continue
+            prefix = "/".join(parts[:3])
+
+            if len(parts) == 4 and parts[3].startswith("shared"):
+                for path, step_names in steps_by_path.items():
+                    if path.startswith(prefix + "/"):
+                        matched |= step_names
+            else:
+                matched |= steps_by_path.get(f"{prefix}/{parts[3].split('.')[0]}", set())
+
+    return matched
+
+
 def sanity_check_db_settings() -> None:
     """
     Give a nice error if the DB has not been configured.
@@ -255,6 +408,7 @@ def run_dag(
     excludes: Optional[List[str]] = None,
     workers: int = config.RUN_STEPS_WORKERS,
     strict: Optional[bool] = None,
+    max_memory: Optional[float] = None,
 ) -> None:
     """
     Run the selected steps, and anything that needs updating based on them. An empty
@@ -262,6 +416,8 @@ def run_dag(
 
     By default, data steps do not re-run if they appear to be up-to-date already by
     looking at their checksum.
+
+    :param max_memory: Memory budget in GB for steps running in parallel.
     """
     excludes = excludes or []
     if not include_grapher_channel:
@@ -282,61 +438,78 @@ def run_dag(
 
     # do not run dependencies if `only` is set by setting them to non-dirty
     if only:
+        selected = {str(step) for step in steps}
         for step in steps:
-            _set_dependencies_to_nondirty(step)
+            _set_dependencies_to_nondirty(step, selected)
 
     if not force:
         print("--- Detecting which steps need rebuilding...")
         start_time = time.time()
-        steps = select_dirty_steps(steps, workers=config.DIRTY_STEPS_WORKERS)
+        with tracing.span("select_dirty_steps", cat="dirty"):
+            steps = select_dirty_steps(steps, workers=config.DIRTY_STEPS_WORKERS)
         click.echo(f"{click.style('OK', fg='blue')} ({time.time() - start_time:.1f}s)")
 
     if not steps:
         print("--- All datasets up to date!")
         return
 
+    max_memory_bytes = int(max_memory * 2**30) if max_memory else None
+
+    if not dry_run and config.PREFETCH:
+        _prefetch(steps)
+
     if dry_run:
         print(f"--- Running {len(steps)} steps:")
-        return enumerate_steps(steps)
+        enumerate_steps(steps)
+        return print_predicted_makespan(steps, workers, max_memory=max_memory_bytes)
     elif workers == 1:
         print(f"--- Running {len(steps)} steps:")
         return exec_steps(steps, strict=strict)
     else:
         print(f"--- Running {len(steps)} steps with {workers} processes:")
-        return exec_steps_parallel(steps, workers, dag=dag, strict=strict)
+        return exec_steps_parallel(steps, workers, dag=dag, strict=strict, max_memory=max_memory_bytes)
+
+
+def _prefetch(steps: List[Step]) -> None:
+    """Download files of snapshot and walden steps concurrently before running them."""
+    ingest_steps = [s for s in steps if isinstance(s, (SnapshotStep, WaldenStep))]
+    if not ingest_steps:
+        return
+
+    print(f"--- Prefetching files of {len(ingest_steps)} snapshot and walden steps...")
+    start_time = time.time()
+    with tracing.span("prefetch", cat="prefetch"):
+        n_downloaded, n_failed = prefetch(ingest_steps)
+    status = click.style("OK", fg="blue") if not n_failed else click.style(f"{n_failed} FAILED", fg="red")
+    click.echo(f"{status} ({n_downloaded} files, {time.time() - start_time:.1f}s)")
 
 
 def exec_steps(steps: List[Step], strict: Optional[bool] = None) -> None:
+    if config.FORK_STEPS:
+        preload_modules()
+
     for i, step in enumerate(steps, 1):
         print(f"--- {i}. {step}...")
         strict = _detect_strictness_level(step, strict)
-        with strictness_level(strict):
+        with strictness_level(strict), tracing.span("run", cat="step", step=str(step)):
             time_taken = timed_run(lambda: step.run())
             click.echo(f"{click.style('OK', fg='blue')} ({time_taken:.1f}s)")
             print()
 
+        StepHistory().record(str(step), time_taken, step.peak_rss)
+
 
 def _steps_sort_key(step: Step) -> int:
     """Sort steps by channel, so that grapher steps are executed first, then garden, then meadow, then snapshots."""
-    str_step = str(step)
-    if "grapher://" in str_step:
-        return 0
-    elif "garden://" in str_step:
-        return 1
-    elif "meadow://" in str_step:
-        return 2
-    elif "snapshot://" in str_step:
-        return 3
-    else:
-        return 4
+    return channel_rank(str(step))
 
 
-def exec_steps_parallel(steps: List[Step], workers: int, dag: DAG, strict: Optional[bool] = None) -> None:
+def _exec_graph(steps: List[Step]) -> Dict[str, Set[str]]:
+    """Create execution graph from steps."""
     # put grapher steps in front of the queue to process them as soon as possible and lessen
     # the load on MySQL
     steps = sorted(steps, key=_steps_sort_key)
 
-    # create execution graph from steps
     exec_graph = {}
     steps_str = {str(step) for step in steps}
     for step in steps:
@@ -345,11 +518,60 @@ def exec_steps_parallel(steps: List[Step], workers: int, dag: DAG, strict: Optio
         # different attributes
         exec_graph[str(step)] = {str(dep) for dep in step.dependencies if str(dep) in steps_str}
 
-    exec_graph_parallel(exec_graph, _exec_step_job, workers, dag=dag, strict=strict)
+    return exec_graph
+
+
+def exec_steps_parallel(
+    steps: List[Step], workers: int, dag: DAG, strict: Optional[bool] = None, max_memory: Optional[int] = None
+) -> None:
+    exec_graph = _exec_graph(steps)
+
+    # start steps on the longest remaining chain first, based on durations from previous runs
+    history = StepHistory.load()
+    priorities = critical_paths(exec_graph, history.durations(exec_graph))
+
+    # warm up workers once, every step is then forked from them
+    initializer = preload_modules if config.FORK_STEPS else None
+
+    exec_graph_parallel(
+        exec_graph,
+        _exec_step_job,
+        workers,
+        initializer=initializer,
+        priorities=priorities,
+        memory=history.peak_memory(exec_graph),
+        max_memory=max_memory,
+        dag=dag,
+        strict=strict,
+    )
+
+
+def print_predicted_makespan(steps: List[Step], workers: int, max_memory: Optional[int] = None) -> None:
+    """Print how long it'd take to run the steps based on their durations from previous runs."""
+    exec_graph = _exec_graph(steps)
+    history = StepHistory.load()
+    durations = history.durations(exec_graph)
+
+    makespan = predict_makespan(exec_graph, durations, workers, history.peak_memory(exec_graph), max_memory)
+    critical_path = max(critical_paths(exec_graph, durations).values(), default=0.0)
+    n_unknown = len([s for s in exec_graph if s not in history.records])
+
+    print(
+        f"--- Predicted time with {workers} workers: {makespan:.0f}s "
+        f"(critical path {critical_path:.0f}s, {n_unknown} steps without history)"
+    )
 
 
 def exec_graph_parallel(
-    exec_graph: Dict[str, Any], func: Callable[[str], None], workers: int, use_threads=False, **kwargs
+    exec_graph: Dict[str, Any],
+    func: Callable[[str], None],
+    workers: int,
+    use_threads=False,
+    initializer: Optional[Callable[[], None]] = None,
+    priorities: Optional[Dict[str, float]] = None,
+    memory: Optional[Dict[str, int]] = None,
+    max_memory: Optional[int] = None,
+    **kwargs,
 ) -> None:
     """
     Execute a graph of tasks in parallel using multiple workers. TopologicalSorter orders nodes in the
@@ -359,19 +581,34 @@ def exec_graph_parallel(
     :param func: The function to be executed for each task.
     :param workers: The number of workers to use for parallel execution.
     :param use_threads: Flag indicating whether to use threads instead of processes for parallel execution.
+    :param initializer: Function called once in every worker when it starts, e.g. to preload modules.
+    :param priorities: Priority of tasks, ready tasks with higher priority are submitted first.
+    :param memory: Expected peak memory of tasks in bytes.
+    :param max_memory: Don't run tasks together if their expected memory exceeds this budget in bytes.
     :param kwargs: Additional keyword arguments to be passed to the function.
     """
     topological_sorter = TopologicalSorter(exec_graph)
     topological_sorter.prepare()
 
+    priorities = priorities or {}
+    ready: List[str] = []
+    # when tasks became ready, the time until they're submitted is recorded as queueing delay
+    ready_at: Dict[str, float] = {}
+
     pool_factory = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
-    with pool_factory(max_workers=workers) as executor:
+    with pool_factory(max_workers=workers, initializer=initializer) as executor:
         # Dictionary to keep track of future tasks
         future_to_task: Dict[Future, str] = {}
 
         while topological_sorter.is_active():
-            # Submit tasks that are ready to the executor
+            # Submit ready tasks with the highest priority that fit into free workers and memory
             for task in topological_sorter.get_ready():
+                ready.append(task)
+                ready_at[task] = time.time()
+            running = list(future_to_task.values())
+            for task in pick_ready(ready, priorities, running, workers, memory, max_memory):
+                ready.remove(task)
+                tracing.record_span("queued", ready_at.pop(task), time.time(), cat="queue", step=task)
                 future = executor.submit(func, task, **kwargs)
                 future_to_task[future] = task
 
@@ -397,9 +634,11 @@ def _exec_step_job(step_name: str, dag: Optional[DAG] = None, strict: Optional[b
     assert dag
     step = parse_step(step_name, dag)
     strict = _detect_strictness_level(step, strict)
-    with strictness_level(strict):
+    with strictness_level(strict), tracing.span("run", cat="step", step=step_name):
         time_taken = timed_run(lambda: step.run())
 
+    StepHistory().record(step_name, time_taken, step.peak_rss)
+
     print(f"--- Finished {step_name} ({time_taken:.0f}s)", flush=True)
 
 
@@ -459,15 +698,29 @@ def _is_private_step(step_name: str) -> bool:
 
 
 def _backporting_steps(private: bool, filter_steps: Optional[Set[str]] = None) -> DAG:
-    """Return a DAG of steps for backporting datasets."""
-    dag: DAG = {}
-
+    """Return a DAG of steps for backporting datasets. Loading all backports takes a long
+    time, so the DAG is cached until any of the matching .dvc files is added, removed or changed."""
     # get all backports, this takes a long time
     if filter_steps is None:
         match = "backport/.*"
     else:
         match = "|".join([step.split("/")[-1] for step in filter_steps])
 
+    if not config.DAG_CACHE:
+        return _load_backporting_steps(private, match)
+
+    dvc_files = sorted(snapshot_metadata_files(match))
+    cache = files.MtimeCache("backporting_steps", (private, dvc_files))
+    dag = cache.get()
+    if dag is None:
+        dag = _load_backporting_steps(private, match)
+        cache.set(dag, dvc_files)
+    return dag
+
+
+def _load_backporting_steps(private: bool, match: str) -> DAG:
+    dag: DAG = {}
+
     # load all backported snapshots
     for snap in snapshot_catalog(match):
         # skip private backported steps
@@ -510,13 +763,15 @@ def _update_open_file_limit() -> None:
         resource.setrlimit(resource.RLIMIT_NOFILE, (min(LIMIT_NOFILE, hard_limit), hard_limit))
 
 
-def _set_dependencies_to_nondirty(step: Step) -> None:
-    """Set all dependencies of a step to non-dirty."""
+def _set_dependencies_to_nondirty(step: Step, selected: Set[str] = set()) -> None:
+    """Set all dependencies of a step to non-dirty. Dependencies that are `selected` steps
+    themselves are skipped, they share the same object and should still run if dirty."""
     if isinstance(step, DataStep):
         for step_dep in step.dependencies:
-            step_dep.is_dirty = lambda: False
+            if str(step_dep) not in selected:
+                step_dep.is_dirty = lambda: False
     if isinstance(step, GrapherStep):
-        for step_dep in step.data_step.dependencies:
+        if str(step.data_step) not in selected:
             step.data_step.is_dirty = lambda: False
 
 
@@ -109,6 +109,23 @@ RUN_STEPS_WORKERS = int(env.get("RUN_STEPS_WORKERS", 1))
 # NOTE: make sure the product of run processes and grapher workers is constant
 GRAPHER_INSERT_WORKERS = int(env.get("GRAPHER_WORKERS", max(10, int(40 / RUN_STEPS_WORKERS))))
 
+# upsert all indicators of a dataset with a few set-based queries in a single transaction
+# (see `grapher_import.upsert_tables`) instead of a separate transaction for every indicator
+GRAPHER_BULK_UPSERT = env.get("GRAPHER_BULK_UPSERT") in ("True", "true", "1")
+
+# skip upserting indicators whose data and metadata haven't changed, based on checksums stored in DB
+# NOTE: checksums are kept in table `etl_variable_checksums` which is created on first use, the DB user needs
+# the CREATE privilege for that
+GRAPHER_VARIABLE_CHECKSUMS = env.get("GRAPHER_VARIABLE_CHECKSUMS") in ("True", "true", "1")
+
+# number of threads uploading indicator data and metadata to R2, shared by all grapher steps of a process
+R2_UPLOAD_WORKERS = int(env.get("R2_UPLOAD_WORKERS", 20))
+
+# maximum number of uploads to R2 per minute shared by all grapher steps of a process, 0 means no limit
+# NOTE: Cloudflare limits us to 600 requests per minute on some endpoints, set it to 600 (divided by the
+# number of parallel processes) if uploads are throttled too often
+R2_UPLOAD_REQUESTS_PER_MINUTE = int(env.get("R2_UPLOAD_REQUESTS_PER_MINUTE", 0))
+
 # only upsert indicators matching this filter, this is useful for fast development
 # of data pages for a single indicator
 GRAPHER_FILTER = env.get("GRAPHER_FILTER", None)
@@ -117,6 +134,37 @@ GRAPHER_FILTER = env.get("GRAPHER_FILTER", None)
 # (only enforced on Linux)
 MAX_VIRTUAL_MEMORY_LINUX = 32 * 2**30  # 32 GB
 
+# run Python steps in processes forked from a warm worker with preloaded modules
+# instead of spawning `poetry run run_python_step` for every step
+FORK_STEPS = env.get("FORK_STEPS") in ("True", "true", "1")
+
+# persist checksums of files in .cache/ between runs, entries are invalidated when
+# size, mtime or inode of a file changes
+CHECKSUM_CACHE = env.get("CHECKSUM_CACHE", "1") in ("True", "true", "1")
+
+# restore outputs of data steps from .cache/outputs if they were built from the same inputs before,
+# BUILD_CACHE_SHARED_DIR is an optional folder shared by several machines
+BUILD_CACHE = env.get("BUILD_CACHE") in ("True", "true", "1")
+BUILD_CACHE_SHARED_DIR = env.get("BUILD_CACHE_SHARED_DIR")
+# number of cached outputs to keep for each step
+BUILD_CACHE_KEEP = int(env.get("BUILD_CACHE_KEEP", 3))
+
+# cache parsed DAG and DAG of backported datasets in .cache/, it is reloaded only if
+# any of the YAML or .dvc files it was built from changes
+DAG_CACHE = env.get("DAG_CACHE", "1") in ("True", "true", "1")
+
+# download files of dirty snapshot and walden steps concurrently before running steps
+PREFETCH = env.get("PREFETCH", "1") in ("True", "true", "1")
+PREFETCH_WORKERS = int(env.get("PREFETCH_WORKERS", 16))
+# URL of the `public-read` DVC remote with public snapshots
+SNAPSHOTS_URL = env.get("SNAPSHOTS_URL", "https://snapshots.owid.io")
+
+# number of threads for writing tables of a dataset in `create_dataset`
+SAVE_TABLES_WORKERS = int(env.get("SAVE_TABLES_WORKERS", 4))
+
+# run every Python step with cProfile and save its stats to .cache/profiles/<step>.prof
+PROFILE_STEPS = env.get("PROFILE_STEPS") in ("True", "true", "1")
+
 # increment this to force a full rebuild of all datasets
 ETL_EPOCH = 3
 
@@ -15,6 +15,7 @@ from owid.datautils.dataframes import groupby_agg, map_series
 from owid.datautils.io.json import load_json
 from structlog import get_logger
 
+from etl.data_helpers.geo_index import load_population, load_regions_index
 from etl.paths import DATA_DIR, LATEST_REGIONS_DATASET_PATH
 
 # Initialize logger.
@@ -76,7 +77,7 @@ def _load_population() -> Table:
     # WARNING: This function is deprecated. All datasets should be loaded using PathFinder.
     ####################################################################################################################
     log.warning(f"Dataset {DATASET_POPULATION} is silently being loaded.")
-    population = Dataset(DATASET_POPULATION)[TNAME_KEY_INDICATORS]
+    population = load_population(Dataset(DATASET_POPULATION), TNAME_KEY_INDICATORS)
     return population.reset_index()
 
 
@@ -372,54 +373,110 @@ def add_region_aggregates(
         )
 
     # If aggregations are not defined for each variable, assume 'sum'.
-    fixed_columns = [country_col, year_col]
     if aggregations is None:
-        aggregations = {variable: "sum" for variable in df.columns if variable not in fixed_columns}
+        aggregations = {variable: "sum" for variable in df.columns if variable not in [country_col, year_col]}
+
+    df_updated = _add_regions(
+        df=df,
+        members_of_regions={region: countries_in_region},
+        countries_that_must_have_data={region: countries_that_must_have_data},
+        aggregations=aggregations,
+        num_allowed_nans_per_year=num_allowed_nans_per_year,
+        frac_allowed_nans_per_year=frac_allowed_nans_per_year,
+        min_num_values_per_year=min_num_values_per_year,
+        country_col=country_col,
+        year_col=year_col,
+        keep_original_region_with_suffix=keep_original_region_with_suffix,
+    )
+
+    # If the original was Table, copy metadata
+    if isinstance(df, Table):
+        return Table(df_updated).copy_metadata(df)
+    else:
+        return df_updated  # type: ignore
+
+
+def _add_regions(
+    df: pd.DataFrame,
+    members_of_regions: Dict[str, List[str]],
+    countries_that_must_have_data: Dict[str, List[str]],
+    aggregations: Dict[str, Any],
+    num_allowed_nans_per_year: Optional[int] = None,
+    frac_allowed_nans_per_year: Optional[float] = None,
+    min_num_values_per_year: Optional[int] = None,
+    country_col: str = "country",
+    year_col: str = "year",
+    keep_original_region_with_suffix: Optional[str] = None,
+) -> pd.DataFrame:
+    """Add (or replace) aggregate data for several regions at once.
+
+    Rows of countries are matched with the regions they are members of using a membership matrix (countries x regions),
+    and all regions are aggregated in a single groupby over region and year. The conditions on mandatory countries and
+    on the number of nans are also evaluated for all regions at once.
+
+    See add_region_aggregates for the meaning of the arguments. Regions should not be members of each other, otherwise
+    the aggregate of a region would be built from the original data of another region, and not from its new aggregate.
+
+    """
+    regions = list(members_of_regions)
     variables = list(aggregations)
 
-    # Initialise dataframe of added regions, and add variables one by one to it.
-    # df_region = Table({country_col: [], year_col: []}).astype(dtype={country_col: "object", year_col: "int"})
-    # Select data for countries in the region.
-    df_countries = df[df[country_col].isin(countries_in_region)]
-
-    df_region = groupby_agg(
-        df=df_countries,
-        groupby_columns=year_col,
-        aggregations=dict(
-            **aggregations,
-            **{country_col: lambda x: set(countries_that_must_have_data).issubset(set(list(x)))},
-        ),
+    # Membership matrix of countries found in the data and regions, and the same for countries that must have data.
+    # An additional last row corresponds to missing countries (with code -1), which are not members of any region.
+    codes, countries = pd.factorize(df[country_col])
+    is_member = np.zeros((len(countries) + 1, len(regions)), dtype=bool)
+    must_have_data = np.zeros((len(countries) + 1, len(regions)), dtype=bool)
+    for i, region in enumerate(regions):
+        is_member[:-1, i] = countries.isin(members_of_regions[region])
+        must_have_data[:-1, i] = countries.isin(countries_that_must_have_data.get(region) or [])
+
+    # Repeat the rows of each country once for each region it is a member of (keeping the original order of rows), and
+    # replace the country by the region.
+    rows, region_codes = np.nonzero(is_member[codes])
+    df_members = df[[year_col] + variables].iloc[rows].reset_index(drop=True)
+    df_members.insert(0, country_col, np.array(regions, dtype=object)[region_codes])
+
+    df_regions = groupby_agg(
+        df=df_members,
+        groupby_columns=[country_col, year_col],
+        aggregations=aggregations,
         num_allowed_nans=num_allowed_nans_per_year,
         frac_allowed_nans=frac_allowed_nans_per_year,
         min_num_values=min_num_values_per_year,
-    ).reset_index()
+    )
 
-    # Create filter that detects rows where the most contributing countries are not present.
-    if df_region[country_col].dtypes == "category":
-        # Doing df_region[country_col].any() fails if the country column is categorical.
-        mask_countries_present = ~(df_region[country_col].astype(str))
-    else:
-        mask_countries_present = ~df_region[country_col]
-    if mask_countries_present.any():
-        # Make nan all aggregates if the most contributing countries were not present.
-        df_region.loc[mask_countries_present, variables] = np.nan
-    # Replace the column that was used to check if most contributing countries were present by the region's name.
-    df_region[country_col] = region
+    # Make nan all aggregates of a region and year where any of the countries that must have data is not present.
+    num_required = {region: len(set(countries_that_must_have_data.get(region) or [])) for region in regions}
+    if any(num_required.values()):
+        # Count the different countries that must have data found in each region and year.
+        must_have_data_codes = pd.Series(np.where(must_have_data[codes[rows], region_codes], codes[rows], np.nan))
+        num_present = must_have_data_codes.groupby(
+            [df_members[country_col], df_members[year_col]], dropna=False, observed=True
+        ).nunique()
+        mask_countries_missing = (
+            num_present.reindex(df_regions.index).to_numpy()
+            < df_regions.index.get_level_values(0).map(num_required).to_numpy()
+        )
+        if mask_countries_missing.any():
+            df_regions.loc[mask_countries_missing, variables] = np.nan
+    df_regions = df_regions.reset_index()
 
+    rows_original_regions = df[country_col].isin(regions)
     if isinstance(keep_original_region_with_suffix, str):
-        # Keep rows in the original dataframe containing rows for region (adding a suffix to the region name), and then
-        # append new rows for region.
-        rows_original_region = df[country_col] == region
-        df_original_region = df[rows_original_region].reset_index(drop=True)
-        # Append suffix at the end of the name of the original region.
-        df_original_region[country_col] = region + cast(str, keep_original_region_with_suffix)
+        # Keep rows in the original dataframe containing rows for regions (adding a suffix to the region names), and
+        # then append new rows for regions.
+        df_original_regions = df[rows_original_regions].reset_index(drop=True)
+        # Append suffix at the end of the name of the original regions.
+        df_original_regions[country_col] = (
+            df_original_regions[country_col].astype(str) + keep_original_region_with_suffix
+        )
         df_updated = pd.concat(
-            [df[~rows_original_region], df_original_region, df_region],
+            [df[~rows_original_regions], df_original_regions, df_regions],
             ignore_index=True,
         )
     else:
-        # Remove rows in the original table containing rows for region, and append new rows for region.
-        df_updated = pd.concat([df[~(df[country_col] == region)], df_region], ignore_index=True)
+        # Remove rows in the original table containing rows for regions, and append new rows for regions.
+        df_updated = pd.concat([df[~rows_original_regions], df_regions], ignore_index=True)
         # WARNING: When an aggregate is added (e.g. "Europe") just for one of the columns (and no aggregation is
         # specified for the rest of columns) and there was already data for that region, the data for the rest of
         # columns is deleted for that particular region (in the following line).
@@ -427,21 +484,18 @@ def add_region_aggregates(
         # just certain columns. However, the expected behavior would be to just replace the region data for the
         # specified column.
         # For now, simply warn that the original data for the region for those columns was deleted.
-        columns_without_aggregate = set(df.drop(columns=fixed_columns).columns) - set(aggregations)
-        if (len(columns_without_aggregate) > 0) and (len(df[df[country_col] == region]) > 0):
-            log.warning(
-                f"Region {region} already has data for columns that do not have a defined aggregation method: "
-                f"({columns_without_aggregate}). That data will become nan."
-            )
+        columns_without_aggregate = set(df.drop(columns=[country_col, year_col]).columns) - set(aggregations)
+        if len(columns_without_aggregate) > 0:
+            for region in pd.unique(df.loc[rows_original_regions, country_col].astype(str)):
+                log.warning(
+                    f"Region {region} already has data for columns that do not have a defined aggregation method: "
+                    f"({columns_without_aggregate}). That data will become nan."
+                )
 
     # Sort conveniently.
     df_updated = df_updated.sort_values([country_col, year_col]).reset_index(drop=True)
 
-    # If the original was Table, copy metadata
-    if isinstance(df, Table):
-        return Table(df_updated).copy_metadata(df)
-    else:
-        return df_updated  # type: ignore
+    return df_updated
 
 
 def harmonize_countries(
@@ -494,6 +548,16 @@ def harmonize_countries(
     """
     df_harmonized = df.copy(deep=False)
 
+    # Encode country names only once, so that all operations below only need to handle unique names (which is much
+    # faster for long tables). The harmonized column is returned as a category.
+    countries_in_data = df[country_col]
+    if countries_in_data.dtype != "category":
+        # NOTE: This is faster than astype("category"), which also sorts categories.
+        codes, uniques = pd.factorize(countries_in_data)
+        countries_in_data = pd.Series(
+            pd.Categorical.from_codes(codes, categories=uniques), index=df.index, name=country_col
+        )
+
     # Load country mappings.
     countries = load_json(countries_file, warn_on_duplicated_keys=True)
 
@@ -502,7 +566,7 @@ def harmonize_countries(
         excluded_countries = load_json(excluded_countries_file, warn_on_duplicated_keys=True)
 
         # Check that all countries to be excluded exist in the data.
-        unknown_excluded_countries = set(excluded_countries) - set(df[country_col])
+        unknown_excluded_countries = set(excluded_countries) - set(countries_in_data.unique())
         if warn_on_unknown_excluded_countries and (len(unknown_excluded_countries) > 0):
             warn_on_list_of_entities(
                 list_of_entities=unknown_excluded_countries,
@@ -511,11 +575,13 @@ def harmonize_countries(
             )
 
         # Remove rows corresponding to countries to be excluded.
-        df_harmonized = df_harmonized[~df_harmonized[country_col].isin(excluded_countries)]
+        is_excluded = countries_in_data.isin(excluded_countries)
+        df_harmonized = df_harmonized[~is_excluded]
+        countries_in_data = countries_in_data[~is_excluded]
 
     # Harmonize all remaining country names.
     country_harmonized = map_series(
-        series=df_harmonized[country_col],
+        series=countries_in_data,
         mapping=countries,
         make_unmapped_values_nan=make_missing_countries_nan,
         warn_on_missing_mappings=warn_on_missing_countries,
@@ -589,7 +655,7 @@ def add_population_to_dataframe(
 
     # Load population data.
     if ds_population is not None:
-        population = ds_population["population"].reset_index()
+        population = load_population(ds_population).reset_index()
     else:
         population = _load_population()
     population = population.rename(
@@ -707,7 +773,7 @@ def add_population_to_table(
     #  tb_with_population[population_col].m.to_dict() == ds_population["population"]["population"].m.to_dict()
     #  is True. If so, the following line may not be necessary.
     tb_with_population[population_col] = tb_with_population[population_col].copy_metadata(
-        ds_population["population"]["population"]
+        load_population(ds_population)["population"]
     )
 
     return tb_with_population
@@ -840,8 +906,8 @@ def list_members_of_region(
     if excluded_members is None:
         excluded_members = []
 
-    # Get the main table from the regions dataset and create a new table that has regions and members.
-    tb_countries_in_region = create_table_of_regions_and_subregions(ds_regions=ds_regions, subregion_type="members")
+    # Get a dictionary of regions and their members (from the cached index of the regions dataset).
+    members_of_regions = load_regions_index(ds_regions).subregions("members")
 
     if ds_income_groups is not None:
         if "wb_income_group" in ds_income_groups.table_names:
@@ -877,32 +943,20 @@ def list_members_of_region(
             # Append historical regions to latest income group classifications.
             tb_income = pd.concat([tb_income, historical_regions], ignore_index=True)
 
-        # Create a dataframe of countries in each income group.
-        tb_countries_in_income_group = (
-            tb_income.rename(columns={"classification": "region", "country": "members"})  # type: ignore
-            .groupby("region", as_index=True, observed=True)
-            .agg({"members": list})
-        )
-
-        # Create a dataframe of members in regions, including income groups.
-        tb_countries_in_region = pd.concat([tb_countries_in_region, tb_countries_in_income_group], ignore_index=False)
+        # Add countries in each income group to the dictionary of members of regions.
+        members_of_regions = {
+            **members_of_regions,
+            **tb_income.groupby("classification", observed=True)["country"].agg(list).to_dict(),
+        }
 
-    # Get list of default members for the given region, if it's known.
-    if region in tb_countries_in_region.index.tolist():
-        countries_set = set(tb_countries_in_region.loc[region]["members"])
-    else:
-        # Initialise an empty set of members.
-        countries_set = set()
+    # Get list of default members for the given region, if it's known, otherwise initialise an empty set of members.
+    countries_set = set(members_of_regions.get(region, []))
 
     # List countries from the list of regions included.
-    countries_set |= set(
-        sum([tb_countries_in_region.loc[region_included]["members"] for region_included in additional_regions], [])
-    )
+    countries_set |= set(sum([members_of_regions[region_included] for region_included in additional_regions], []))
 
     # Remove all countries from the list of regions excluded.
-    countries_set -= set(
-        sum([tb_countries_in_region.loc[region_excluded]["members"] for region_excluded in excluded_regions], [])
-    )
+    countries_set -= set(sum([members_of_regions[region_excluded] for region_excluded in excluded_regions], []))
 
     # Add the list of individual countries to be included.
     countries_set |= set(additional_members)
@@ -1136,10 +1190,7 @@ def add_regions_to_table(
             accepted_overlaps = []
 
         # Create a dictionary of regions and its members.
-        df_regions_and_members = create_table_of_regions_and_subregions(
-            ds_regions=ds_regions, subregion_type=subregion_type
-        )
-        regions_and_members = df_regions_and_members[subregion_type].to_dict()
+        regions_and_members = load_regions_index(ds_regions).subregions(subregion_type)
 
         # Assume incoming table has a dummy index (the whole function may not work otherwise).
         # Example of region_and_members:
@@ -1185,7 +1236,8 @@ def add_regions_to_table(
     else:
         countries_that_must_have_data = {region: [] for region in list(regions)}
 
-    # Add region aggregates.
+    # List members of each region.
+    members_of_regions = {}
     for region in regions:
         # Check that the content of the region dictionary is as expected.
         expected_items = {"additional_regions", "excluded_regions", "additional_members", "excluded_members"}
@@ -1195,8 +1247,7 @@ def add_regions_to_table(
                 f"Unknown items in dictionary of regions {region}: {unknown_items}. Expected: {expected_items}."
             )
 
-        # List members of the region.
-        members = list_members_of_region(
+        members_of_regions[region] = list_members_of_region(
             region=region,
             ds_regions=ds_regions,
             ds_income_groups=ds_income_groups,
@@ -1207,17 +1258,23 @@ def add_regions_to_table(
             # By default, include historical regions in income groups.
             include_historical_regions_in_income_groups=True,
         )
-        # TODO: Here we could optionally define _df_with_regions, which is passed to add_region_aggregates, and is
-        #   identical to df_with_regions, but overlaps in accepted_overlaps are solved (e.g. the data for the historical
-        #   or parent region is made nan).
-
-        # Add aggregate data for current region.
-        df_with_regions = add_region_aggregates(
+    # TODO: Here we could optionally define _df_with_regions, which is passed to _add_regions, and is identical to
+    #   df_with_regions, but overlaps in accepted_overlaps are solved (e.g. the data for the historical or parent region
+    #   is made nan).
+
+    # Add aggregate data for all regions at once. If a region is a member of another region, the aggregate of the latter
+    # has to be built from the new aggregate of the former, so regions are added one by one (in the given order).
+    all_members = set().union(*members_of_regions.values()) if members_of_regions else set()
+    if all_members & set(members_of_regions):
+        batches = [[region] for region in members_of_regions]
+    else:
+        batches = [list(members_of_regions)] if members_of_regions else []
+    for batch in batches:
+        df_with_regions = _add_regions(
             df=df_with_regions,
-            region=region,
+            members_of_regions={region: members_of_regions[region] for region in batch},
+            countries_that_must_have_data={region: countries_that_must_have_data[region] for region in batch},
             aggregations=aggregations,
-            countries_in_region=members,
-            countries_that_must_have_data=countries_that_must_have_data[region],
             num_allowed_nans_per_year=num_allowed_nans_per_year,
             frac_allowed_nans_per_year=frac_allowed_nans_per_year,
             min_num_values_per_year=min_num_values_per_year,
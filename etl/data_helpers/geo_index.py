@@ -0,0 +1,258 @@
+"""Precomputed index of geographical reference data (regions and population).
+
+Steps that add regions or population to their data read and parse the regions and population datasets every time
+(and often several times in the same step). Instead, a compact index of those datasets is built once and cached in
+.cache/geo, from where every step process loads it in milliseconds:
+
+* Regions index: names and codes of all regions, aliases of each region (mapped to its canonical name), and
+  subregions (members, successors and related regions) of each region, as arrays of positions.
+* Population: columns country, year and population of the population table, stored as an uncompressed feather file,
+  which is read memory-mapped.
+
+A cached index is identified by the path of the dataset and table it was built from, and by the modification times and
+sizes of their files, so it is rebuilt automatically whenever the dataset changes (e.g. after the regions step is run
+with a new regions.yml). Only older indexes of the same dataset and table are then removed.
+
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+import numpy as np
+import pandas as pd
+from owid.catalog import Dataset, Table
+from owid.catalog import processing_log as pl
+from structlog import get_logger
+
+from etl import paths
+from etl.files import checksum_str
+
+# Initialize logger.
+log = get_logger()
+
+# Directory of cached indexes.
+GEO_INDEX_DIR = paths.CACHE_DIR / "geo"
+
+# Version of the format of cached indexes, bump it when it changes.
+GEO_INDEX_VERSION = 1
+
+T = TypeVar("T")
+
+# Types of subregions listed in the regions dataset.
+SUBREGION_TYPES = ["members", "successors", "related"]
+
+# Regions indexes already loaded in this process.
+_REGIONS_INDEXES: Dict[str, "RegionsIndex"] = {}
+
+
+class RegionsIndex:
+    """Names, aliases and subregions of all regions in the regions dataset."""
+
+    def __init__(
+        self,
+        codes: List[str],
+        names: List[str],
+        aliases: Dict[str, str],
+        subregions: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        unknown_codes: Optional[List[str]] = None,
+    ) -> None:
+        # Codes and names of regions (in the order of the regions table).
+        self.codes = codes
+        self.names = names
+        # Lower-case names, aliases and codes of regions, mapped to their canonical names.
+        self.aliases = aliases
+        # Subregions of each type, where subregions of the i-th region are positions
+        # indices[indptr[i]:indptr[i + 1]] (in the same order as in the regions dataset).
+        self._subregions = subregions
+        # Codes of subregions that are not in the regions table (positions after the last region).
+        self.unknown_codes = unknown_codes or []
+
+    @classmethod
+    def from_dataset(cls, ds_regions: Dataset) -> "RegionsIndex":
+        tb_regions = ds_regions["regions"]
+        codes = tb_regions.index.tolist()
+        names = tb_regions["name"].tolist()
+        position = {code: i for i, code in enumerate(codes)}
+
+        subregions = {}
+        # Codes that are not regions themselves are kept as they are (as map_series does), after all known regions.
+        unknown_codes: List[str] = []
+        for subregion_type in SUBREGION_TYPES:
+            if subregion_type not in tb_regions.columns:
+                continue
+            lists = [json.loads(value) if pd.notnull(value) else [] for value in tb_regions[subregion_type]]
+            indptr = np.cumsum([0] + [len(subregion_codes) for subregion_codes in lists], dtype=np.int64)
+            indices = []
+            for code in (code for subregion_codes in lists for code in subregion_codes):
+                if code not in position:
+                    log.warning(f"Unknown code {code} in {subregion_type} of regions dataset.")
+                    position[code] = len(codes) + len(unknown_codes)
+                    unknown_codes.append(code)
+                indices.append(position[code])
+            subregions[subregion_type] = (indptr, np.array(indices, dtype=np.int32))
+
+        # Names, aliases and codes are all valid aliases of a region. In case of conflicts, the last region wins.
+        aliases = {}
+        for code, name, region_aliases in zip(codes, names, tb_regions.get("aliases", [None] * len(codes))):
+            aliases[name.lower()] = name
+            for alias in json.loads(region_aliases) if pd.notnull(region_aliases) else []:
+                aliases[alias.lower()] = name
+            aliases[code.lower()] = name
+
+        return cls(codes=codes, names=names, aliases=aliases, subregions=subregions, unknown_codes=unknown_codes)
+
+    def save(self, path: Path) -> None:
+        path.mkdir(parents=True)
+        with open(path / "regions.json", "w") as f:
+            json.dump(
+                {
+                    "codes": self.codes,
+                    "names": self.names,
+                    "aliases": self.aliases,
+                    "unknown_codes": self.unknown_codes,
+                },
+                f,
+            )
+        for subregion_type, (indptr, indices) in self._subregions.items():
+            np.save(path / f"{subregion_type}_indptr.npy", indptr)
+            np.save(path / f"{subregion_type}_indices.npy", indices)
+
+    @classmethod
+    def load(cls, path: Path) -> "RegionsIndex":
+        with open(path / "regions.json") as f:
+            d = json.load(f)
+        subregions = {}
+        for subregion_type in SUBREGION_TYPES:
+            if (path / f"{subregion_type}_indptr.npy").exists():
+                subregions[subregion_type] = (
+                    np.load(path / f"{subregion_type}_indptr.npy", mmap_mode="r"),
+                    np.load(path / f"{subregion_type}_indices.npy", mmap_mode="r"),
+                )
+        return cls(
+            codes=d["codes"],
+            names=d["names"],
+            aliases=d["aliases"],
+            subregions=subregions,
+            unknown_codes=d["unknown_codes"],
+        )
+
+    def subregions(self, subregion_type: str = "members") -> Dict[str, List[str]]:
+        """Names of subregions of each region that has any, sorted by region name. This is the same as
+        `create_table_of_regions_and_subregions(ds_regions, subregion_type)[subregion_type].to_dict()`.
+        """
+        indptr, indices = self._subregions[subregion_type]
+        names = np.array(self.names + self.unknown_codes, dtype=object)
+        subregions: Dict[str, List[str]] = {}
+        for i, name in enumerate(self.names):
+            if indptr[i + 1] > indptr[i]:
+                # Regions with the same name are merged.
+                subregions.setdefault(name, []).extend(names[indices[indptr[i] : indptr[i + 1]]].tolist())
+        return dict(sorted(subregions.items()))
+
+    @property
+    def valid_names(self) -> Set[str]:
+        return set(self.names)
+
+    def canonical_name(self, alias: str) -> Optional[str]:
+        """Canonical name of a region given its name, code or any of its aliases (case insensitive)."""
+        return self.aliases.get(alias.lower())
+
+
+def _dataset_files(ds: Dataset, table_name: str) -> List[Path]:
+    """Files of a table in a dataset (including the dataset index), whose changes invalidate cached indexes."""
+    ds_path = Path(ds.path)
+    files = [ds_path / "index.json"] + sorted(ds_path.glob(f"{table_name}.*"))
+    if (ds_path / table_name).is_dir():
+        # partitioned tables
+        files += sorted(f for f in (ds_path / table_name).rglob("*") if f.is_file())
+    return files
+
+
+def _cache_key(kind: str, ds: Dataset, table_name: str) -> str:
+    """Key of a cached index, its prefix (everything before the last dash) identifies the dataset and table, so that
+    indexes of different datasets and tables don't replace each other."""
+    stats = []
+    for f in _dataset_files(ds, table_name):
+        st = os.stat(f)
+        stats.append((str(f), st.st_mtime_ns, st.st_size))
+    table_hash = checksum_str(f"{Path(ds.path).resolve()}#{table_name}")[:8]
+    return f"{kind}-{table_hash}-{checksum_str(repr((GEO_INDEX_VERSION, stats)))[:16]}"
+
+
+def _is_cacheable(ds: Any) -> bool:
+    # Datasets created in memory (e.g. in tests) have no files to identify the index with.
+    return isinstance(ds, Dataset) and (Path(ds.path) / "index.json").exists()
+
+
+def _save_atomically(path: Path, save: Callable[[Path], None]) -> None:
+    """Save an index with given function into a temporary directory and move it to path, so that other processes
+    never see a partially written index. Older indexes of the same dataset and table are removed."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    save(tmp_path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another process has just saved the same index.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+
+    prefix = path.name.rsplit("-", 1)[0]
+    for old_path in path.parent.glob(f"{prefix}-*"):
+        if old_path != path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _load_or_build(path: Path, save: Callable[[Path], None], load: Callable[[Path], T]) -> T:
+    """Load an index from path, building it first if it doesn't exist."""
+    if not path.exists():
+        _save_atomically(path, save)
+    try:
+        return load(path)
+    except FileNotFoundError:
+        # Another process removed the index in the meantime (after building a newer one), build it again.
+        _save_atomically(path, save)
+        return load(path)
+
+
+def load_regions_index(ds_regions: Dataset) -> RegionsIndex:
+    """Load the index of the regions dataset, building it if it doesn't exist or the dataset has changed."""
+    if not _is_cacheable(ds_regions):
+        return RegionsIndex.from_dataset(ds_regions)
+
+    key = _cache_key("regions", ds_regions, "regions")
+    if key not in _REGIONS_INDEXES:
+        _REGIONS_INDEXES[key] = _load_or_build(
+            GEO_INDEX_DIR / key, lambda p: RegionsIndex.from_dataset(ds_regions).save(p), RegionsIndex.load
+        )
+
+    return _REGIONS_INDEXES[key]
+
+
+def load_population(ds_population: Dataset, table_name: str = "population") -> Table:
+    """Load population (with country and year as index) of the population dataset, building its index if it doesn't
+    exist or the dataset has changed. The result is identical to `ds_population[table_name][["population"]]`.
+    """
+    if not _is_cacheable(ds_population) or pl.enabled():
+        # NOTE: Loading from the dataset keeps the processing log of the original table.
+        return ds_population[table_name][["population"]]
+
+    file_name = f"{table_name}.feather"
+
+    def save(tmp_path: Path) -> None:
+        tb_population = ds_population.read(table_name, columns=["population"])
+        tmp_path.mkdir(parents=True)
+        # Uncompressed, so that it can be memory-mapped.
+        tb_population.to_feather(tmp_path / file_name, repack=False, compression="uncompressed")
+
+    tb_population = _load_or_build(
+        GEO_INDEX_DIR / _cache_key("population", ds_population, table_name),
+        save,
+        lambda p: Table.read_feather(p / file_name, memory_map=True),
+    )
+    # Dataset metadata might have been updated, refresh it (as Dataset.read does).
+    tb_population.metadata.dataset = ds_population.metadata
+
+    return tb_population
@@ -2,7 +2,8 @@ import difflib
 import os
 import re
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, List, Optional, cast
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, cast
+from urllib.parse import unquote
 
 import numpy as np
 import pandas as pd
@@ -10,7 +11,7 @@ import requests
 import rich
 import rich_click as click
 import structlog
-from owid.catalog import Dataset, DatasetMeta, LocalCatalog, RemoteCatalog, Table, find
+from owid.catalog import Dataset, DatasetMeta, LocalCatalog, RemoteCatalog, Table, checksums, find
 from owid.catalog.catalogs import CHANNEL, OWID_CATALOG_URI
 from rich.console import Console
 from rich.panel import Panel
@@ -109,8 +110,14 @@ tb = {_snippet_dataset(ds_b, table_name)}
             for col in ds_b[table_name].columns:
                 self.p(f"\t\t[green]+ Column [b]{col}[/b]")
         else:
-            table_a = ds_a[table_name]
-            table_b = ds_b[table_name]
+            changed_partitions = _changed_partitions(ds_a, ds_b, table_name)
+            if changed_partitions is None:
+                table_a = ds_a[table_name]
+                table_b = ds_b[table_name]
+            else:
+                # unchanged partitions have identical files, only compare the rest
+                table_a = ds_a.read(table_name, partitions=changed_partitions[0])
+                table_b = ds_b.read(table_name, partitions=changed_partitions[1])
 
             # set default index for datasets that don't have one
             if table_a.index.names == [None] and table_b.index.names == [None]:
@@ -378,6 +385,32 @@ def _index_equals(table_a: pd.DataFrame, table_b: pd.DataFrame, sample: int = 10
     return index_a.equals(index_b)
 
 
+def _changed_partitions(ds_a: Dataset, ds_b: Dataset, table_name: str) -> Optional[Tuple[List[str], List[str]]]:
+    """Return partitions of a table that are different (or missing in the other dataset) in
+    `ds_a` and `ds_b`. Return None if the table isn't partitioned the same way in both."""
+    if not isinstance(ds_a, Dataset) or not isinstance(ds_b, Dataset):
+        return None
+
+    partitions = []
+    for ds in (ds_a, ds_b):
+        path = Path(ds.path) / f"{table_name}.parquet_partitioned"
+        if not path.is_dir():
+            return None
+        # partition directory name (e.g. `country=France`) -> checksum of its files
+        partitions.append({p.name: checksums.checksum_path(p) for p in path.iterdir() if p.is_dir()})
+
+    part_a, part_b = partitions
+    # partitioned by different columns
+    if {name.split("=", 1)[0] for name in part_a} != {name.split("=", 1)[0] for name in part_b}:
+        return None
+
+    changed = {name for name in set(part_a) | set(part_b) if part_a.get(name) != part_b.get(name)}
+    return (
+        [unquote(name.split("=", 1)[1]) for name in sorted(changed & set(part_a))],
+        [unquote(name.split("=", 1)[1]) for name in sorted(changed & set(part_b))],
+    )
+
+
 def _dict_diff(dict_a: Dict[str, Any], dict_b: Dict[str, Any], tabs: int = 0, **kwargs) -> str:
     """Convert dictionaries into YAML and compare them using difflib. Return colored diff as a string."""
     meta_a = yaml_dump(dict_a, **kwargs)
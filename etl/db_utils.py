@@ -113,6 +113,43 @@ class DBUtils:
             self.entity_id_by_normalised_name[normalize_entity_name(name)] = entity_id
             return cast(int, entity_id)
 
+    def get_or_create_entities(self, names: Iterable[str]) -> Dict[str, int]:
+        """Same as `get_or_create_entity`, but for many entities at once with a constant number of queries."""
+        names = list(dict.fromkeys(names))
+        uncached = [name for name in names if self.__get_cached_entity_id(name) is None]
+        if uncached:
+            self.prefill_entity_cache(uncached)
+
+        # new entities, only one per normalised name
+        new_names = {}
+        for name in names:
+            if self.__get_cached_entity_id(name) is None:
+                new_names.setdefault(normalize_entity_name(name), name)
+
+        if new_names:
+            self.upsert_many(
+                """
+                INSERT INTO entities
+                    (name, displayName, validated, createdAt, updatedAt)
+                VALUES
+                    (%s, '', FALSE, NOW(), NOW())
+            """,
+                [(name,) for name in new_names.values()],
+            )
+            rows = self.fetch_many(
+                """
+                SELECT name, id FROM entities
+                WHERE name IN %(names)s
+            """,
+                {"names": list(new_names.values())},
+            )
+            # Cache the newly created entities
+            self.entity_id_by_normalised_name.update(
+                {normalize_entity_name(name): entity_id for name, entity_id in rows}
+            )
+
+        return {name: cast(int, self.__get_cached_entity_id(name)) for name in names}
+
     def prefill_entity_cache(self, names: List[str]) -> None:
         rows = self.fetch_many(
             """
@@ -2,22 +2,31 @@
 #  files.py
 #
 
+import ctypes
+import ctypes.util
+import errno
 import hashlib
 import io
 import os
+import pickle
 import re
+import select
+import struct
 import subprocess
+import sys
 import time
 from collections import OrderedDict
 from pathlib import Path
 from threading import Lock
-from typing import Any, Dict, Generator, List, Optional, Set, TextIO, Union
+from typing import Any, Dict, Generator, Iterable, List, Optional, Set, TextIO, Tuple, Union
 
 import ruamel.yaml
 import yaml
+from owid.catalog import checksums
 from yaml.dumper import Dumper
 
-from etl.paths import BASE_DIR
+from etl import config
+from etl.paths import BASE_DIR, CACHE_DIR
 
 
 class RuntimeCache:
@@ -48,8 +57,58 @@ class RuntimeCache:
         self._locks = {}
 
 
+class MtimeCache:
+    """
+    Value pickled to .cache/ together with mtimes and sizes of files it was computed from.
+    It's only returned if none of these files has changed since, which makes it suitable
+    for results that are expensive to compute from files (e.g. parsing the DAG).
+    """
+
+    def __init__(self, name: str, key: Any, cache_dir: Optional[Path] = None) -> None:
+        self.path = (cache_dir or CACHE_DIR) / f"{name}-{checksum_str(repr(key))[:16]}.pickle"
+
+    @staticmethod
+    def _stats(files: Iterable[Union[str, Path]]) -> Dict[str, Tuple[int, int]]:
+        stats = {}
+        for f in files:
+            st = os.stat(f)
+            stats[str(f)] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def get(self) -> Optional[Any]:
+        """Return cached value or None if it doesn't exist or any of its files has changed."""
+        try:
+            with open(self.path, "rb") as f:
+                stats, value = pickle.load(f)
+            if self._stats(stats.keys()) != stats:
+                return None
+        except Exception:
+            # missing file, deleted dependency or incompatible pickle
+            return None
+        return value
+
+    def set(self, value: Any, files: Iterable[Union[str, Path]]) -> None:
+        """Cache value computed from given files."""
+        stats = self._stats(files)
+
+        # don't cache values computed from files that were just modified, they could be
+        # modified again without changing mtime (see `checksums.RACY_MTIME_SECONDS`)
+        if any(time.time() - mtime_ns / 1e9 < checksums.RACY_MTIME_SECONDS for mtime_ns, _ in stats.values()):
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        with open(tmp, "wb") as f:
+            pickle.dump((stats, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
 CACHE_CHECKSUM_FILE = RuntimeCache()
 
+# persist checksums of files between runs, this makes detection of dirty steps fast
+if config.CHECKSUM_CACHE:
+    checksums.enable_checksum_cache(CACHE_DIR / "checksums.sqlite")
+
 
 def checksum_file_nocache(filename: Union[str, Path]) -> str:
     "Return the md5 hex digest of the file without using cache."
@@ -72,7 +131,7 @@ def checksum_file(filename: Union[str, Path]) -> str:
     mtime = os.path.getmtime(filename)
     key = f"{filename}-{mtime}"
 
-    if filename not in CACHE_CHECKSUM_FILE:
+    if key not in CACHE_CHECKSUM_FILE:
         # Special case for regions.yml, we want to ignore the 'aliases' key
         if os.path.basename(filename) == "regions.yml":
             with open(filename, "r") as f:
@@ -84,12 +143,20 @@ def checksum_file(filename: Union[str, Path]) -> str:
 
             checksum = checksum_str(s.strip())
         else:
-            checksum = checksum_file_nocache(filename)
+            # use persistent cache shared across runs if enabled
+            checksum = checksums.checksum_file(filename)
         CACHE_CHECKSUM_FILE.add(key, checksum)
 
     return CACHE_CHECKSUM_FILE[key]
 
 
+def checksum_file_dos2unix(filename: Union[str, Path]) -> str:
+    """Return the md5 hex digest of the file with CRLF line endings converted to LF. This is
+    how DVC 2 computes md5 of text files in .dvc files."""
+    # use persistent cache shared across runs if enabled
+    return checksums.checksum_file_dos2unix(filename)
+
+
 def checksum_str(s: str) -> str:
     "Return the md5 hex digest of the string."
     return hashlib.md5(s.encode()).hexdigest()
@@ -218,8 +285,28 @@ def _mtime_mapping(path: Path) -> Dict[Path, float]:
     return {f: f.stat().st_mtime for f in path.rglob("*") if f.is_file() and "__pycache__" not in f.parts}
 
 
-def watch_folder(path: Path) -> Generator[Path, None, None]:
-    """Watch folder and yield on any changes."""
+def watch_folder(path: Path, debounce: float = 0.2) -> Generator[Set[Path], None, None]:
+    """Watch folder and yield set of changed (created, modified or deleted) files on any changes.
+    Uses inotify on Linux and falls back to polling elsewhere."""
+    try:
+        watcher = _Inotify(path)
+    except OSError:
+        yield from _watch_folder_polling(path)
+    else:
+        with watcher:
+            while True:
+                changed = watcher.read(timeout=None)
+                # editors often write files in several steps, wait for all of them
+                while True:
+                    more = watcher.read(timeout=debounce)
+                    if not more:
+                        break
+                    changed |= more
+                if changed:
+                    yield changed
+
+
+def _watch_folder_polling(path: Path) -> Generator[Set[Path], None, None]:
     last_seen = _mtime_mapping(path)
 
     while True:
@@ -227,16 +314,102 @@ def watch_folder(path: Path) -> Generator[Path, None, None]:
 
         current_files = _mtime_mapping(path)
 
-        # Check for modifications
-        for f, mtime in current_files.items():
-            # new file
-            if f not in last_seen:
-                yield f
-                break
-            # updated file
-            else:
-                if last_seen[f] != mtime:
-                    yield f
-                    break
+        # new, modified and deleted files
+        changed = {f for f, mtime in current_files.items() if last_seen.get(f) != mtime}
+        changed |= last_seen.keys() - current_files.keys()
 
         last_seen = current_files
+
+        if changed:
+            yield changed
+
+
+class _Inotify:
+    """Minimal recursive folder watcher using Linux inotify through ctypes."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+    IGNORE_DIRS = {"__pycache__", ".ipynb_checkpoints"}
+
+    def __init__(self, path: Path) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+
+        self._fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._dirs: Dict[int, Path] = {}
+        self._add_watches(path)
+
+    def __enter__(self) -> "_Inotify":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        os.close(self._fd)
+
+    def _add_watches(self, path: Path) -> None:
+        for dirpath, dirnames, _ in os.walk(path):
+            dirnames[:] = [d for d in dirnames if d not in self.IGNORE_DIRS]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                # folder was removed before we could watch it (e.g. editor's temporary folder)
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, f"inotify_add_watch failed for {dirpath}")
+            self._dirs[wd] = Path(dirpath)
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        """Wait for events and return changed files. Return empty set after timeout."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        buf = os.read(self._fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, name_len = struct.unpack_from("iIII", buf, offset)
+            name = buf[offset + 16 : offset + 16 + name_len].rstrip(b"\0").decode()
+            offset += 16 + name_len
+
+            # watched folder was removed, these events have no name
+            if mask & (self.IN_DELETE_SELF | self.IN_IGNORED):
+                self._dirs.pop(wd, None)
+                continue
+
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+
+            f = directory / name
+            if mask & self.IN_ISDIR:
+                # watch newly created folders too
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and name not in self.IGNORE_DIRS:
+                    self._add_watches(f)
+                    try:
+                        changed.update(p for p in f.rglob("*") if p.is_file())
+                    except FileNotFoundError:
+                        pass
+                continue
+
+            if not self.IGNORE_DIRS & set(f.parts):
+                changed.add(f)
+
+        return changed
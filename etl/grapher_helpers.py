@@ -1,9 +1,11 @@
 import copy
+import functools
+import threading
 import warnings
 from copy import deepcopy
 from dataclasses import dataclass, field, is_dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Literal, Optional, Set, cast
+from typing import Any, Dict, Iterable, List, Literal, Optional, Set, Tuple, cast
 
 import jinja2
 import numpy as np
@@ -82,9 +84,6 @@ def _yield_wide_table(
     :param dim_titles: Custom names to use for the dimensions, if not provided, the default names will be used.
         Dimension title will be used to create variable name, e.g. `Deaths - Age: 10-18` instead of `Deaths - age: 10-18`
     """
-    table = copy.deepcopy(table)
-    table.metadata = copy.deepcopy(table.metadata)
-
     # Validation
     if "year" not in table.primary_key:
         raise Exception("Table is missing `year` primary key")
@@ -106,75 +105,90 @@ def _yield_wide_table(
     else:
         dim_titles = dim_names
 
+    # NOTE: the table is not copied, every variable is sliced from it only when it's yielded
+    entity_ids = table.index.get_level_values("entity_id")
+    years = table.index.get_level_values("year")
+
     if dim_names:
-        grouped = table.groupby(dim_names if len(dim_names) > 1 else dim_names[0], as_index=False, observed=True)
+        # positions of rows of every combination of dimensions (in the order of groupby)
+        groups = (
+            pd.DataFrame(index=table.index)
+            .groupby(level=dim_names if len(dim_names) > 1 else dim_names[0], observed=True)
+            .indices.items()
+        )
     else:
         # a situation when there's only year and entity_id in index with no additional dimensions
-        grouped = [([], table)]
+        groups = [([], None)]
 
-    for dim_values, table_to_yield in grouped:
+    for dim_values, positions in groups:
         dim_values = [dim_values] if isinstance(dim_values, str) else dim_values
+        dim_dict = dict(zip(dim_names, dim_values))
 
         # Now iterate over every column in the original dataset and export the
         # subset of data that we prepared above
-        for column in table_to_yield.columns:
+        for column in table.columns:
+            # Select only rows of the dimensions (without copying if there are no dimensions)
+            values = table[column].array
+            if positions is not None:
+                values = values.take(positions)
+
             # If all values are null, skip variable
-            if table_to_yield[column].isnull().all():
+            notnull = ~pd.isnull(values)
+            if not notnull.any():
                 if warn_null_variables:
                     log.warning("yield_wide_table.null_variable", column=column, dims=dim_values)
                 continue
 
             # Safety check to see if the metadata is still intact
-            assert (
-                table_to_yield[column].metadata.unit is not None
-            ), f"Unit for column {column} should not be None here!"
-
-            # Select only one column and dimensions for performance
-            tab = table_to_yield[[column]].copy()
+            assert table[column].metadata.unit is not None, f"Unit for column {column} should not be None here!"
 
             # Drop NA values
-            tab = tab.dropna() if na_action == "drop" else tab
+            rows = positions
+            if na_action == "drop" and not notnull.all():
+                values = values[notnull]
+                rows = np.flatnonzero(notnull) if positions is None else positions[notnull]
 
             # Create underscored name of a new column from the combination of column and dimensions
             short_name = _underscore_column_and_dimensions(column, dim_values, dim_names)
 
-            # set new metadata with dimensions
-            tab.metadata.short_name = short_name
-            tab = tab.rename(columns={column: short_name})
+            # Expand Jinja in a copy of metadata
+            meta = _expand_jinja(table[column].metadata, dim_dict)
 
-            # add info about dimensions to metadata
+            # Add info about dimensions to metadata
             if dim_values:
-                tab[short_name].metadata.additional_info = {
-                    "dimensions": {
-                        "originalShortName": column,
-                        "originalName": tab[short_name].metadata.title,
-                        "filters": [
-                            {"name": dim_name, "value": sanitize_numpy(dim_value)}
-                            for dim_name, dim_value in zip(dim_names, dim_values)
-                        ],
-                    }
-                }
-
-            dim_dict = dict(zip(dim_names, dim_values))
+                meta.additional_info = _expand_jinja(
+                    {
+                        "dimensions": {
+                            "originalShortName": column,
+                            "originalName": meta.title,
+                            "filters": [
+                                {"name": dim_name, "value": sanitize_numpy(dim_value)}
+                                for dim_name, dim_value in zip(dim_names, dim_values)
+                            ],
+                        }
+                    },
+                    dim_dict,
+                )
 
             # Add dimensions to title (which will be used as variable name in grapher)
-            if tab[short_name].metadata.title:
-                # We use template as a title
-                if _uses_jinja(tab[short_name].metadata.title):
-                    title_with_dims = _expand_jinja_text(tab[short_name].metadata.title, dim_dict)
-                # Otherwise use default
-                else:
-                    title_with_dims = _title_column_and_dimensions(
-                        tab[short_name].metadata.title, dim_values, dim_titles
-                    )
+            if meta.title and not _uses_jinja(table[column].metadata.title):
+                meta.title = _expand_jinja_text(
+                    _title_column_and_dimensions(meta.title, dim_values, dim_titles), dim_dict
+                )
 
-                tab[short_name].metadata.title = title_with_dims
+            # Keep only entity_id and year in index
+            index = pd.MultiIndex.from_arrays(
+                [entity_ids, years] if rows is None else [entity_ids.take(rows), years.take(rows)],
+                names=["entity_id", "year"],
+            )
+            tab = catalog.Table(pd.DataFrame({short_name: values}, index=index, copy=False))
 
-            # traverse metadata and expand Jinja
-            tab[short_name].metadata = _expand_jinja(tab[short_name].metadata, dim_dict)
+            # set new metadata with dimensions
+            tab.metadata = copy.copy(table.metadata)
+            tab.metadata.short_name = short_name
+            tab[short_name].metadata = meta
 
-            # Keep only entity_id and year in index
-            yield tab.reset_index().set_index(["entity_id", "year"])[[short_name]]
+            yield tab
 
 
 def _uses_jinja(text: Optional[str]):
@@ -187,20 +201,32 @@ def _expand_jinja_text(text: str, dim_dict: Dict[str, str]) -> str:
     if not _uses_jinja(text):
         return text
 
+    return _render_jinja_text(text, tuple(dim_dict.items()))
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_jinja_text(text: str, dim_items: Tuple[Tuple[str, Any], ...]) -> str:
+    # The same templates are often used by many variables and dimensions, render each combination only once.
     try:
-        return jinja_env.from_string(text).render(dim_dict)
+        return _compile_jinja_text(text).render(dict(dim_items))
     except jinja2.exceptions.TemplateSyntaxError as e:
-        new_message = f"{e.message}\n\nDimensions:\n{dim_dict}\n\nTemplate:\n{text}\n"
+        new_message = f"{e.message}\n\nDimensions:\n{dict(dim_items)}\n\nTemplate:\n{text}\n"
         raise e.__class__(new_message, e.lineno, e.name, e.filename) from e
 
 
+@functools.lru_cache(maxsize=1024)
+def _compile_jinja_text(text: str) -> jinja2.Template:
+    return jinja_env.from_string(text)
+
+
 def _expand_jinja(obj: Any, dim_dict: Dict[str, str]) -> Any:
-    """Expand Jinja in all metadata fields."""
+    """Expand Jinja in all metadata fields. Returns a copy of the object, the original is not modified."""
     if obj is None:
         return None
     elif isinstance(obj, str):
         return _expand_jinja_text(obj, dim_dict)
     elif is_dataclass(obj):
+        obj = copy.copy(obj)
         for k, v in obj.__dict__.items():
             setattr(obj, k, _expand_jinja(v, dim_dict))
         return obj
@@ -295,7 +321,64 @@ def _get_and_create_entities_in_db(countries: Set[str]) -> Dict[str, int]:
     cursor = get_connection().cursor()
     db = DBUtils(cursor)
     log.info("Creating entities in DB", countries=countries)
-    return {name: db.get_or_create_entity(name) for name in countries}
+    return db.get_or_create_entities(countries)
+
+
+def _get_entities_by_ids(entity_ids: Set[int]) -> pd.DataFrame:
+    q = "select id as entityId, name as entityName, code as entityCode from entities where id in %(entity_ids)s"
+    return pd.read_sql(q, get_engine(), params={"entity_ids": list(entity_ids)})
+
+
+class EntityResolver:
+    """Grapher entities used by a dataset. Entities are looked up in the database in bulk (all names or codes
+    of a table with a single query, missing entities are created in a single batch) and cached, so that the
+    resolver can be shared by all threads upserting indicators of the dataset.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # entity name or code -> entity ID
+        self._ids: Dict[str, Dict[str, int]] = {"name": {}, "code": {}}
+        # ID, name and code of entities for `add_entity_code_and_name`
+        self._entities = pd.DataFrame({"entityId": [], "entityName": [], "entityCode": []}).astype({"entityId": int})
+
+    def resolve(
+        self, values: Iterable[str], by: Literal["name", "code"] = "name", create_entities: bool = False
+    ) -> Dict[str, int]:
+        """Return entity IDs of given names or codes, entities that couldn't be found are missing."""
+        values = set(values)
+        with self._lock:
+            ids = self._ids[by]
+            missing = values - ids.keys()
+            if missing:
+                ids.update(_get_entities_from_db(missing, by=by))
+                missing -= ids.keys()
+
+            if missing and create_entities:
+                assert by == "name", "create_entities works only with `by='name'`"
+                ids.update(_get_and_create_entities_in_db(missing))
+
+            return {value: ids[value] for value in values if value in ids}
+
+    def entity_ids(
+        self, country: pd.Series, by: Literal["name", "code"] = "name", create_entities: bool = False
+    ) -> pd.Series:
+        """Map country names or codes to entity IDs (as floats, NaN for entities that couldn't be found)."""
+        # every unique value is looked up once and mapped back with an array of IDs indexed by its code
+        codes, uniques = pd.factorize(country)
+        ids = self.resolve(uniques, by=by, create_entities=create_entities)
+        # the last element is for missing values with code -1
+        lookup = np.array([ids.get(value, np.nan) for value in uniques] + [np.nan], dtype=float)
+        return pd.Series(lookup[codes], index=country.index, name=country.name)
+
+    def entities(self, entity_ids: Iterable[int]) -> pd.DataFrame:
+        """Return ID, name and code (columns entityId, entityName and entityCode) of given entities."""
+        entity_ids = {int(e) for e in entity_ids}
+        with self._lock:
+            missing = entity_ids - set(self._entities["entityId"])
+            if missing:
+                self._entities = pd.concat([self._entities, _get_entities_by_ids(missing)], ignore_index=True)
+            return self._entities[self._entities["entityId"].isin(entity_ids)].reset_index(drop=True)
 
 
 def country_to_entity_id(
@@ -303,6 +386,7 @@ def country_to_entity_id(
     create_entities: bool = False,
     errors: Literal["raise", "ignore", "warn"] = "raise",
     by: Literal["name", "code"] = "name",
+    entity_resolver: Optional[EntityResolver] = None,
 ) -> pd.Series:
     """Convert country name to grapher entity_id. Most of countries should be in countries_regions.csv,
     however some regions could be only in `entities` table in MySQL or doesn't exist at all.
@@ -313,17 +397,11 @@ def country_to_entity_id(
     :param create_entities: if True, create missing countries in `entities` table
     :param errors: how to handle missing countries
     :param by: use `name` if you use country names, `code` if you use ISO codes
+    :param entity_resolver: resolver with entities cached from previous calls (e.g. other tables of the dataset)
     """
-    # fill entities from DB
-    db_entities = _get_entities_from_db(set(country), by=by)
-    entity_id = country.map(db_entities).astype(float)
-
-    # create entities in DB
-    if entity_id.isnull().any() and create_entities:
-        assert by == "name", "create_entities works only with `by='name'`"
-        ix = entity_id.isnull()
-        # cast to float to fix issues with categories
-        entity_id[ix] = country[ix].map(_get_and_create_entities_in_db(set(country[ix]))).astype(float)
+    # fill entities from DB and create missing ones
+    entity_resolver = entity_resolver or EntityResolver()
+    entity_id = entity_resolver.entity_ids(country, by=by, create_entities=create_entities)
 
     if entity_id.isnull().any():
         msg = f"Some countries have not been mapped: {set(country[entity_id.isnull()])}"
@@ -444,7 +522,10 @@ def _adapt_dataset_metadata_for_grapher(
 
 
 def _adapt_table_for_grapher(
-    table: catalog.Table, country_col: str = "country", year_col: str = "year"
+    table: catalog.Table,
+    country_col: str = "country",
+    year_col: str = "year",
+    entity_resolver: Optional[EntityResolver] = None,
 ) -> catalog.Table:
     """Adapt table (from a garden dataset) to be used in a grapher step. This function
     is not meant to be run explicitly, but by default in the grapher step.
@@ -457,6 +538,8 @@ def _adapt_table_for_grapher(
         Name of country column in table.
     year_col : str
         Name of year column in table.
+    entity_resolver : EntityResolver, optional
+        Resolver of entity IDs shared by all tables of the dataset.
 
     Returns
     -------
@@ -483,7 +566,7 @@ def _adapt_table_for_grapher(
     assert "entity_id" not in table.columns, "Table must not have column entity_id."
 
     # Grapher needs a column entity id, that is constructed based on the unique entity names in the database.
-    table["entity_id"] = country_to_entity_id(table[country_col], create_entities=True)
+    table["entity_id"] = country_to_entity_id(table[country_col], create_entities=True, entity_resolver=entity_resolver)
     table = table.drop(columns=[country_col]).rename(columns={year_col: "year"})
 
     table = table.set_index(["entity_id", "year"] + dim_names)
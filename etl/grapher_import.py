@@ -10,27 +10,35 @@ Usage:
 """
 
 import datetime
+import hashlib
+import json
 import os
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from threading import Lock
-from typing import Dict, List, Optional, cast
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, cast
+from weakref import WeakSet
 
 import pandas as pd
 import structlog
 from owid import catalog
 from owid.catalog import utils
+from sqlalchemy import Column, Integer, MetaData, String, Table, column
+from sqlalchemy import select as sa_select
+from sqlalchemy import table as sa_table
 from sqlalchemy.engine.base import Engine
+from sqlalchemy.schema import CreateTable
 from sqlmodel import Session, select, update
 
 from apps.backport.datasync.data_metadata import (
     add_entity_code_and_name,
     variable_data,
     variable_metadata,
+    variables_metadata_loader,
 )
-from apps.backport.datasync.datasync import upload_gzip_dict
-from etl import config
+from apps.backport.datasync.datasync import get_uploader
+from etl import config, tracing
 from etl.db import open_db
+from etl.files import checksum_str
 
 from . import grapher_helpers as gh
 from . import grapher_model as gm
@@ -44,6 +52,10 @@ origins_table_lock = Lock()
 
 CURRENT_DIR = os.path.dirname(__file__)
 
+# Version of checksums of variables, bump it to re-upload all variables (e.g. when the format of data or metadata
+# uploaded to R2 changes).
+VARIABLE_CHECKSUM_VERSION = 1
+
 
 @dataclass
 class DatasetUpsertResult:
@@ -57,6 +69,7 @@ class VariableUpsertResult:
     source_id: int
 
 
+@tracing.traced("upsert_dataset", cat="grapher")
 def upsert_dataset(
     engine: Engine, dataset: catalog.Dataset, namespace: str, sources: List[catalog.meta.Source]
 ) -> DatasetUpsertResult:
@@ -189,19 +202,9 @@ def _update_variables_metadata(table: catalog.Table) -> None:
             meta.description_key = [k for k in meta.description_key if k.strip()]
 
 
-def upsert_table(
-    engine: Engine,
-    table: catalog.Table,
-    dataset_upsert_result: DatasetUpsertResult,
-    catalog_path: Optional[str] = None,
-    dimensions: Optional[gm.Dimensions] = None,
-    verbose: bool = True,
-) -> VariableUpsertResult:
-    """This function is used to put one ready to go formatted Table (i.e.
-    in the format (year, entityId, value)) into mysql. The metadata
-    of the variable is used to fill the required fields.
-    """
-
+def _validate_table(table: catalog.Table) -> catalog.Table:
+    """Check that table is in the format (year, entity_id, value) expected by grapher and return it with levels in
+    that order."""
     assert set(table.index.names) == {"year", "entity_id"}, (
         "Tables to be upserted must have only 2 indices: year and entity_id. Instead" f" they have: {table.index.names}"
     )
@@ -234,6 +237,191 @@ def upsert_table(
 
     assert not gh.contains_inf(table.iloc[:, 0]), f"Column `{table.columns[0]}` has inf values"
 
+    return table
+
+
+def _timespan(table: catalog.Table, variable_meta: catalog.VariableMeta) -> str:
+    # Timespan does not work for yearIsDay variables
+    if (variable_meta.display or {}).get("yearIsDay"):
+        return ""
+    years = table.index.unique(level="year").values
+    if len(years) == 0:
+        return ""
+    return f"{min(years)}-{max(years)}"
+
+
+# Checksums of uploaded variables (used only with `config.GRAPHER_VARIABLE_CHECKSUMS`) are stored in a table owned
+# by ETL, it isn't part of grapher's schema and is created on first use. Rows of deleted variables are left behind,
+# they're never matched because checksums are looked up through `variables`.
+_variable_checksums_table = Table(
+    "etl_variable_checksums",
+    MetaData(),
+    Column("variableId", Integer, primary_key=True, autoincrement=False),
+    Column("dataChecksum", String(64), nullable=False),
+    Column("metadataChecksum", String(64), nullable=False),
+)
+_variables_table = sa_table("variables", column("id"), column("datasetId"), column("shortName"), column("sourceId"))
+
+# engines whose DB has the checksums table
+_variable_checksums_engines: "WeakSet[Any]" = WeakSet()
+_variable_checksums_lock = Lock()
+
+
+def _create_variable_checksums_table(session: Session) -> None:
+    """Create table with checksums of variables if it doesn't exist yet (once per engine)."""
+    engine = session.get_bind()
+    with _variable_checksums_lock:
+        if engine in _variable_checksums_engines:
+            return
+        # DDL commits implicitly in MySQL, run it outside of the session's transaction
+        with engine.begin() as conn:  # type: ignore
+            conn.execute(CreateTable(_variable_checksums_table, if_not_exists=True))
+        _variable_checksums_engines.add(engine)
+
+
+def _data_checksum(table: catalog.Table) -> str:
+    """Checksum of data of a validated table with a single variable and of where it's uploaded to."""
+    h = hashlib.md5(
+        repr((VARIABLE_CHECKSUM_VERSION, config.BAKED_VARIABLES_PATH, str(table.iloc[:, 0].dtype))).encode()
+    )
+    h.update(pd.util.hash_pandas_object(table, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def _metadata_checksum(
+    short_name: str,
+    variable_meta: catalog.VariableMeta,
+    dataset_meta: Optional[catalog.DatasetMeta],
+    catalog_path: Optional[str],
+    dimensions: Optional[gm.Dimensions],
+    links: Optional[Dict[str, List[Any]]],
+) -> str:
+    """Checksum of metadata of a variable, of where it's uploaded to and of its links in DB."""
+    # Metadata in R2 also contains fields of the dataset. Its source checksum changes whenever any input of the
+    # dataset changes, so it's left out.
+    dataset_dict = dataset_meta.to_dict() if dataset_meta else {}
+    dataset_dict.pop("source_checksum", None)
+    return checksum_str(
+        json.dumps(
+            {
+                "version": VARIABLE_CHECKSUM_VERSION,
+                "destination": config.BAKED_VARIABLES_PATH,
+                "short_name": short_name,
+                "variable": variable_meta.to_dict(),
+                "dataset": dataset_dict,
+                "catalog_path": catalog_path,
+                "dimensions": dimensions,
+                "links": links,
+            },
+            sort_keys=True,
+            default=str,
+        )
+    )
+
+
+def _variable_checksums(
+    table: catalog.Table,
+    catalog_path: Optional[str],
+    dimensions: Optional[gm.Dimensions],
+    links: Optional[Dict[str, List[Any]]] = None,
+) -> Tuple[str, str]:
+    """Checksums of data and metadata of a validated table with a single variable. If they're the same as the ones
+    stored in DB, the variable doesn't have to be upserted again.
+
+    Both include the destination in R2 (which depends on DATA_API_ENV), because DBs of staging servers are copies
+    of the production DB. Metadata checksum includes topic tags and FAQ gdocs as they're resolved in DB (see
+    `_resolved_links`), so that variables get linked to tags and gdocs created after their upsert. Names and codes
+    of entities in uploaded metadata are not part of checksums, renamed entities are only refreshed after the
+    data of a variable changes (or after bumping `VARIABLE_CHECKSUM_VERSION`).
+    """
+    column_name = table.columns[0]
+    return _data_checksum(table), _metadata_checksum(
+        column_name, table[column_name].metadata, table.metadata.dataset, catalog_path, dimensions, links
+    )
+
+
+def _resolved_links(session: Session, variable_metas: List[catalog.VariableMeta]) -> List[Dict[str, List[Any]]]:
+    """IDs of topic tags and FAQ gdocs of variables that exist in DB (missing ones are not linked, see
+    `Variable.update_links`)."""
+    tag_names = [meta.presentation.topic_tags if meta.presentation else [] for meta in variable_metas]
+    gdoc_ids = [[faq.gdoc_id for faq in meta.presentation.faqs] if meta.presentation else [] for meta in variable_metas]
+
+    all_tag_names = list({name for names in tag_names for name in names})
+    tag_ids = {}
+    if all_tag_names:
+        q = select(gm.Tag.id, gm.Tag.name).where(gm.Tag.name.in_(all_tag_names), gm.Tag.slug.isnot(None))  # type: ignore
+        tag_ids = {r.name: r.id for r in session.exec(q).all()}  # type: ignore
+
+    all_gdoc_ids = list({gdoc_id for ids in gdoc_ids for gdoc_id in ids})
+    existing_gdoc_ids = set()
+    if all_gdoc_ids:
+        existing_gdoc_ids = set(
+            session.exec(select(gm.PostsGdocs.id).where(gm.PostsGdocs.id.in_(all_gdoc_ids))).all()  # type: ignore
+        )
+
+    return [
+        {
+            "tag_ids": [tag_ids[name] for name in names if name in tag_ids],
+            "gdoc_ids": sorted({gdoc_id for gdoc_id in ids if gdoc_id in existing_gdoc_ids}),
+        }
+        for names, ids in zip(tag_names, gdoc_ids)
+    ]
+
+
+def _load_unchanged_variables(
+    session: Session, dataset_id: int, checksums: Dict[str, Tuple[str, str]]
+) -> Dict[str, VariableUpsertResult]:
+    """Find variables (by their short names) whose checksums are the same as those stored in DB."""
+    _create_variable_checksums_table(session)
+    v, t = _variables_table, _variable_checksums_table
+    q = (
+        sa_select(v.c.id, v.c.shortName, v.c.sourceId, t.c.dataChecksum, t.c.metadataChecksum)
+        .select_from(v.join(t, t.c.variableId == v.c.id))
+        .where(v.c.datasetId == dataset_id, v.c.shortName.in_(list(checksums)))
+    )
+    return {
+        r.shortName: VariableUpsertResult(r.id, r.sourceId)
+        for r in session.execute(q).all()
+        if (r.dataChecksum, r.metadataChecksum) == checksums[r.shortName]
+    }
+
+
+def _set_variable_checksums(session: Session, checksums: Dict[int, Tuple[Optional[str], Optional[str]]]) -> None:
+    """Store checksums of variables once their data and metadata have been uploaded. Checksums are reset to None
+    (their rows deleted) before upload, so that variables whose upload fails are upserted again next time."""
+    if not checksums:
+        return
+    _create_variable_checksums_table(session)
+    t = _variable_checksums_table
+    session.execute(t.delete().where(t.c.variableId.in_(list(checksums))))
+    rows = [
+        {"variableId": variable_id, "dataChecksum": data_checksum, "metadataChecksum": metadata_checksum}
+        for variable_id, (data_checksum, metadata_checksum) in checksums.items()
+        if data_checksum is not None and metadata_checksum is not None
+    ]
+    if rows:
+        session.execute(t.insert(), rows)
+    session.commit()
+
+
+@tracing.traced("upsert_table", cat="grapher")
+def upsert_table(
+    engine: Engine,
+    table: catalog.Table,
+    dataset_upsert_result: DatasetUpsertResult,
+    catalog_path: Optional[str] = None,
+    dimensions: Optional[gm.Dimensions] = None,
+    verbose: bool = True,
+    entity_resolver: Optional[gh.EntityResolver] = None,
+) -> VariableUpsertResult:
+    """This function is used to put one ready to go formatted Table (i.e.
+    in the format (year, entityId, value)) into mysql. The metadata
+    of the variable is used to fill the required fields. Entity names and codes
+    are taken from `entity_resolver` if given (shared by all variables of a dataset).
+    """
+
+    table = _validate_table(table)
+
     _update_variables_metadata(table)
 
     with Session(engine) as session:
@@ -241,17 +429,17 @@ def upsert_table(
         column_name = table.columns[0]
         variable_meta: catalog.VariableMeta = table[column_name].metadata
 
-        # Timespan does not work for yearIsDay variables
-        if (variable_meta.display or {}).get("yearIsDay"):
-            timespan = ""
-        else:
-            years = table.index.unique(level="year").values
-            if len(years) == 0:
-                timespan = ""
-            else:
-                min_year = min(years)
-                max_year = max(years)
-                timespan = f"{min_year}-{max_year}"
+        # skip variables that haven't changed since the last upsert
+        if config.GRAPHER_VARIABLE_CHECKSUMS:
+            (links,) = _resolved_links(session, [variable_meta])
+            checksums = _variable_checksums(table, catalog_path, dimensions, links)
+            unchanged = _load_unchanged_variables(session, dataset_upsert_result.dataset_id, {column_name: checksums})
+            if column_name in unchanged:
+                if verbose:
+                    log.info("upsert_table.skipped_unchanged", variable_id=unchanged[column_name].variable_id)
+                return unchanged[column_name]
+
+        timespan = _timespan(table, variable_meta)
 
         table.reset_index(inplace=True)
 
@@ -276,12 +464,12 @@ def upsert_table(
 
         df = table.rename(columns={column_name: "value", "entity_id": "entityId"})
 
-        # following functions assume that `value` is string
-        df["value"] = df["value"].astype(str)
+        # following functions assume that `value` is numeric or string
+        if not pd.api.types.is_numeric_dtype(df["value"].dtype) or pd.api.types.is_bool_dtype(df["value"].dtype):
+            df["value"] = df["value"].astype(str)
 
-        # NOTE: we could prefetch all entities in advance, but it's not a bottleneck as it takes
-        # less than 10ms per variable
-        df = add_entity_code_and_name(session, df)
+        entities = entity_resolver.entities(df["entityId"].unique()) if entity_resolver else None
+        df = add_entity_code_and_name(session, df, entities=entities)
 
         # update links, we need to do it after we commit deleted relationships above
         db_variable.update_links(
@@ -296,14 +484,24 @@ def upsert_table(
         # have to if we used ORM instead
         session.commit()
 
+        if config.GRAPHER_VARIABLE_CHECKSUMS:
+            _set_variable_checksums(session, {db_variable_id: (None, None)})
+
         # process data and metadata
         var_data = variable_data(df)
         var_metadata = variable_metadata(session, db_variable_id, df)
 
-        # upload them to R2
-        with ThreadPoolExecutor() as executor:
-            executor.submit(upload_gzip_dict, var_data, db_variable.s3_data_path())
-            executor.submit(upload_gzip_dict, var_metadata, db_variable.s3_metadata_path())
+        # upload them to R2 and raise upload errors before checksums are stored
+        uploader = get_uploader()
+        uploader.wait(
+            [
+                uploader.submit(var_data, db_variable.s3_data_path()),
+                uploader.submit(var_metadata, db_variable.s3_metadata_path()),
+            ]
+        )
+
+        if config.GRAPHER_VARIABLE_CHECKSUMS:
+            _set_variable_checksums(session, {db_variable_id: checksums})
 
         if verbose:
             log.info("upsert_table.uploaded_to_s3", size=len(table), variable_id=db_variable_id)
@@ -311,6 +509,215 @@ def upsert_table(
         return VariableUpsertResult(db_variable_id, source_id)  # type: ignore
 
 
+@dataclass
+class _VariableToUpsert:
+    """Everything needed to upsert a variable to DB, without its data."""
+
+    short_name: str
+    meta: catalog.VariableMeta
+    dataset_meta: Optional[catalog.DatasetMeta]
+    timespan: str
+    catalog_path: Optional[str]
+    dimensions: Optional[gm.Dimensions]
+    data_checksum: Optional[str]
+    # set once links of the variable are resolved in DB
+    checksums: Optional[Tuple[str, str]] = None
+
+
+@tracing.traced("upsert_tables", cat="grapher")
+def upsert_tables(
+    engine: Engine,
+    tables: Callable[[], Iterable[Tuple[catalog.Table, Optional[str], Optional[gm.Dimensions]]]],
+    dataset_upsert_result: DatasetUpsertResult,
+    entity_resolver: Optional[gh.EntityResolver] = None,
+) -> List[VariableUpsertResult]:
+    """Same as calling `upsert_table` for every (table, catalog_path, dimensions) yielded by `tables()`, but variables
+    of the whole dataset are diffed against the database with a constant number of set-based queries (instead of
+    several queries per variable) in a single transaction.
+
+    `tables` is called twice, so that data of the whole dataset never has to be held in memory. The first pass
+    upserts variables to DB from their metadata only. The second pass streams data and metadata of every changed
+    variable into R2 uploads.
+    """
+    # first pass: keep only metadata, timespan and data checksums of variables, their data is discarded right away
+    variables = []
+    for table, catalog_path, dimensions in tables():
+        table = _validate_table(table)
+        _update_variables_metadata(table)
+        meta = table.iloc[:, 0].metadata
+        assert len(meta.origins) == len(set(meta.origins)), "origins must be unique"
+        variables.append(
+            _VariableToUpsert(
+                short_name=table.columns[0],
+                meta=meta,
+                dataset_meta=table.metadata.dataset,
+                timespan=_timespan(table, meta),
+                catalog_path=catalog_path,
+                dimensions=dimensions,
+                data_checksum=_data_checksum(table) if config.GRAPHER_VARIABLE_CHECKSUMS else None,
+            )
+        )
+    if not variables:
+        return []
+
+    # skip variables that haven't changed since the last upsert
+    unchanged = {}
+    if config.GRAPHER_VARIABLE_CHECKSUMS:
+        with Session(engine) as session:
+            for v, links in zip(variables, _resolved_links(session, [v.meta for v in variables])):
+                assert v.data_checksum
+                v.checksums = (
+                    v.data_checksum,
+                    _metadata_checksum(v.short_name, v.meta, v.dataset_meta, v.catalog_path, v.dimensions, links),
+                )
+            unchanged = _load_unchanged_variables(
+                session,
+                dataset_upsert_result.dataset_id,
+                {v.short_name: v.checksums for v in variables},  # type: ignore
+            )
+    if unchanged:
+        log.info("upsert_tables.skipped_unchanged", variables=len(unchanged))
+        variables = [v for v in variables if v.short_name not in unchanged]
+        if not variables:
+            return list(unchanged.values())
+
+    variable_metas = [v.meta for v in variables]
+
+    with Session(engine) as session:
+        # upsert every source only once
+        result = DatasetUpsertResult(dataset_upsert_result.dataset_id, dict(dataset_upsert_result.source_ids))
+        source_ids = []
+        for v in variables:
+            source_id = _add_or_update_source(session, v.meta, v.short_name, result)
+            if source_id:
+                result.source_ids[hash(v.meta.sources[0])] = source_id
+            source_ids.append(source_id)
+
+        unique_origins = list(dict.fromkeys(origin for meta in variable_metas for origin in meta.origins))
+        with origins_table_lock:
+            db_origins = dict(
+                zip(unique_origins, gm.Origin.bulk_upsert(session, [gm.Origin.from_origin(o) for o in unique_origins]))
+            )
+            # commit within the lock to make sure other threads get the latest origins
+            session.commit()
+
+        db_variables = [
+            gm.Variable.from_variable_metadata(
+                v.meta,
+                short_name=v.short_name,
+                timespan=v.timespan,
+                dataset_id=dataset_upsert_result.dataset_id,
+                source_id=source_id,
+                catalog_path=v.catalog_path,
+                dimensions=v.dimensions,
+            )
+            for v, source_id in zip(variables, source_ids)
+        ]
+        variable_ids = gm.Variable.bulk_upsert(session, db_variables)
+        for db_variable, variable_id in zip(db_variables, variable_ids):
+            db_variable.id = variable_id
+
+        _update_links(session, variable_ids, variable_metas, db_origins)
+
+        # we need to commit changes because we load metadata of variables from DB with SQL commands
+        session.commit()
+
+        if config.GRAPHER_VARIABLE_CHECKSUMS:
+            _set_variable_checksums(session, {variable_id: (None, None) for variable_id in variable_ids})
+
+        variable_metadata = variables_metadata_loader(session, variable_ids)
+
+    # second pass: slice tables again and upload data and metadata of changed variables one by one, the uploader
+    # consumes them only as fast as they're uploaded
+    entity_resolver = entity_resolver or gh.EntityResolver()
+    db_variables_by_name = {db_variable.shortName: db_variable for db_variable in db_variables}
+
+    def _uploads(session: Session) -> Iterator[Tuple[Dict[str, Any], str]]:
+        for table, _, _ in tables():
+            db_variable = db_variables_by_name.get(table.columns[0])
+            if db_variable is None:
+                continue
+            assert db_variable.id
+
+            df = table.reset_index().rename(columns={table.columns[0]: "value", "entity_id": "entityId"})
+
+            # following functions assume that `value` is numeric or string
+            if not pd.api.types.is_numeric_dtype(df["value"].dtype) or pd.api.types.is_bool_dtype(df["value"].dtype):
+                df["value"] = df["value"].astype(str)
+
+            df = add_entity_code_and_name(session, df, entities=entity_resolver.entities(df["entityId"].unique()))
+
+            yield variable_data(df), db_variable.s3_data_path()
+            yield variable_metadata(db_variable.id, df), db_variable.s3_metadata_path()
+
+    uploader = get_uploader()
+    with Session(engine) as session:
+        uploader.wait(uploader.submit_many(_uploads(session)))
+
+    log.info("upsert_tables.uploaded_to_s3", variables=len(db_variables))
+
+    if config.GRAPHER_VARIABLE_CHECKSUMS:
+        with Session(engine) as session:
+            _set_variable_checksums(
+                session,
+                {variable_id: v.checksums for v, variable_id in zip(variables, variable_ids)},  # type: ignore
+            )
+
+    return list(unchanged.values()) + [
+        VariableUpsertResult(variable_id, source_id)  # type: ignore
+        for variable_id, source_id in zip(variable_ids, source_ids)
+    ]
+
+
+def _update_links(
+    session: Session,
+    variable_ids: List[int],
+    variable_metas: List[catalog.VariableMeta],
+    db_origins: Dict[catalog.Origin, gm.Origin],
+) -> None:
+    """Same as `Variable.update_links`, but for many variables at once."""
+    gm.OriginsVariablesLink.link_with_variables(
+        session,
+        {
+            variable_id: [db_origins[origin].id for origin in meta.origins]  # type: ignore
+            for variable_id, meta in zip(variable_ids, variable_metas)
+        },
+    )
+
+    faqs = {
+        variable_id: meta.presentation.faqs if meta.presentation else []
+        for variable_id, meta in zip(variable_ids, variable_metas)
+    }
+    required_gdoc_ids = {faq.gdoc_id for variable_faqs in faqs.values() for faq in variable_faqs}
+    existing_gdoc_ids = set(
+        session.exec(select(gm.PostsGdocs.id).where(gm.PostsGdocs.id.in_(required_gdoc_ids))).all()  # type: ignore
+    )
+    missing_gdoc_ids = required_gdoc_ids - existing_gdoc_ids
+    if missing_gdoc_ids:
+        log.warning("create_links.missing_faqs", missing_gdoc_ids=missing_gdoc_ids)
+    gm.PostsGdocsVariablesFaqsLink.link_with_variables(
+        session,
+        {
+            variable_id: [faq for faq in variable_faqs if faq.gdoc_id in existing_gdoc_ids]
+            for variable_id, variable_faqs in faqs.items()
+        },
+    )
+
+    tag_names = {
+        variable_id: meta.presentation.topic_tags if meta.presentation else []
+        for variable_id, meta in zip(variable_ids, variable_metas)
+    }
+    all_tag_names = list(dict.fromkeys(name for names in tag_names.values() for name in names))
+    tag_ids = {tag.name: tag.id for tag in gm.Tag.load_tags_by_names(session, all_tag_names)}
+    gm.TagsVariablesTopicTagsLink.link_with_variables(
+        session,
+        {
+            variable_id: [tag_ids[name] for name in names if name in tag_ids]  # type: ignore
+            for variable_id, names in tag_names.items()
+        },
+    )
+
+
 def fetch_db_checksum(dataset: catalog.Dataset) -> Optional[str]:
     """
     Fetch the latest source checksum associated with a given dataset in the db. Can be compared
@@ -5,8 +5,10 @@ sqlacodegen --generator sqlmodels mysql://root@localhost:3306/owid
 It has been slightly modified since then.
 """
 import json
+import unicodedata
+from collections import Counter
 from datetime import date, datetime
-from typing import Annotated, Any, Dict, List, Optional, TypedDict, Union
+from typing import Annotated, Any, Dict, List, Optional, Set, Tuple, TypedDict, Union
 from urllib.parse import quote
 
 import humps
@@ -23,6 +25,7 @@ from sqlalchemy import (
     String,
     Table,
     text,
+    tuple_,
 )
 from sqlalchemy.dialects.mysql import (
     ENUM,
@@ -31,6 +34,7 @@ from sqlalchemy.dialects.mysql import (
     MEDIUMTEXT,
     TINYINT,
     VARCHAR,
+    insert,
 )
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.future import Engine as _FutureEngine
@@ -845,32 +849,17 @@ class OriginsVariablesLink(SQLModel, table=True):
     @classmethod
     def link_with_variable(cls, session: Session, variable_id: int, new_origin_ids: List[int]) -> None:
         """Link the given Variable ID with the given Origin IDs."""
-        # Fetch current linked Origins for the given Variable ID
-        existing_links = session.query(cls.originId, cls.displayOrder).filter(cls.variableId == variable_id).all()
-
-        existing_origins = {(link.originId, link.displayOrder) for link in existing_links}
-        new_origins = {(origin_id, i) for i, origin_id in enumerate(new_origin_ids)}
-
-        # Find the Origin IDs to delete and the IDs to add
-        to_delete = existing_origins - new_origins
-        to_add = new_origins - existing_origins
-
-        # Delete the obsolete Origin-Variable links
-        for origin_id, display_order in to_delete:
-            session.query(cls).filter(
-                cls.variableId == variable_id,
-                cls.originId == origin_id,
-                cls.displayOrder == display_order,
-            ).delete(synchronize_session="fetch")
-
-        # Add the new Origin-Variable links
-        if to_add:
-            session.add_all(
-                [
-                    cls(originId=origin_id, variableId=variable_id, displayOrder=display_order)
-                    for origin_id, display_order in to_add
-                ]
-            )
+        cls.link_with_variables(session, {variable_id: new_origin_ids})
+
+    @classmethod
+    def link_with_variables(cls, session: Session, new_origin_ids: Dict[int, List[int]]) -> None:
+        """Link each of the given Variable IDs with its Origin IDs."""
+        new_links = {
+            (variable_id, origin_id, i)
+            for variable_id, origin_ids in new_origin_ids.items()
+            for i, origin_id in enumerate(origin_ids)
+        }
+        _sync_variable_links(session, cls, ["originId", "displayOrder"], list(new_origin_ids), new_links)
 
 
 class PostsGdocsVariablesFaqsLink(SQLModel, table=True):
@@ -894,33 +883,17 @@ class PostsGdocsVariablesFaqsLink(SQLModel, table=True):
     @classmethod
     def link_with_variable(cls, session: Session, variable_id: int, new_faqs: List[catalog.FaqLink]) -> None:
         """Link the given Variable ID with Faqs"""
-        # Fetch current linked Faqs for the given Variable ID
-        existing_faqs = session.query(cls).filter(cls.variableId == variable_id).all()
-
-        # Work with tuples instead
-        existing_gdoc_fragment = {(f.gdocId, f.fragmentId, f.displayOrder) for f in existing_faqs}
-        new_gdoc_fragment = {(f.gdoc_id, f.fragment_id, i) for i, f in enumerate(new_faqs)}
-
-        to_delete = existing_gdoc_fragment - new_gdoc_fragment
-        to_add = new_gdoc_fragment - existing_gdoc_fragment
-
-        # Delete the obsolete links
-        for gdoc_id, fragment_id, display_order in to_delete:
-            session.query(cls).filter(
-                cls.variableId == variable_id,
-                cls.gdocId == gdoc_id,
-                cls.fragmentId == fragment_id,
-                cls.displayOrder == display_order,
-            ).delete(synchronize_session="fetch")
-
-        # Add the new links
-        if to_add:
-            session.add_all(
-                [
-                    cls(gdocId=gdoc_id, fragmentId=fragment_id, displayOrder=display_order, variableId=variable_id)
-                    for gdoc_id, fragment_id, display_order in to_add
-                ]
-            )
+        cls.link_with_variables(session, {variable_id: new_faqs})
+
+    @classmethod
+    def link_with_variables(cls, session: Session, new_faqs: Dict[int, List[catalog.FaqLink]]) -> None:
+        """Link each of the given Variable IDs with its Faqs"""
+        new_links = {
+            (variable_id, f.gdoc_id, f.fragment_id, i)
+            for variable_id, faqs in new_faqs.items()
+            for i, f in enumerate(faqs)
+        }
+        _sync_variable_links(session, cls, ["gdocId", "fragmentId", "displayOrder"], list(new_faqs), new_links)
 
 
 class TagsVariablesTopicTagsLink(SQLModel, table=True):
@@ -939,34 +912,45 @@ class TagsVariablesTopicTagsLink(SQLModel, table=True):
     @classmethod
     def link_with_variable(cls, session: Session, variable_id: int, new_tag_ids: List[str]) -> None:
         """Link the given Variable ID with the given Tag IDs."""
-        assert len(new_tag_ids) == len(set(new_tag_ids)), "Tag IDs must be unique"
-
-        # Fetch current linked tags for the given Variable ID
-        existing_links = session.query(cls.tagId, cls.displayOrder).filter(cls.variableId == variable_id).all()
-
-        existing_tags = {(link.tagId, link.displayOrder) for link in existing_links}
-        new_tags = {(tag_id, i) for i, tag_id in enumerate(new_tag_ids)}
-
-        # Find the tag IDs to delete and the IDs to add
-        to_delete = existing_tags - new_tags
-        to_add = new_tags - existing_tags
-
-        # Delete the obsolete links
-        for tag_id, display_order in to_delete:
-            session.query(cls).filter(
-                cls.variableId == variable_id,
-                cls.tagId == tag_id,
-                cls.displayOrder == display_order,
-            ).delete(synchronize_session="fetch")
-
-        # Add the new links
-        if to_add:
-            session.add_all(
-                [
-                    cls(tagId=tag_id, variableId=variable_id, displayOrder=display_order)
-                    for tag_id, display_order in to_add
-                ]
-            )
+        cls.link_with_variables(session, {variable_id: new_tag_ids})
+
+    @classmethod
+    def link_with_variables(cls, session: Session, new_tag_ids: Dict[int, List[str]]) -> None:
+        """Link each of the given Variable IDs with its Tag IDs."""
+        for tag_ids in new_tag_ids.values():
+            assert len(tag_ids) == len(set(tag_ids)), "Tag IDs must be unique"
+
+        new_links = {
+            (variable_id, tag_id, i) for variable_id, tag_ids in new_tag_ids.items() for i, tag_id in enumerate(tag_ids)
+        }
+        _sync_variable_links(session, cls, ["tagId", "displayOrder"], list(new_tag_ids), new_links)
+
+
+def _sync_variable_links(
+    session: Session, cls: Any, columns: List[str], variable_ids: List[int], new_links: Set[Tuple[Any, ...]]
+) -> None:
+    """Make the links of given variables in a link table equal to `new_links`, which are tuples with values of
+    variableId and the given columns. Only links that changed are deleted or inserted, with a constant number of
+    queries."""
+    if not variable_ids:
+        return
+
+    key = [cls.variableId] + [getattr(cls, column) for column in columns]
+
+    # Fetch current links of the given Variable IDs
+    existing_links = {tuple(link) for link in session.query(*key).filter(cls.variableId.in_(variable_ids)).all()}
+
+    # Find the links to delete and the links to add
+    to_delete = existing_links - new_links
+    to_add = new_links - existing_links
+
+    # Delete the obsolete links
+    if to_delete:
+        session.query(cls).filter(tuple_(*key).in_(to_delete)).delete(synchronize_session=False)
+
+    # Add the new links
+    if to_add:
+        session.execute(insert(cls.__table__), [dict(zip(["variableId"] + columns, link)) for link in to_add])
 
 
 class Variable(SQLModel, table=True):
@@ -1084,41 +1068,7 @@ class Variable(SQLModel, table=True):
         if not ds:
             ds = self
         else:
-            ds.shortName = self.shortName
-            ds.name = self.name
-            ds.description = self.description
-            ds.unit = self.unit
-            ds.shortUnit = self.shortUnit
-            ds.sourceId = self.sourceId
-            ds.timespan = self.timespan
-            ds.coverage = self.coverage
-            ds.display = self.display
-            ds.catalogPath = self.catalogPath
-            ds.dimensions = self.dimensions
-            ds.schemaVersion = self.schemaVersion
-            ds.processingLevel = self.processingLevel
-            ds.processingLog = self.processingLog
-            ds.titlePublic = self.titlePublic
-            ds.titleVariant = self.titleVariant
-            ds.attributionShort = self.attributionShort
-            ds.attribution = self.attribution
-            ds.descriptionShort = self.descriptionShort
-            ds.descriptionFromProducer = self.descriptionFromProducer
-            ds.descriptionKey = self.descriptionKey
-            ds.descriptionProcessing = self.descriptionProcessing
-            ds.licenses = self.licenses
-            ds.license = self.license
-            ds.updatedAt = datetime.utcnow()
-            # do not update these fields unless they're specified
-            if self.columnOrder is not None:
-                ds.columnOrder = self.columnOrder
-            if self.code is not None:
-                ds.code = self.code
-            if self.originalMetadata is not None:
-                ds.originalMetadata = self.originalMetadata
-            if self.grapherConfigETL is not None:
-                ds.grapherConfigETL = self.grapherConfigETL
-            assert self.grapherConfigAdmin is None, "grapherConfigETL should be used instead of grapherConfigAdmin"
+            ds._update_from(self)
 
         session.add(ds)
 
@@ -1129,6 +1079,133 @@ class Variable(SQLModel, table=True):
         )
         return session.exec(q).one()
 
+    @classmethod
+    def bulk_upsert(cls, session: Session, variables: List["Variable"], batch_size: int = 1000) -> List[int]:
+        """Upsert variables of a single dataset with a constant number of queries and return their IDs (in the
+        same order). Variables are matched the same way as in `upsert`, but all at once, and written with
+        INSERT ... ON DUPLICATE KEY UPDATE in batches."""
+        if not variables:
+            return []
+
+        (dataset_id,) = {v.datasetId for v in variables}
+        for v in variables:
+            assert v.shortName
+            assert v.grapherConfigAdmin is None, "grapherConfigETL should be used instead of grapherConfigAdmin"
+
+        # Fetch only the columns we need for matching and for fields that are not updated when not specified
+        optional_columns = ["columnOrder", "code", "originalMetadata", "grapherConfigETL"]
+        q = select(cls.id, cls.shortName, cls.name, *[getattr(cls, c) for c in optional_columns]).where(
+            cls.datasetId == dataset_id
+        )
+        existing = session.exec(q).all()  # type: ignore
+        matches = cls._match_existing(variables, existing)
+
+        columns = [c.name for c in cls.__table__.columns]  # type: ignore
+        now = datetime.utcnow()
+        updates = []
+        inserts = []
+        for v, match in zip(variables, matches):
+            row = {c: getattr(v, c) for c in columns}
+            if match is None:
+                row["id"] = None
+                inserts.append(row)
+            else:
+                row["id"] = match.id
+                row["updatedAt"] = now
+                # do not update these fields unless they're specified
+                for c in optional_columns:
+                    if row[c] is None:
+                        row[c] = getattr(match, c)
+                updates.append(row)
+
+        # updates go first to free names of renamed variables for new ones, rows colliding on the
+        # (name, datasetId) unique key would otherwise overwrite each other
+        stmt = insert(cls.__table__)  # type: ignore
+        update_columns = [c for c in columns if c not in ("id", "createdAt", "grapherConfigAdmin")]
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+        rows = updates + inserts
+        for i in range(0, len(rows), batch_size):
+            session.execute(stmt, rows[i : i + batch_size])
+
+        # select upserted rows to get their ids
+        short_names = [v.shortName for v in variables]
+        q = select(cls.id, cls.shortName).where(cls.datasetId == dataset_id, cls.shortName.in_(short_names))  # type: ignore
+        ids = {r.shortName: r.id for r in session.exec(q).all()}  # type: ignore
+        return [ids[short_name] for short_name in short_names]
+
+    @staticmethod
+    def _match_existing(variables: List["Variable"], existing: List[Any]) -> List[Optional[Any]]:
+        """Return existing row (with id, shortName and name) matching every variable or None for new ones.
+        Variables are matched on shortName first (see `upsert` for the double underscore), then on name. A row
+        claimed by shortName can't be matched on name by another variable, that variable is new and the row
+        gets renamed. Updated variables can't take the name of another existing row, the (name, datasetId)
+        unique key would make ON DUPLICATE KEY UPDATE overwrite that row.
+        """
+        names = Counter(v.name for v in variables)
+        duplicates = sorted(name for name, count in names.items() if count > 1)
+        if duplicates:
+            raise ValueError(f"Variables of a dataset must have unique names: {duplicates}")
+
+        by_short_name = {r.shortName: r for r in existing}
+        by_name = {r.name: r for r in existing}
+
+        matches: List[Optional[Any]] = []
+        for v in variables:
+            assert v.shortName
+            matches.append(by_short_name.get(v.shortName) or by_short_name.get(v.shortName.replace("__", "_")))
+
+        claimed = {m.id for m in matches if m is not None}
+        for i, v in enumerate(variables):
+            if matches[i] is None:
+                match = by_name.get(v.name)
+                if match is not None and match.id not in claimed:
+                    matches[i] = match
+                    claimed.add(match.id)
+
+        for v, match in zip(variables, matches):
+            other = by_name.get(v.name)
+            if match is not None and other is not None and other.id != match.id:
+                raise ValueError(f"Variable {v.shortName} can't be renamed to the name of variable {other.shortName}")
+        return matches
+
+    def _update_from(self, other: "Variable") -> None:
+        """Update fields of an existing variable with the fields of a new one."""
+        self.shortName = other.shortName
+        self.name = other.name
+        self.description = other.description
+        self.unit = other.unit
+        self.shortUnit = other.shortUnit
+        self.sourceId = other.sourceId
+        self.timespan = other.timespan
+        self.coverage = other.coverage
+        self.display = other.display
+        self.catalogPath = other.catalogPath
+        self.dimensions = other.dimensions
+        self.schemaVersion = other.schemaVersion
+        self.processingLevel = other.processingLevel
+        self.processingLog = other.processingLog
+        self.titlePublic = other.titlePublic
+        self.titleVariant = other.titleVariant
+        self.attributionShort = other.attributionShort
+        self.attribution = other.attribution
+        self.descriptionShort = other.descriptionShort
+        self.descriptionFromProducer = other.descriptionFromProducer
+        self.descriptionKey = other.descriptionKey
+        self.descriptionProcessing = other.descriptionProcessing
+        self.licenses = other.licenses
+        self.license = other.license
+        self.updatedAt = datetime.utcnow()
+        # do not update these fields unless they're specified
+        if other.columnOrder is not None:
+            self.columnOrder = other.columnOrder
+        if other.code is not None:
+            self.code = other.code
+        if other.originalMetadata is not None:
+            self.originalMetadata = other.originalMetadata
+        if other.grapherConfigETL is not None:
+            self.grapherConfigETL = other.grapherConfigETL
+        assert other.grapherConfigAdmin is None, "grapherConfigETL should be used instead of grapherConfigAdmin"
+
     @classmethod
     def from_variable_metadata(
         cls,
@@ -1381,6 +1458,71 @@ class Origin(SQLModel, table=True):
 
         return origin
 
+    # Fields an existing origin must match to be reused (see `_upsert_select`).
+    _MATCH_FIELDS = [
+        "producer",
+        "citationFull",
+        "titleSnapshot",
+        "title",
+        "attribution",
+        "attributionShort",
+        "versionProducer",
+        "urlMain",
+        "urlDownload",
+        "descriptionSnapshot",
+        "description",
+        "datePublished",
+        "dateAccessed",
+    ]
+
+    def _match_key(self) -> Tuple[Any, ...]:
+        return tuple(_collation_key(getattr(self, f)) for f in self._MATCH_FIELDS)
+
+    @classmethod
+    def bulk_upsert(cls, session: Session, origins: List["Origin"]) -> List["Origin"]:
+        """Upsert many origins at once and return them (in the same order) with their IDs. Matching is the same
+        as in `upsert`, but existing origins are fetched with a single query and compared in Python, ignoring case
+        and accents like the collation of the origins table.
+        """
+        if not origins:
+            return []
+
+        producers = {o.producer for o in origins}
+        q = select(cls).where(
+            or_(
+                cls.producer.in_([p for p in producers if p is not None]),  # type: ignore
+                cls.producer.is_(None) if None in producers else False,  # type: ignore
+            )
+        )
+        existing: Dict[Tuple[Any, ...], "Origin"] = {}
+        for origin in session.exec(q).all():
+            existing.setdefault(origin._match_key(), origin)
+
+        new_origins = []
+        out = []
+        for origin in origins:
+            key = origin._match_key()
+            if key not in existing:
+                existing[key] = origin
+                new_origins.append(origin)
+            out.append(existing[key])
+
+        if new_origins:
+            session.add_all(new_origins)
+            session.flush()
+
+        return out
+
+
+def _collation_key(value: Any) -> Any:
+    """Key for comparing values the way MySQL's default utf8mb4_0900_ai_ci collation does, i.e. strings are
+    compared case and accent insensitively."""
+    if isinstance(value, date):
+        value = str(value)
+    if isinstance(value, str):
+        value = "".join(c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c)).casefold()
+    return value
+
 
 def _json_is(json_field: Any, key: str, val: Any) -> Any:
     """SQLAlchemy condition for checking if a JSON field has a key with a given value. Works for null."""
@@ -16,6 +16,7 @@ from owid.catalog import Dataset
 from rapidfuzz import process
 from rich_click.rich_command import RichCommand
 
+from etl.data_helpers.geo_index import load_regions_index
 from etl.paths import LATEST_REGIONS_DATASET_PATH, LATEST_REGIONS_YML
 
 custom_style_fancy = questionary.Style(
@@ -187,27 +188,10 @@ class CountryRegionMapper:
     valid_names: Set[str]
 
     def __init__(self) -> None:
-        tb_regions = Dataset(LATEST_REGIONS_DATASET_PATH)["regions"]
-        rc_df = tb_regions[["name", "short_name", "region_type", "is_historical", "defined_by"]]
-        # Convert strings of lists of aliases into lists of aliases.
-        tb_regions["aliases"] = [json.loads(alias) if pd.notnull(alias) else [] for alias in tb_regions["aliases"]]
-        # Explode list of aliases to have one row per alias.
-        aliases_s = tb_regions["aliases"].explode().dropna()
-        aliases = {}
-        valid_names = set()
-        for row in rc_df.itertuples():
-            name = row.name  # type: ignore
-            code = row.Index  # type: ignore
-            valid_names.add(name)
-            aliases[name.lower()] = name
-            if code in aliases_s.index:
-                for alias in aliases_s.loc[[code]]:
-                    aliases[alias.lower()] = name
-            # Include the region code itself as another alias.
-            aliases[code.lower()] = name
-
-        self.aliases = aliases
-        self.valid_names = valid_names
+        # Names, codes and aliases of regions come precomputed in the cached index of the regions dataset.
+        index = load_regions_index(Dataset(LATEST_REGIONS_DATASET_PATH))
+        self.aliases = index.aliases
+        self.valid_names = index.valid_names
 
     def __contains__(self, key: str) -> bool:
         return key.lower() in self.aliases
@@ -7,6 +7,7 @@ import re
 import sys
 import tempfile
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Union, cast
@@ -30,7 +31,7 @@ from owid.datautils.common import ExceptionFromDocstring
 from owid.walden import Catalog as WaldenCatalog
 from owid.walden import Dataset as WaldenDataset
 
-from etl import paths
+from etl import config, paths
 from etl.snapshot import Snapshot, SnapshotMeta
 from etl.steps import extract_step_attributes, load_dag, reverse_graph
 
@@ -175,13 +176,24 @@ def create_dataset(
 
     # add tables to dataset
     used_short_names = set()
+    tables_to_add = []
     for table in tables:
         if underscore_table:
             table = catalog.utils.underscore_table(table, camel_to_snake=camel_to_snake)
         if table.metadata.short_name in used_short_names:
             raise ValueError(f"Table short name `{table.metadata.short_name}` is already in use.")
         used_short_names.add(table.metadata.short_name)
-        ds.add(table, formats=formats)
+        tables_to_add.append(table)
+
+    # repacking and writing of tables mostly runs in numpy and pyarrow without GIL, so
+    # datasets with many tables are written concurrently
+    if config.SAVE_TABLES_WORKERS > 1 and len(tables_to_add) > 1:
+        with ThreadPoolExecutor(max_workers=config.SAVE_TABLES_WORKERS) as executor:
+            # consume results to re-raise exceptions
+            list(executor.map(lambda t: ds.add(t, formats=formats), tables_to_add))
+    else:
+        for table in tables_to_add:
+            ds.add(table, formats=formats)
 
     # set metadata from dest_dir
     pattern = (
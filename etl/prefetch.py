@@ -0,0 +1,222 @@
+#
+#  prefetch.py
+#
+
+"""
+Download files of snapshot and walden steps concurrently before running them.
+
+`Snapshot.pull` goes through DVC under an inter-process lock, so snapshots are pulled one
+at a time. Prefetch instead downloads files straight from the DVC remote (where they're
+stored under their md5) and from walden URLs over pooled HTTP and S3 connections, and
+verifies their checksums. Steps whose files are already in place then have nothing to do.
+Failed downloads are only logged, the steps themselves pull them as before.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import click
+import requests
+import structlog
+import yaml
+from owid.catalog import checksums
+from owid.catalog.s3_utils import s3_bucket_key
+from requests.adapters import HTTPAdapter
+
+from etl import config, paths
+from etl.snapshot import Snapshot, file_matches_dvc_md5
+from etl.steps import SnapshotStep, Step, WaldenStep, compile_steps
+
+log = structlog.get_logger()
+
+# bucket of the `private` DVC remote
+SNAPSHOTS_PRIVATE_BUCKET = "owid-snapshots-private"
+
+CHUNK_SIZE = 2**20
+
+
+@dataclass
+class Download:
+    # https:// or s3:// URL
+    url: str
+    path: Path
+    md5: Optional[str]
+    # DVC 2 computes md5 of text files with CRLF converted to LF
+    dos2unix: bool = False
+
+
+def snapshot_downloads(step: SnapshotStep) -> List[Download]:
+    """Return files of a snapshot that are missing locally or don't match its .dvc file."""
+    snap = Snapshot(step.path)
+    with open(snap.metadata_path) as istream:
+        dvc_yaml = yaml.safe_load(istream)
+
+    downloads = []
+    wdir = snap.metadata_path.parent / dvc_yaml.get("wdir", ".")
+    for out in dvc_yaml.get("outs") or []:
+        md5 = out.get("md5")
+        # directories are left to DVC
+        if not md5 or md5.endswith(".dir"):
+            continue
+
+        path = (wdir / out["path"]).resolve()
+        if path.is_file() and file_matches_dvc_md5(path, md5):
+            continue
+
+        if snap.metadata.is_public:
+            url = f"{config.SNAPSHOTS_URL}/{md5[:2]}/{md5[2:]}"
+        else:
+            url = f"s3://{SNAPSHOTS_PRIVATE_BUCKET}/{md5[:2]}/{md5[2:]}"
+        downloads.append(Download(url=url, path=path, md5=md5, dos2unix=True))
+
+    return downloads
+
+
+def walden_downloads(step: WaldenStep) -> List[Download]:
+    """Return the file of a public walden dataset if it's missing locally or doesn't match its md5. Private
+    datasets and datasets that are not in our cache are left to the step."""
+    dataset = step._walden_dataset
+    # source_data_url doesn't have to serve the same file that we have in our cache
+    url = dataset.owid_data_url
+    if not url or not dataset.is_public:
+        return []
+
+    # don't download it again if it's already there and matches its md5
+    if not step.is_dirty():
+        return []
+
+    return [Download(url=url, path=Path(dataset.local_path), md5=dataset.md5)]
+
+
+def collect_downloads(steps: Iterable[Step]) -> List[Download]:
+    downloads = []
+    for step in steps:
+        if isinstance(step, SnapshotStep):
+            downloads += snapshot_downloads(step)
+        elif isinstance(step, WaldenStep):
+            downloads += walden_downloads(step)
+
+    # the same file can be used by multiple steps
+    return list({d.path: d for d in downloads}.values())
+
+
+def prefetch(steps: Iterable[Step], workers: int = config.PREFETCH_WORKERS) -> Tuple[int, int]:
+    """Concurrently download files of snapshot and walden steps. Return the number of downloaded
+    and failed files."""
+    downloads = collect_downloads(steps)
+    if not downloads:
+        return 0, 0
+
+    fetcher = _Fetcher(workers)
+    n_failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetcher.download, d): d for d in downloads}
+        for future in as_completed(futures):
+            d = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                # the step will try to download it again when it runs
+                log.warning("prefetch.failed", url=d.url, path=str(d.path), error=str(e))
+                n_failed += 1
+
+    return len(downloads) - n_failed, n_failed
+
+
+class ChecksumDoesNotMatch(Exception):
+    pass
+
+
+class _Fetcher:
+    """Downloads files over HTTP and S3 with connection pools shared by all threads."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=3)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._s3: Any = None
+        self._s3_lock = threading.Lock()
+
+    @property
+    def s3(self) -> Any:
+        # boto3 clients are thread-safe, but creating them is not
+        with self._s3_lock:
+            if self._s3 is None:
+                import boto3
+                from botocore.config import Config
+
+                self._s3 = boto3.client(
+                    "s3",
+                    endpoint_url=config.R2_ENDPOINT_URL,
+                    region_name=config.R2_REGION_NAME,
+                    aws_access_key_id=config.R2_ACCESS_KEY,
+                    aws_secret_access_key=config.R2_SECRET_KEY,
+                    config=Config(max_pool_connections=self.workers, retries={"max_attempts": 3}),
+                )
+            return self._s3
+
+    def download(self, d: Download) -> None:
+        """Stream the file to a temporary file, verify its checksum and move it in place."""
+        d.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = d.path.with_name(f".{d.path.name}.{uuid.uuid4().hex}.tmp")
+        md5 = hashlib.md5()
+        md5_dos2unix = checksums.Dos2UnixMD5()
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in self._iter_chunks(d.url):
+                    f.write(chunk)
+                    md5.update(chunk)
+                    if d.dos2unix:
+                        md5_dos2unix.update(chunk)
+
+            valid_md5s = {md5.hexdigest(), md5_dos2unix.hexdigest()} if d.dos2unix else {md5.hexdigest()}
+            if d.md5 and d.md5 not in valid_md5s:
+                raise ChecksumDoesNotMatch(f"{d.url}: expected {d.md5}, got {md5.hexdigest()}")
+
+            os.replace(tmp, d.path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+        log.info("prefetch.downloaded", url=d.url, path=str(d.path))
+
+    def _iter_chunks(self, url: str) -> Iterable[bytes]:
+        if url.startswith("s3://"):
+            bucket, key = s3_bucket_key(url)
+            body = self.s3.get_object(Bucket=bucket, Key=key)["Body"]
+            yield from body.iter_chunks(CHUNK_SIZE)
+        else:
+            with self.session.get(url, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                yield from r.iter_content(CHUNK_SIZE)
+
+
+@click.command()
+@click.option(
+    "--dag-path",
+    type=click.Path(exists=True),
+    help="Path to DAG yaml file",
+    default=paths.DEFAULT_DAG_FILE,
+)
+@click.option("--private", is_flag=True, help="Include private snapshots")
+@click.option("--workers", type=int, help="Number of concurrent downloads", default=config.PREFETCH_WORKERS)
+@click.argument("steps", nargs=-1)
+def prefetch_cli(steps: List[str], dag_path: Path, private: bool, workers: int) -> None:
+    """Download files of snapshot and walden steps needed by given steps (or the whole DAG)."""
+    from etl.command import construct_dag
+
+    dag = construct_dag(dag_path, backport=False, private=private, grapher=False)
+    excludes = [] if private else ["-private://"]
+    all_steps = compile_steps(dag, list(steps), excludes)
+    ingest_steps = [s for s in all_steps if isinstance(s, (SnapshotStep, WaldenStep))]
+
+    n_downloaded, n_failed = prefetch(ingest_steps, workers=workers)
+    log.info("prefetch.done", downloaded=n_downloaded, failed=n_failed)
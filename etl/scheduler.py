@@ -0,0 +1,190 @@
+#
+#  scheduler.py
+#
+
+"""
+Historical runtimes of steps and helpers for scheduling them. Steps on the longest
+remaining chain (critical path) are started first, so that long chains such as
+meadow -> garden -> grapher don't start late and dominate the total wall time.
+"""
+
+import heapq
+import json
+import statistics
+import sys
+from dataclasses import dataclass
+from graphlib import TopologicalSorter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import fasteners
+import structlog
+
+from etl import paths
+
+log = structlog.get_logger()
+
+STEP_HISTORY_FILE = paths.CACHE_DIR / "step_history.json"
+
+# duration assumed for steps that have never been run
+DEFAULT_DURATION = 10.0
+
+ExecGraph = Dict[str, Set[str]]
+
+
+@dataclass
+class StepRecord:
+    # duration of the last run in seconds
+    duration: float
+    # peak resident memory of the last run in bytes (if known)
+    peak_rss: Optional[int] = None
+
+
+class StepHistory:
+    """Historical durations and peak memory of steps stored in a local JSON file."""
+
+    def __init__(self, path: Path = STEP_HISTORY_FILE) -> None:
+        self.path = Path(path)
+        self.records: Dict[str, StepRecord] = {}
+
+    @classmethod
+    def load(cls, path: Path = STEP_HISTORY_FILE) -> "StepHistory":
+        history = cls(path)
+        history.records = history._read()
+        return history
+
+    def _read(self) -> Dict[str, StepRecord]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path) as f:
+                return {step: StepRecord(**r) for step, r in json.load(f).items()}
+        except (ValueError, TypeError):
+            log.warning("step_history.corrupted", path=self.path)
+            return {}
+
+    def record(self, step: str, duration: float, peak_rss: Optional[int] = None) -> None:
+        """Save a run of a step. Safe to call from multiple processes at once."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with fasteners.InterProcessLock(self.path.with_suffix(".lock")):
+            self.records = self._read()
+            self.records[step] = StepRecord(duration=duration, peak_rss=peak_rss)
+            with open(self.path, "w") as f:
+                json.dump({s: r.__dict__ for s, r in sorted(self.records.items())}, f, indent=1)
+
+    def durations(self, steps: Iterable[str]) -> Dict[str, float]:
+        """Return expected durations of steps. Steps without history get the median duration
+        of known steps."""
+        steps = list(steps)
+        known = {s: self.records[s].duration for s in steps if s in self.records}
+        default = statistics.median(known.values()) if known else DEFAULT_DURATION
+        return {s: known.get(s, default) for s in steps}
+
+    def peak_memory(self, steps: Iterable[str]) -> Dict[str, int]:
+        """Return expected peak memory of steps in bytes, 0 if unknown."""
+        return {s: (self.records[s].peak_rss or 0) if s in self.records else 0 for s in steps}
+
+
+def critical_paths(exec_graph: ExecGraph, durations: Dict[str, float]) -> Dict[str, float]:
+    """
+    Return the length of the longest chain of steps that starts with each step, i.e. its
+    own duration plus the longest remaining path through the steps that depend on it.
+
+    :param exec_graph: Graph of steps and their dependencies (dependent -> dependencies).
+    """
+    dependents: Dict[str, Set[str]] = {s: set() for s in exec_graph}
+    for step, deps in exec_graph.items():
+        for dep in deps:
+            dependents.setdefault(dep, set()).add(step)
+
+    lengths: Dict[str, float] = {}
+    # visit steps from the last ones, so that all dependents are already computed
+    for step in reversed(list(TopologicalSorter(exec_graph).static_order())):
+        tail = max((lengths[d] for d in dependents.get(step, ())), default=0.0)
+        lengths[step] = durations.get(step, DEFAULT_DURATION) + tail
+
+    return lengths
+
+
+def predict_makespan(
+    exec_graph: ExecGraph,
+    durations: Dict[str, float],
+    workers: int,
+    memory: Optional[Dict[str, int]] = None,
+    max_memory: Optional[int] = None,
+) -> float:
+    """Simulate execution of the graph with the same policy as `exec_graph_parallel` and
+    return the predicted total wall time in seconds."""
+    priorities = critical_paths(exec_graph, durations)
+    memory = memory or {}
+
+    sorter = TopologicalSorter(exec_graph)
+    sorter.prepare()
+
+    now = 0.0
+    ready: List[str] = []
+    # heap of (finish time, step)
+    running: List[Tuple[float, str]] = []
+    while sorter.is_active():
+        ready.extend(sorter.get_ready())
+        for step in pick_ready(ready, priorities, [s for _, s in running], workers, memory, max_memory):
+            ready.remove(step)
+            heapq.heappush(running, (now + durations.get(step, DEFAULT_DURATION), step))
+
+        now, step = heapq.heappop(running)
+        sorter.done(step)
+
+    return now
+
+
+def channel_rank(step: str) -> int:
+    """Rank steps by channel, so that grapher steps are executed first, then garden, then meadow, then snapshots."""
+    if "grapher://" in step:
+        return 0
+    elif "garden://" in step:
+        return 1
+    elif "meadow://" in step:
+        return 2
+    elif "snapshot://" in step:
+        return 3
+    else:
+        return 4
+
+
+def pick_ready(
+    ready: List[str],
+    priorities: Dict[str, float],
+    running: List[str],
+    workers: int,
+    memory: Optional[Dict[str, int]] = None,
+    max_memory: Optional[int] = None,
+) -> List[str]:
+    """
+    Pick steps from `ready` that should be started now, highest priority first. Steps with the
+    same priority are ordered by channel (grapher steps first to lessen the load on MySQL). Steps are
+    only started if there's a free worker and if their expected memory fits into
+    `max_memory` together with steps that are already running. A step is always started
+    if nothing else is running, even if it exceeds the budget.
+    """
+    memory = memory or {}
+    used_memory = sum(memory.get(s, 0) for s in running)
+    n_running = len(running)
+
+    picked = []
+    # stable sort keeps the original order of steps with the same priority and channel
+    for step in sorted(ready, key=lambda s: (-priorities.get(s, 0.0), channel_rank(s))):
+        if n_running >= workers:
+            break
+        step_memory = memory.get(step, 0)
+        if max_memory and n_running > 0 and used_memory + step_memory > max_memory:
+            continue
+        picked.append(step)
+        n_running += 1
+        used_memory += step_memory
+
+    return picked
+
+
+def peak_rss_from_rusage(maxrss: int) -> int:
+    """Convert `ru_maxrss` to bytes, it's in kilobytes on Linux and in bytes on macOS."""
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
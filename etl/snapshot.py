@@ -5,7 +5,7 @@ from contextlib import contextmanager
 from dataclasses import dataclass
 from multiprocessing import Lock
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Union
 
 import fasteners
 import owid.catalog.processing as pr
@@ -32,7 +32,7 @@ if TYPE_CHECKING:
     from dvc.repo import Repo
 
 from etl import config, paths
-from etl.files import RuntimeCache, yaml_dump
+from etl.files import RuntimeCache, checksum_file, checksum_file_dos2unix, yaml_dump
 
 # DVC is not thread-safe, so we need to lock it
 dvc_lock = Lock()
@@ -140,14 +140,42 @@ class Snapshot:
 
     def is_dirty(self) -> bool:
         """Return True if snapshot exists and is in DVC."""
-        from dvc.dvcfile import load_file
-
         if not self.path.exists():
             return True
 
         with open(self.metadata_path) as istream:
-            if "outs:\n" not in istream.read():
-                raise Exception(f"File {self.metadata_path} has not been added to DVC. Run snapshot script to add it.")
+            dvc_yaml = yaml.safe_load(istream)
+
+        if not dvc_yaml.get("outs"):
+            raise Exception(f"File {self.metadata_path} has not been added to DVC. Run snapshot script to add it.")
+
+        # fast path without DVC and its global lock, safe to run from many threads at once
+        if self._outs_match_local_files(dvc_yaml):
+            return False
+
+        # let DVC decide, it handles cases we don't (e.g. directories or modified files)
+        return self._dvc_is_dirty()
+
+    def _outs_match_local_files(self, dvc_yaml: Dict[str, Any]) -> bool:
+        """Return True if all outputs in .dvc file match local files by size and md5. Checksums
+        of local files are cached between runs, so this is fast for unchanged files."""
+        wdir = self.metadata_path.parent / dvc_yaml.get("wdir", ".")
+        for out in dvc_yaml["outs"]:
+            md5 = out.get("md5")
+            if not md5 or md5.endswith(".dir") or "path" not in out:
+                return False
+
+            path = wdir / out["path"]
+            if not path.is_file() or path.stat().st_size != out.get("size"):
+                return False
+
+            if not file_matches_dvc_md5(path, md5):
+                return False
+
+        return True
+
+    def _dvc_is_dirty(self) -> bool:
+        from dvc.dvcfile import load_file
 
         # See notes about locking in `pull` method.
         with dvc_lock, _unignore_backports(self.metadata_path):
@@ -523,10 +551,25 @@ def snapshot_catalog(match: str = r".*") -> Iterator[Snapshot]:
     so it's recommended to use `match` to filter the snapshots.
     :param match: pattern to match uri
     """
+    for path in snapshot_metadata_files(match):
+        yield Snapshot(str(path.relative_to(paths.SNAPSHOTS_DIR)).replace(".dvc", ""))
+
+
+def snapshot_metadata_files(match: str = r".*") -> List[Path]:
+    """Return paths of .dvc files of all snapshots with uri matching `match`. Unlike
+    `snapshot_catalog` it doesn't load them, so it's fast."""
+    dvc_files = []
     for path in paths.SNAPSHOTS_DIR.glob("**/*.dvc"):
         uri = str(path.relative_to(paths.SNAPSHOTS_DIR)).replace(".dvc", "")
         if re.search(match, uri):
-            yield Snapshot(uri)
+            dvc_files.append(path)
+    return dvc_files
+
+
+def file_matches_dvc_md5(path: Path, md5: str) -> bool:
+    """Return True if the file has given md5 from .dvc file. DVC 2 computes md5 of text files
+    with CRLF converted to LF, so both variants are accepted."""
+    return checksum_file(path) == md5 or checksum_file_dos2unix(path) == md5
 
 
 @contextmanager
@@ -2,6 +2,7 @@
 #  __init__.py
 #  steps
 #
+import functools
 import graphlib
 import hashlib
 import os
@@ -9,15 +10,17 @@ import re
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import warnings
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from glob import glob
 from importlib import import_module
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Protocol, Set, Union, cast
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Set, Tuple, TypeVar, Union, cast
 from urllib.parse import urlparse
 
 import fasteners
@@ -29,15 +32,17 @@ from owid import catalog
 from owid.walden import CATALOG as WALDEN_CATALOG
 from owid.walden import Dataset as WaldenDataset
 
-from etl import config, files, git, paths
+from etl import build_cache, config, files, git, paths, tracing
 from etl import grapher_helpers as gh
 from etl.db import get_engine
+from etl.scheduler import peak_rss_from_rusage
 from etl.snapshot import Snapshot
 
 log = structlog.get_logger()
 
 Graph = Dict[str, Set[str]]
 DAG = Dict[str, Any]
+T = TypeVar("T")
 
 
 ipynb_lock = fasteners.InterProcessLock(paths.BASE_DIR / ".dvc/tmp/ipynb_lock")
@@ -61,7 +66,22 @@ def compile_steps(
     steps = to_dependency_order(dag, includes, excludes, downstream=downstream, only=only)
 
     # parse the steps into Python objects
-    return [parse_step(name, dag) for name in steps]
+    graph = build_step_graph(dag, steps)
+    return [graph[name] for name in steps]
+
+
+def build_step_graph(dag: DAG, step_names: Iterable[str]) -> Dict[str, "Step"]:
+    """
+    Parse steps and all their dependencies into Step objects. There's exactly one object
+    per step URI and `dependencies` reference these shared objects, so results cached on
+    a step (see `cached_result`) are reused by all steps depending on it.
+
+    Return all parsed steps (including dependencies) by their URI.
+    """
+    graph: Dict[str, Step] = {}
+    for step_name in step_names:
+        graph[step_name] = parse_step(step_name, dag, graph)
+    return graph
 
 
 def to_dependency_order(
@@ -130,14 +150,27 @@ def traverse(graph: Graph, nodes: Set[str]) -> Graph:
 
 
 def load_dag(filename: Union[str, Path] = paths.DEFAULT_DAG_FILE) -> Dict[str, Any]:
-    return _load_dag(filename, {})
+    """Load DAG from YAML file and all its includes. Parsed DAG is cached and reused
+    until any of the YAML files changes."""
+    if not config.DAG_CACHE:
+        return _load_dag(filename, {})
 
+    cache = files.MtimeCache("dag", Path(filename).resolve())
+    dag = cache.get()
+    if dag is None:
+        dag_files: List[Path] = []
+        dag = _load_dag(filename, {}, dag_files)
+        cache.set(dag, dag_files)
+    return dag
 
-def _load_dag(filename: Union[str, Path], prev_dag: Dict[str, Any]):
+
+def _load_dag(filename: Union[str, Path], prev_dag: Dict[str, Any], dag_files: Optional[List[Path]] = None):
     """
     Recursive helper to 1) load a dag itself, and 2) load any sub-dags
-    included in the dag via 'include' statements
+    included in the dag via 'include' statements. Loaded files are appended to `dag_files`.
     """
+    if dag_files is not None:
+        dag_files.append(Path(filename))
     dag_yml = _load_dag_yaml(str(filename))
     curr_dag = _parse_dag_yaml(dag_yml)
 
@@ -154,7 +187,7 @@ def _load_dag(filename: Union[str, Path], prev_dag: Dict[str, Any]):
     curr_dag.update(prev_dag)
 
     for sub_dag_filename in dag_yml.get("include", []):
-        sub_dag = _load_dag(paths.BASE_DIR / sub_dag_filename, curr_dag)
+        sub_dag = _load_dag(paths.BASE_DIR / sub_dag_filename, curr_dag, dag_files)
         curr_dag.update(sub_dag)
 
     return curr_dag
@@ -193,13 +226,17 @@ def graph_nodes(graph: Graph) -> Set[str]:
     return all_steps
 
 
-def parse_step(step_name: str, dag: Dict[str, Any]) -> "Step":
-    "Convert each step's name into a step object that we can run."
+def parse_step(step_name: str, dag: Dict[str, Any], cache: Optional[Dict[str, "Step"]] = None) -> "Step":
+    """Convert each step's name into a step object that we can run. If `cache` is given,
+    steps already parsed into it are reused, so that a dependency shared by many steps is
+    a single object."""
+    if cache is not None and step_name in cache:
+        return cache[step_name]
+
     parts = urlparse(step_name)
     step_type = parts.scheme
     path = parts.netloc + parts.path
-    # dependencies are new objects
-    dependencies = [parse_step(s, dag) for s in dag.get(step_name, [])]
+    dependencies = [parse_step(s, dag, cache) for s in dag.get(step_name, [])]
 
     step: Step
     if step_type == "data":
@@ -238,6 +275,9 @@ def parse_step(step_name: str, dag: Dict[str, Any]) -> "Step":
     else:
         raise Exception(f"no recipe for executing step: {step_name}")
 
+    if cache is not None:
+        cache[step_name] = step
+
     return step
 
 
@@ -317,11 +357,33 @@ def extract_step_attributes(step: str) -> Dict[str, str]:
     return attributes
 
 
+def cached_result(method: Callable[[Any], T]) -> Callable[[Any], T]:
+    """Cache result of a step method (e.g. `is_dirty` or `checksum_output`) on the step object.
+    Caching is only active inside `cache_step_results`, because outputs of steps change
+    when they are run."""
+
+    @functools.wraps(method)
+    def wrapper(self: Any) -> T:
+        results = getattr(self, "_cached_results", None)
+        if results is None:
+            return method(self)
+
+        # lock per step, other threads checking the same dependency wait for its result
+        with self._cached_results_lock:
+            if method.__name__ not in results:
+                results[method.__name__] = method(self)
+            return results[method.__name__]
+
+    return wrapper
+
+
 class Step(Protocol):
     path: str
     is_public: bool = True
     version: str
     dependencies: List["Step"]
+    # peak memory of the last run in bytes, only known for steps running in a subprocess
+    peak_rss: Optional[int] = None
 
     def run(self) -> None:
         ...
@@ -389,6 +451,10 @@ class DataStep(Step):
         # make sure the enclosing folder is there
         self._dest_dir.parent.mkdir(parents=True, exist_ok=True)
 
+        # restore the output if the step was already built from the same inputs
+        if config.BUILD_CACHE and build_cache.restore(self.path, self.checksum_input(), self._dest_dir):
+            return
+
         ds_idex_mtime = self._dataset_index_mtime()
 
         sp = self._search_path
@@ -420,10 +486,14 @@ class DataStep(Step):
 
         self.after_run()
 
+        if config.BUILD_CACHE:
+            build_cache.store(self.path, dataset.metadata.source_checksum, self._dest_dir)
+
     def after_run(self) -> None:
         """Optional post-hook, needs to resave the dataset again."""
         ...
 
+    @cached_result
     def is_dirty(self) -> bool:
         if not self.has_existing_data() or any(d.is_dirty() for d in self.dependencies):
             return True
@@ -456,6 +526,7 @@ class DataStep(Step):
             or sp.with_suffix(".ipynb").exists()
         )
 
+    @cached_result
     def checksum_input(self) -> str:
         "Return the MD5 of all ingredients for making this step."
         checksums = {
@@ -481,6 +552,7 @@ class DataStep(Step):
 
         return catalog.Dataset(self._dest_dir.as_posix())
 
+    @cached_result
     def checksum_output(self) -> str:
         return self._output_dataset.checksum()
 
@@ -529,6 +601,9 @@ class DataStep(Step):
         """
         Import the Python module for this step and call run() on it.
         """
+        if config.FORK_STEPS:
+            return self._run_py_forked()
+
         # use a subprocess to isolate each step from the others, and avoid state bleeding
         # between them
         args = []
@@ -548,14 +623,37 @@ class DataStep(Step):
             ]
         )
 
+        env = os.environ.copy()
+        if tracing.enabled():
+            env[tracing.SPAWNED_AT_ENV] = str(time.time())
+
         try:
-            subprocess.check_call(args, env=os.environ.copy())
+            self.peak_rss = _check_call_peak_rss(args, env=env)
         except subprocess.CalledProcessError:
             # swallow this exception and just exit -- the important stack trace
             # will already have been printed to stderr
             print(f'\nCOMMAND: {" ".join(args)}', file=sys.stderr)
             sys.exit(1)
 
+    def _run_py_forked(self) -> None:
+        """
+        Import the Python module for this step and call run() on it in a process forked
+        from the current one. Modules imported by the parent are reused, but the step
+        itself runs isolated with the same memory limit as the subprocess in _run_py.
+        """
+        from etl.run_python_step import run_step_in_fork
+
+        exit_code, self.peak_rss = run_step_in_fork(
+            str(self),
+            self._dest_dir.as_posix(),
+            ipdb=config.IPDB_ENABLED,
+            max_virtual_memory=config.MAX_VIRTUAL_MEMORY_LINUX,
+        )
+        if exit_code != 0:
+            # the important stack trace will already have been printed to stderr
+            print(f"\nFORKED STEP: {self} (exit code {exit_code})", file=sys.stderr)
+            sys.exit(1)
+
     def _run_notebook(self) -> None:
         "Run a parameterised Jupyter notebook."
         # don't import it again if it's already imported to avoid
@@ -599,6 +697,7 @@ class WaldenStep(Step):
         "Ensure the dataset we're looking for is there."
         self._walden_dataset.ensure_downloaded(quiet=True)
 
+    @cached_result
     def is_dirty(self) -> bool:
         if not Path(self._walden_dataset.local_path).exists():
             return True
@@ -611,6 +710,7 @@ class WaldenStep(Step):
     def has_existing_data(self) -> bool:
         return True
 
+    @cached_result
     def checksum_output(self) -> str:
         if not self._walden_dataset.md5:
             raise Exception(f"walden dataset is missing checksum: {self}")
@@ -660,8 +760,11 @@ class SnapshotStep(Step):
 
     def run(self) -> None:
         snap = Snapshot(self.path)
-        snap.pull(force=True)
+        # file might have been already downloaded by prefetch
+        if snap.is_dirty():
+            snap.pull(force=True)
 
+    @cached_result
     def is_dirty(self) -> bool:
         snap = Snapshot(self.path)
         return snap.is_dirty()
@@ -669,6 +772,7 @@ class SnapshotStep(Step):
     def has_existing_data(self) -> bool:
         return True
 
+    @cached_result
     def checksum_output(self) -> str:
         # NOTE: we could use the checksum from `_dvc_path` to
         # speed this up. Test the performance on
@@ -698,7 +802,8 @@ class SnapshotStepPrivate(SnapshotStep):
     def run(self) -> None:
         snap = Snapshot(self.path)
         assert snap.metadata.is_public is False
-        snap.pull(force=True)
+        if snap.is_dirty():
+            snap.pull(force=True)
 
 
 class GrapherStep(Step):
@@ -735,6 +840,7 @@ class GrapherStep(Step):
         """Grapher dataset we are upserting."""
         return self.data_step._output_dataset
 
+    @cached_result
     def is_dirty(self) -> bool:
         import etl.grapher_import as gi
 
@@ -747,6 +853,7 @@ class GrapherStep(Step):
 
     def run(self) -> None:
         import etl.grapher_import as gi
+        from apps.backport.datasync.datasync import get_uploader
 
         if "DATA_API_ENV" not in os.environ:
             warnings.warn(f"DATA_API_ENV not set, using '{config.DATA_API_ENV}'")
@@ -766,32 +873,24 @@ class GrapherStep(Step):
             dataset.metadata.sources,
         )
 
-        with ThreadPoolExecutor(max_workers=config.GRAPHER_INSERT_WORKERS) as thread_pool:
-            futures = []
-            verbose = True
-            i = 0
+        # entities are shared by all tables and indicators of the dataset
+        entity_resolver = gh.EntityResolver()
 
-            # NOTE: multiple tables will be saved under a single dataset, this could cause problems if someone
-            # is fetching the whole dataset from data-api as they would receive all tables merged in a single
-            # table. This won't be a problem after we introduce the concept of "tables"
-            for table in dataset:
-                assert not table.empty, f"table {table.metadata.short_name} is empty"
-
-                # if GRAPHER_FILTER is set, only upsert matching columns
-                if config.GRAPHER_FILTER:
-                    cols = table.filter(regex=config.GRAPHER_FILTER).columns.tolist()
-                    cols += [c for c in table.columns if c in {"year", "country"} and c not in cols]
-                    table = table.loc[:, cols]
-
-                table = gh._adapt_table_for_grapher(table)
-
-                for t in gh._yield_wide_table(table, na_action="drop"):
-                    i += 1
-                    assert len(t.columns) == 1
-                    catalog_path = f"{self.path}/{table.metadata.short_name}#{t.columns[0]}"
+        if config.GRAPHER_BULK_UPSERT:
+            variable_upsert_results = gi.upsert_tables(
+                engine,
+                lambda: self._grapher_tables(dataset, entity_resolver),
+                dataset_upsert_results,
+                entity_resolver=entity_resolver,
+            )
+        else:
+            with ThreadPoolExecutor(max_workers=config.GRAPHER_INSERT_WORKERS) as thread_pool:
+                futures = []
+                verbose = True
 
+                for i, (t, catalog_path, dimensions) in enumerate(self._grapher_tables(dataset, entity_resolver)):
                     # stop logging to stop cluttering logs
-                    if i > 20 and verbose:
+                    if i >= 20 and verbose:
                         verbose = False
                         thread_pool.submit(
                             lambda: (time.sleep(10), log.info("upsert_dataset.continue_without_logging"))
@@ -805,12 +904,16 @@ class GrapherStep(Step):
                             t,
                             dataset_upsert_results,
                             catalog_path=catalog_path,
-                            dimensions=(t.iloc[:, 0].metadata.additional_info or {}).get("dimensions"),
+                            dimensions=dimensions,
                             verbose=verbose,
+                            entity_resolver=entity_resolver,
                         )
                     )
 
-            variable_upsert_results = [future.result() for future in as_completed(futures)]
+                variable_upsert_results = [future.result() for future in as_completed(futures)]
+
+        # uploads to R2 of all grapher steps so far
+        log.info("upsert_dataset.r2_uploads", **get_uploader().metrics.to_dict())
 
         if not config.GRAPHER_FILTER:
             self._cleanup_ghost_resources(dataset_upsert_results, variable_upsert_results)
@@ -818,6 +921,30 @@ class GrapherStep(Step):
             # set checksum and updatedAt timestamps after all data got inserted
             gi.set_dataset_checksum_and_editedAt(dataset_upsert_results.dataset_id, self.data_step.checksum_input())
 
+    def _grapher_tables(
+        self, dataset: catalog.Dataset, entity_resolver: Optional[gh.EntityResolver] = None
+    ) -> Iterator[Tuple[catalog.Table, str, Optional[Dict]]]:
+        """Yield table with entity_id, year and value for every indicator of the dataset, together with its
+        catalog path and dimensions."""
+        # NOTE: multiple tables will be saved under a single dataset, this could cause problems if someone
+        # is fetching the whole dataset from data-api as they would receive all tables merged in a single
+        # table. This won't be a problem after we introduce the concept of "tables"
+        for table in dataset:
+            assert not table.empty, f"table {table.metadata.short_name} is empty"
+
+            # if GRAPHER_FILTER is set, only upsert matching columns
+            if config.GRAPHER_FILTER:
+                cols = table.filter(regex=config.GRAPHER_FILTER).columns.tolist()
+                cols += [c for c in table.columns if c in {"year", "country"} and c not in cols]
+                table = table.loc[:, cols]
+
+            table = gh._adapt_table_for_grapher(table, entity_resolver=entity_resolver)
+
+            for t in gh._yield_wide_table(table, na_action="drop"):
+                assert len(t.columns) == 1
+                catalog_path = f"{self.path}/{table.metadata.short_name}#{t.columns[0]}"
+                yield t, catalog_path, (t.iloc[:, 0].metadata.additional_info or {}).get("dimensions")
+
     def checksum_output(self) -> str:
         raise NotImplementedError("GrapherStep should not be used as an input")
 
@@ -873,6 +1000,7 @@ class GithubStep(Step):
     def __str__(self) -> str:
         return f"github://{self.path}"
 
+    @cached_result
     def is_dirty(self) -> bool:
         # always poll the git repo
         return not self.gh_repo.is_up_to_date()
@@ -881,6 +1009,7 @@ class GithubStep(Step):
         # either clone the repo, or update it
         self.gh_repo.ensure_cloned()
 
+    @cached_result
     def checksum_output(self) -> str:
         return self.gh_repo.latest_sha
 
@@ -913,6 +1042,7 @@ class ETagStep(Step):
         # nothing is done for this step
         pass
 
+    @cached_result
     def checksum_output(self) -> str:
         return get_etag(f"https://{self.path}")
 
@@ -976,40 +1106,58 @@ class BackportStepPrivate(PrivateMixin, BackportStep):
 
 
 def select_dirty_steps(steps: List[Step], workers: int = 1) -> List[Step]:
-    """Select dirty steps using threadpool."""
-    # dynamically add cached version of `is_dirty` to all steps to avoid re-computing
-    # this is a bit hacky, but it's the easiest way to only cache it here without
-    # affecting the rest
-    cache_is_dirty = files.RuntimeCache()
-    for s in steps:
-        _add_is_dirty_cached(s, cache_is_dirty)
-
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        steps_dirty = executor.map(_step_is_dirty, steps)  # type: ignore
-        steps = [s for s, is_dirty in zip(steps, steps_dirty) if is_dirty]
-
-    cache_is_dirty.clear()
+    """Select dirty steps using threadpool. Results of `is_dirty` and checksums are cached
+    on steps while doing it, so that shared dependencies are only checked once."""
+    with cache_step_results(steps):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            steps_dirty = executor.map(_step_is_dirty, steps)  # type: ignore
+            steps = [s for s, is_dirty in zip(steps, steps_dirty) if is_dirty]
 
     return steps
 
 
 def _step_is_dirty(s: Step) -> bool:
-    return s.is_dirty()
-
-
-def _cached_is_dirty(self: Step, cache: files.RuntimeCache) -> bool:
-    key = str(self)
-    if key not in cache:
-        cache.add(key, self._is_dirty())  # type: ignore
-    return cache[key]  # type: ignore
-
-
-def _add_is_dirty_cached(s: Step, cache: files.RuntimeCache) -> None:
-    """Save copy of a method to _is_dirty and replace it with a cached version."""
-    s._is_dirty = s.is_dirty  # type: ignore
-    s.is_dirty = lambda s=s: _cached_is_dirty(s, cache)  # type: ignore
-    for dep in getattr(s, "dependencies", []):
-        _add_is_dirty_cached(dep, cache)
+    with tracing.span("is_dirty", cat="dirty", step=str(s)):
+        return s.is_dirty()
+
+
+@contextmanager
+def cache_step_results(steps: Iterable[Step]) -> Iterator[None]:
+    """Cache results of methods decorated with `cached_result` for given steps and all their
+    dependencies until the end of the block."""
+    all_steps = list(_walk_steps(steps))
+    for s in all_steps:
+        s._cached_results = {}  # type: ignore
+        # reentrant, cached methods call other cached methods of the same step
+        s._cached_results_lock = threading.RLock()  # type: ignore
+    try:
+        yield
+    finally:
+        for s in all_steps:
+            s._cached_results = None  # type: ignore
+
+
+def _walk_steps(steps: Iterable[Step]) -> Iterator[Step]:
+    """Iterate over steps and all their dependencies, each step object only once."""
+    seen: Set[int] = set()
+    to_visit = list(steps)
+    while to_visit:
+        s = to_visit.pop()
+        if id(s) in seen:
+            continue
+        seen.add(id(s))
+        yield s
+        to_visit.extend(getattr(s, "dependencies", []))
+
+
+def _check_call_peak_rss(args: List[str], env: Dict[str, str]) -> int:
+    """Like subprocess.check_call, but return peak resident memory of the process in bytes."""
+    proc = subprocess.Popen(args, env=env)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+    return peak_rss_from_rusage(rusage.ru_maxrss)
 
 
 def _uses_old_schema(e: KeyError) -> bool:
@@ -0,0 +1,169 @@
+#
+#  tracing.py
+#
+
+"""
+Timeline of an ETL run that can be opened in chrome://tracing, https://ui.perfetto.dev
+or https://speedscope.app. Tracing is enabled by `etl --profile`.
+
+Steps run in subprocesses, forks and worker processes, so every process appends events to
+a shared file given by the ETL_TRACE_FILE environment variable (inherited by child processes).
+The file is converted to a Chrome trace at the end of the run.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from etl import config, paths
+
+TRACE_FILE_ENV = "ETL_TRACE_FILE"
+# set by the parent just before starting a step subprocess to measure its startup time
+SPAWNED_AT_ENV = "ETL_TRACE_SPAWNED_AT"
+
+PROFILES_DIR = paths.CACHE_DIR / "profiles"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def enable(events_file: Path) -> None:
+    """Record events of this process and all processes started from it to `events_file`."""
+    events_file.parent.mkdir(parents=True, exist_ok=True)
+    events_file.touch()
+    os.environ[TRACE_FILE_ENV] = events_file.as_posix()
+
+
+def disable() -> None:
+    os.environ.pop(TRACE_FILE_ENV, None)
+
+
+def enabled() -> bool:
+    return TRACE_FILE_ENV in os.environ
+
+
+def record_span(name: str, start: float, end: float, cat: str = "etl", **args: Any) -> None:
+    """Record event that started and ended at given times (seconds since epoch)."""
+    events_file = os.environ.get(TRACE_FILE_ENV)
+    if not events_file:
+        return
+    _write_event(
+        events_file,
+        {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": int(start * 1e6),
+            "dur": int((end - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        },
+    )
+
+
+@contextmanager
+def span(name: str, cat: str = "etl", **args: Any) -> Iterator[None]:
+    """Record duration of the block, no-op if tracing is disabled."""
+    if not enabled():
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.time(), cat=cat, **args)
+
+
+def traced(name: str, cat: str = "etl") -> Callable[[F], F]:
+    """Decorator recording duration of every call of the function."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, cat=cat):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def set_process_name(name: str) -> None:
+    """Label the current process in the timeline (e.g. with the step it runs)."""
+    events_file = os.environ.get(TRACE_FILE_ENV)
+    if events_file:
+        _write_event(events_file, {"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": name}})
+
+
+def record_startup(name: str) -> None:
+    """Record time between the parent spawning this process and now."""
+    spawned_at = os.environ.get(SPAWNED_AT_ENV)
+    if spawned_at:
+        record_span("startup", float(spawned_at), time.time(), cat="startup", step=name)
+
+
+_instrumented = False
+
+
+def instrument_libraries() -> None:
+    """Record time spent in `Dataset.save` and `repack_frame`. Functions are only wrapped
+    if tracing is enabled, so there's no overhead otherwise."""
+    global _instrumented
+    if _instrumented or not enabled():
+        return
+
+    from owid.catalog import Dataset, tables
+
+    Dataset.save = traced("Dataset.save", cat="save")(Dataset.save)  # type: ignore
+    tables.repack_frame = traced("repack_frame", cat="repack")(tables.repack_frame)  # type: ignore
+    _instrumented = True
+
+
+@contextmanager
+def profile_step(step_name: str) -> Iterator[None]:
+    """Run the block with cProfile if PROFILE_STEPS is set and save stats to
+    .cache/profiles/<step>.prof, they can be viewed with e.g. `snakeviz` or converted
+    to a flamegraph with `flameprof`."""
+    if not config.PROFILE_STEPS:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_file = PROFILES_DIR / (step_name.replace("://", "/") + ".prof")
+        profile_file.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile_file)
+
+
+def export_chrome_trace(events_file: Path, trace_file: Optional[Path] = None) -> Path:
+    """Convert recorded events to Chrome trace JSON and return its path."""
+    trace_file = trace_file or events_file.with_suffix(".json")
+    with open(events_file) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+
+    with open(trace_file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    return trace_file
+
+
+def _write_event(events_file: str, event: dict) -> None:
+    # a single write to a file opened with O_APPEND is not interleaved with writes of
+    # other processes
+    line = (json.dumps(event) + "\n").encode()
+    fd = os.open(events_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
@@ -0,0 +1,196 @@
+#
+#  checksums.py
+#
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+# files modified less than this many seconds ago are not cached, their mtime could
+# still be the same after another write with the same size (the "racy git" problem)
+RACY_MTIME_SECONDS = 2
+
+# kinds of checksums stored in the cache and their tables
+CHECKSUM_TABLES = {"md5": "checksums", "md5_dos2unix": "checksums_dos2unix"}
+
+
+class ChecksumCache:
+    """
+    Persistent cache of file checksums stored in SQLite. An entry is only valid if the
+    file still has the same size, mtime and inode as when it was checksummed, so any
+    change to the file invalidates it.
+
+    The cache is safe to use from multiple threads and processes. If the database is
+    locked or broken, checksums are computed without using it.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # connections can't be shared by threads or forked processes
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path.as_posix(), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for table in CHECKSUM_TABLES.values():
+                conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        inode INTEGER NOT NULL,
+                        md5 TEXT NOT NULL
+                    )
+                    """
+                )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, filename: str, stat: os.stat_result, kind: str = "md5") -> Optional[str]:
+        row = (
+            self._connection()
+            .execute(
+                f"SELECT md5 FROM {CHECKSUM_TABLES[kind]} WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                (filename, stat.st_size, stat.st_mtime_ns, stat.st_ino),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, filename: str, stat: os.stat_result, md5: str, kind: str = "md5") -> None:
+        self._connection().execute(
+            f"INSERT OR REPLACE INTO {CHECKSUM_TABLES[kind]} (path, size, mtime_ns, inode, md5) VALUES (?, ?, ?, ?, ?)",
+            (filename, stat.st_size, stat.st_mtime_ns, stat.st_ino, md5),
+        )
+
+    def checksum(self, filename: Union[str, Path], compute: Callable[[str], str], kind: str = "md5") -> str:
+        """Return cached checksum of given kind of a file or compute it with `compute` and store it."""
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+
+        try:
+            md5 = self.get(filename, stat, kind)
+        except sqlite3.Error:
+            return compute(filename)
+
+        if md5 is None:
+            md5 = compute(filename)
+            if time.time() - stat.st_mtime > RACY_MTIME_SECONDS:
+                try:
+                    self.set(filename, stat, md5, kind)
+                except sqlite3.Error:
+                    pass
+
+        return md5
+
+    def clear(self) -> None:
+        for table in CHECKSUM_TABLES.values():
+            self._connection().execute(f"DELETE FROM {table}")
+
+
+# persistent cache used by `checksum_file`, disabled by default
+_CHECKSUM_CACHE: Optional[ChecksumCache] = None
+
+
+def enable_checksum_cache(path: Union[str, Path]) -> ChecksumCache:
+    """Store checksums of files in a persistent SQLite database at given path."""
+    global _CHECKSUM_CACHE
+    if _CHECKSUM_CACHE is None or _CHECKSUM_CACHE.path != Path(path):
+        _CHECKSUM_CACHE = ChecksumCache(path)
+    return _CHECKSUM_CACHE
+
+
+def disable_checksum_cache() -> None:
+    global _CHECKSUM_CACHE
+    _CHECKSUM_CACHE = None
+
+
+def get_checksum_cache() -> Optional[ChecksumCache]:
+    return _CHECKSUM_CACHE
+
+
+def checksum_file_nocache(filename: Union[str, Path]) -> str:
+    "Return the md5 hex digest of the file without using cache."
+    chunk_size = 2**20  # 1MB
+    _hash = hashlib.md5()
+    with open(filename, "rb") as istream:
+        chunk = istream.read(chunk_size)
+        while chunk:
+            _hash.update(chunk)
+            chunk = istream.read(chunk_size)
+
+    return _hash.hexdigest()
+
+
+def checksum_file(filename: Union[str, Path]) -> str:
+    "Return the md5 hex digest of the file, using persistent cache if enabled."
+    if _CHECKSUM_CACHE is None:
+        return checksum_file_nocache(filename)
+    return _CHECKSUM_CACHE.checksum(filename, checksum_file_nocache)
+
+
+class Dos2UnixMD5:
+    """Incremental md5 of data with CRLF line endings converted to LF, which is how DVC 2 computes md5 of
+    text files. Data can be split into chunks anywhere, a trailing CR of a chunk is held back until the
+    next one, so that CRLF split between two chunks is converted too."""
+
+    def __init__(self) -> None:
+        self._hash = hashlib.md5()
+        self._cr = b""
+
+    def update(self, chunk: bytes) -> None:
+        chunk = self._cr + chunk
+        if chunk.endswith(b"\r"):
+            chunk, self._cr = chunk[:-1], b"\r"
+        else:
+            self._cr = b""
+        self._hash.update(chunk.replace(b"\r\n", b"\n"))
+
+    def hexdigest(self) -> str:
+        _hash = self._hash.copy()
+        _hash.update(self._cr)
+        return _hash.hexdigest()
+
+
+def checksum_file_dos2unix_nocache(filename: Union[str, Path]) -> str:
+    "Return the md5 hex digest of the file with CRLF converted to LF without using cache."
+    chunk_size = 2**20  # 1MB
+    _hash = Dos2UnixMD5()
+    with open(filename, "rb") as istream:
+        chunk = istream.read(chunk_size)
+        while chunk:
+            _hash.update(chunk)
+            chunk = istream.read(chunk_size)
+
+    return _hash.hexdigest()
+
+
+def checksum_file_dos2unix(filename: Union[str, Path]) -> str:
+    "Return the md5 hex digest of the file with CRLF converted to LF, using persistent cache if enabled."
+    if _CHECKSUM_CACHE is None:
+        return checksum_file_dos2unix_nocache(filename)
+    return _CHECKSUM_CACHE.checksum(filename, checksum_file_dos2unix_nocache, kind="md5_dos2unix")
+
+
+def checksum_path(path: Union[str, Path]) -> str:
+    """Return the md5 hex digest of a file, or of relative paths and checksums of all files
+    in a directory (e.g. partitioned table)."""
+    if not os.path.isdir(path):
+        return checksum_file(path)
+
+    _hash = hashlib.md5()
+    for filename in sorted(Path(path).rglob("*")):
+        if filename.is_file():
+            _hash.update(filename.relative_to(path).as_posix().encode())
+            _hash.update(bytes.fromhex(checksum_file(filename)))
+    return _hash.hexdigest()
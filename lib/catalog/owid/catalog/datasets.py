@@ -16,18 +16,17 @@ from typing import Iterator, List, Literal, Optional, Union
 import numpy as np
 import pandas as pd
 import yaml
-from _hashlib import HASH
 
-from . import tables, utils
+from . import checksums, tables, utils
 from .meta import SOURCE_EXISTS_OPTIONS, DatasetMeta, TableMeta
 from .processing_log import disable_processing_log
 from .properties import metadata_property
 
-FileFormat = Literal["csv", "feather", "parquet"]
+FileFormat = Literal["csv", "feather", "parquet", "parquet_partitioned"]
 
 # the formats we can serialise and deserialise; in some cases they
 # will be tried in this order if we don't specify one explicitly
-SUPPORTED_FORMATS: List[FileFormat] = ["feather", "parquet", "csv"]
+SUPPORTED_FORMATS: List[FileFormat] = ["feather", "parquet", "csv", "parquet_partitioned"]
 
 # the formats we generate by default
 DEFAULT_FORMATS: List[FileFormat] = ["feather"]
@@ -93,6 +92,8 @@ class Dataset:
         table: tables.Table,
         formats: List[FileFormat] = DEFAULT_FORMATS,
         repack: bool = True,
+        partition_by: Optional[str] = None,
+        partition_size: Optional[int] = None,
     ) -> None:
         """
         Add this table to the dataset by saving it in the dataset's folder. By default we
@@ -101,6 +102,9 @@ class Dataset:
 
         :param repack: if True, try to cast column types to the smallest possible type (e.g. float64 -> float32)
             to reduce binary file size. Consider using False when your dataframe is large and the repack is failing.
+        :param partition_by: Column to partition by for `parquet_partitioned` format, first column of primary
+            key by default.
+        :param partition_size: Partition `partition_by` column into ranges of this size (e.g. 10 for decades).
         """
 
         utils.validate_underscore(table.metadata.short_name, "Table's short_name")
@@ -148,15 +152,36 @@ class Dataset:
                 raise Exception(f"Format '{format}'' is not supported")
 
             table_filename = join(self.path, table.metadata.checked_name + f".{format}")
-            table.to(table_filename, repack=repack)
+            table.to(table_filename, repack=repack, partition_by=partition_by, partition_size=partition_size)
 
     def __getitem__(self, name: str) -> tables.Table:
+        return self.read(name)
+
+    def read(
+        self,
+        name: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[tables.Filters] = None,
+        partitions: Optional[List[str]] = None,
+    ) -> tables.Table:
+        """
+        Read table from the dataset, optionally only some of its columns and rows. This is much
+        faster than loading the whole table if you only need a part of a large table.
+
+        :param columns: Only load these columns (primary key is always loaded).
+        :param filters: Only load rows matching these filters in pyarrow's format, e.g.
+            [("year", ">=", 2000), ("country", "in", ["France", "Germany"])].
+        :param partitions: Only load these partitions of a `parquet_partitioned` table.
+        """
         stem = self.path / Path(name)
 
-        for format in SUPPORTED_FORMATS:
+        # only partitioned tables can be read by partitions
+        formats = SUPPORTED_FORMATS if partitions is None else ["parquet_partitioned"]
+
+        for format in formats:
             path = stem.with_suffix(f".{format}")
             if path.exists():
-                t = tables.Table.read(path)
+                t = tables.Table.read(path, columns=columns, filters=filters, partitions=partitions)
                 # dataset metadata might have been updated, refresh it
                 t.metadata.dataset = self.metadata
                 return t
@@ -184,13 +209,30 @@ class Dataset:
 
         self.metadata.save(self._index_file)
 
-        # Update the copy of this datasets metadata in every table in the set.
+        # Update the copy of this datasets metadata in every table in the set. Only JSON sidecars
+        # are rewritten, data files don't have to be read.
         # TODO: this entire part should go away and we should make t.metadata.dataset read only
         for table_name in self.table_names:
-            with disable_processing_log():
-                table = self[table_name]
-            table.metadata.dataset = self.metadata
-            table._save_metadata(join(self.path, table.metadata.checked_name + ".meta.json"))
+            self._save_table_dataset_metadata(table_name)
+
+    def _save_table_dataset_metadata(self, table_name: str) -> None:
+        """Replace dataset metadata in the table's .meta.json. The result is the same as loading the
+        table, setting its `metadata.dataset` and saving its metadata again."""
+        with open(join(self.path, table_name + ".meta.json")) as istream:
+            metadata = json.load(istream)
+
+        table_meta = TableMeta.from_dict(metadata)
+        table_meta.dataset = self.metadata
+
+        new_metadata = table_meta.to_dict()
+        new_metadata["primary_key"] = metadata.get("primary_key", [])
+        # fields were written by `VariableMeta.to_dict` already, parsing them again is slow
+        new_metadata["fields"] = metadata.get("fields", {})
+        if "partitions" in metadata:
+            new_metadata["partitions"] = metadata["partitions"]
+
+        with open(join(self.path, table_meta.checked_name + ".meta.json"), "w") as ostream:
+            json.dump(new_metadata, ostream, indent=2, default=str)
 
     def update_metadata(
         self,
@@ -289,14 +331,15 @@ class Dataset:
 
     def checksum(self) -> str:
         "Return a MD5 checksum of all data and metadata in the dataset."
+        # checksums of files are looked up in the persistent cache if it's enabled
         _hash = hashlib.md5()
-        _hash.update(checksum_file(self._index_file).digest())
+        _hash.update(bytes.fromhex(checksums.checksum_file(self._index_file)))
 
         for data_file in self._data_files:
-            _hash.update(checksum_file(data_file).digest())
+            _hash.update(bytes.fromhex(checksums.checksum_path(data_file)))
 
             metadata_file = Path(data_file).with_suffix(".meta.json").as_posix()
-            _hash.update(checksum_file(metadata_file).digest())
+            _hash.update(bytes.fromhex(checksums.checksum_file(metadata_file)))
 
         return _hash.hexdigest()
 
@@ -308,17 +351,28 @@ for k in DatasetMeta.__dataclass_fields__:
     setattr(Dataset, k, metadata_property(k))
 
 
-def checksum_file(filename: str) -> HASH:
-    "Return the MD5 checksum of a given file."
-    chunk_size = 2**20  # 1MB
-    checksum = hashlib.md5()
-    with open(filename, "rb") as istream:
-        chunk = istream.read(chunk_size)
-        while chunk:
-            checksum.update(chunk)
-            chunk = istream.read(chunk_size)
+class _FileChecksum:
+    """Checksum returned by deprecated `checksum_file`, with the same interface as the hashlib object it used to
+    return."""
+
+    def __init__(self, hexdigest: str) -> None:
+        self._hexdigest = hexdigest
+
+    def hexdigest(self) -> str:
+        return self._hexdigest
+
+    def digest(self) -> bytes:
+        return bytes.fromhex(self._hexdigest)
+
 
-    return checksum
+def checksum_file(filename: str) -> _FileChecksum:
+    "Return the MD5 checksum of a given file. Deprecated, use `owid.catalog.checksums.checksum_file` instead."
+    warnings.warn(
+        "owid.catalog.datasets.checksum_file is deprecated, use owid.catalog.checksums.checksum_file instead",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return _FileChecksum(checksums.checksum_file(filename))
 
 
 class PrimaryKeyMissing(Exception):
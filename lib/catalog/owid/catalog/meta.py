@@ -527,19 +527,25 @@ def _hash_dataclass(dataclass: Any) -> int:
 
 
 def _deepcopy_dataclass(dc) -> Any:
-    """Create a deep copy of a dataclass. This is much faster than running copy.deepcopy."""
-    dc = dataclasses.replace(dc)
-    for k, v in dc.__dict__.items():
-        if is_dataclass(v):
-            setattr(dc, k, _deepcopy_dataclass(v))
-        elif isinstance(v, list):
-            lis = [_deepcopy_dataclass(x) if is_dataclass(x) else x for x in v]
+    """Create a deep copy of a dataclass. This is much faster than running copy.deepcopy.
+
+    Frozen dataclasses (such as entries of the processing log) cannot be mutated and are shared
+    with the copy. Fields are copied without calling `__init__` and `__post_init__` again."""
+    cls = type(dc)
+    if cls.__dataclass_params__.frozen:
+        return dc
+
+    new_dc = object.__new__(cls)
+    for k in cls.__dataclass_fields__:
+        v = dc.__dict__[k]
+        if isinstance(v, list):
+            v = [_deepcopy_dataclass(x) if is_dataclass(x) else x for x in v]
             # make sure to preserve the type of the list if we subclass it
-            if type(v) != list:  # noqa
-                lis = type(v)(lis)
-            setattr(dc, k, lis)
+            if type(dc.__dict__[k]) != list:  # noqa
+                v = type(dc.__dict__[k])(v)
         elif isinstance(v, dict):
-            setattr(dc, k, {x: _deepcopy_dataclass(y) if is_dataclass(y) else y for x, y in v.items()})
-        else:
-            pass
-    return dc
+            v = {x: _deepcopy_dataclass(y) if is_dataclass(y) else y for x, y in v.items()}
+        elif is_dataclass(v):
+            v = _deepcopy_dataclass(v)
+        new_dc.__dict__[k] = v
+    return new_dc
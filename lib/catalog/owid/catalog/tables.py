@@ -3,8 +3,11 @@
 #
 
 import json
+import os
+import shutil
 import types
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from os.path import dirname, join, splitext
 from pathlib import Path
 from typing import (
@@ -22,10 +25,13 @@ from typing import (
     cast,
     overload,
 )
+from urllib.parse import quote, unquote
 
 import numpy as np
 import pandas as pd
 import pyarrow
+import pyarrow.dataset
+import pyarrow.feather as feather
 import pyarrow.parquet as pq
 import rdata
 import structlog
@@ -55,6 +61,34 @@ METADATA_FIELDS = list(SCHEMA["properties"])
 # New type required for pandas reading functions.
 AnyStr = TypeVar("AnyStr", str, bytes)
 
+# Row filters in pyarrow's disjunctive normal form, e.g. [("year", ">=", 2000), ("country", "in", ["France"])]
+# or [[...], [...]] for OR of AND groups
+Filters = Union[List[Tuple[str, str, Any]], List[List[Tuple[str, str, Any]]]]
+
+FeatherCompression = Literal["zstd", "lz4", "uncompressed"]
+
+# partitions of the `parquet_partitioned` format are directories with hive-style names such as
+# `country=France`, rows with missing partition value go to this one
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def feather_compression() -> FeatherCompression:
+    """Compression of feather files set by OWID_FEATHER_COMPRESSION environment variable. The default
+    "zstd" gives the smallest files, "lz4" is faster to decompress and "uncompressed" files can be
+    memory-mapped without any decompression (see `feather_memory_map`)."""
+    compression = os.getenv("OWID_FEATHER_COMPRESSION", "zstd")
+    if compression not in ("zstd", "lz4", "uncompressed"):
+        raise ValueError(f"unknown feather compression: {compression}")
+    return cast(FeatherCompression, compression)
+
+
+def feather_memory_map() -> bool:
+    """Memory-map local feather files when reading them? Enabled by OWID_FEATHER_MMAP environment variable.
+    Numeric columns of uncompressed files are then zero-copy views of the file, shared through the page
+    cache by all processes that read it. Such columns are read-only and have to be copied before
+    modifying them in place."""
+    return os.getenv("OWID_FEATHER_MMAP", "") in ("True", "true", "1")
+
 
 class Table(pd.DataFrame):
     # metdata about the entire table
@@ -137,9 +171,18 @@ class Table(pd.DataFrame):
     def primary_key(self) -> List[str]:
         return [n for n in self.index.names if n]
 
-    def to(self, path: Union[str, Path], repack: bool = True) -> None:
+    def to(
+        self,
+        path: Union[str, Path],
+        repack: bool = True,
+        partition_by: Optional[str] = None,
+        partition_size: Optional[int] = None,
+    ) -> None:
         """
         Save this table in one of our SUPPORTED_FORMATS.
+
+        :param partition_by: Only for `parquet_partitioned`, see `to_partitioned_parquet`.
+        :param partition_size: Only for `parquet_partitioned`, see `to_partitioned_parquet`.
         """
         # Add entry in the processing log about operation "save".
         self = update_processing_logs_when_saving_table(table=self, path=path)
@@ -157,22 +200,50 @@ class Table(pd.DataFrame):
         elif path.endswith(".parquet"):
             return self.to_parquet(path, repack=repack)
 
+        elif path.endswith(".parquet_partitioned"):
+            return self.to_partitioned_parquet(
+                path, repack=repack, partition_by=partition_by, partition_size=partition_size
+            )
+
         else:
             raise ValueError(f"could not detect a suitable format to save to: {path}")
 
     @classmethod
-    def read(cls, path: Union[str, Path]) -> "Table":
+    def read(
+        cls,
+        path: Union[str, Path],
+        columns: Optional[List[str]] = None,
+        filters: Optional[Filters] = None,
+        partitions: Optional[List[str]] = None,
+    ) -> "Table":
+        """
+        Read the table from a file in any supported format.
+
+        :param columns: Only load these columns (primary key is always loaded).
+        :param filters: Only load rows matching these filters, see `Filters`. Not supported
+            for csv.
+        :param partitions: Only load these partitions of `parquet_partitioned` table, see
+            `read_partitioned_parquet`.
+        """
         if isinstance(path, Path):
             path = path.as_posix()
 
+        if partitions is not None and not path.endswith(".parquet_partitioned"):
+            raise ValueError(f"only partitioned tables can be read by partitions: {path}")
+
         if path.endswith(".csv"):
-            table = cls.read_csv(path)
+            if filters:
+                raise NotImplementedError("filters are not supported for csv files")
+            table = cls.read_csv(path, columns=columns)
 
         elif path.endswith(".feather"):
-            table = cls.read_feather(path)
+            table = cls.read_feather(path, columns=columns, filters=filters)
 
         elif path.endswith(".parquet"):
-            table = cls.read_parquet(path)
+            table = cls.read_parquet(path, columns=columns, filters=filters)
+
+        elif path.endswith(".parquet_partitioned"):
+            table = cls.read_partitioned_parquet(path, columns=columns, filters=filters, partitions=partitions)
         else:
             raise ValueError(f"could not detect a suitable format to read from: {path}")
 
@@ -208,13 +279,15 @@ class Table(pd.DataFrame):
         self,
         path: Any,
         repack: bool = True,
-        compression: Literal["zstd", "lz4", "uncompressed"] = "zstd",
+        compression: Optional[FeatherCompression] = None,
         **kwargs: Any,
     ) -> None:
         """
         Save this table as a feather file plus accompanying JSON metadata file.
         If the table is stored at "mytable.feather", the metadata will be at
         "mytable.meta.json".
+
+        :param compression: Compression of the file, defaults to `feather_compression()`.
         """
         if not str(path).endswith(".feather"):
             raise ValueError(f'filename must end in ".feather": {path}')
@@ -232,7 +305,20 @@ class Table(pd.DataFrame):
             # NOTE: this can be slow for large dataframes
             df = repack_frame(df)
 
-        df.to_feather(path, compression=compression, **kwargs)
+        compression = compression or feather_compression()
+        if compression == "uncompressed":
+            # a single record batch, otherwise columns are concatenated from chunks on read
+            # and can't be zero-copy views of a memory-mapped file
+            kwargs.setdefault("chunksize", max(len(df), 1))
+
+        # write to a temporary file and move it, existing memory-mapped reads of the file keep the old one
+        tmp_path = join(dirname(str(path)), f".{os.path.basename(str(path))}.{os.getpid()}.tmp")
+        try:
+            df.to_feather(tmp_path, compression=compression, **kwargs)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
         self._save_metadata(self.metadata_filename(path))
 
@@ -279,18 +365,97 @@ class Table(pd.DataFrame):
 
         self._save_metadata(self.metadata_filename(path))
 
+    def to_partitioned_parquet(
+        self,
+        path: Any,
+        repack: bool = True,
+        partition_by: Optional[str] = None,
+        partition_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        """
+        Save this table as a directory of parquet files, one for every partition, plus accompanying
+        JSON metadata file. If the table is stored at "mytable.parquet_partitioned", partitions are
+        at e.g. "mytable.parquet_partitioned/country=France/part-0.parquet" and the metadata at
+        "mytable.meta.json".
+
+        Unlike in hive, partition columns are kept in the files, so their dtypes survive the
+        roundtrip. Files have row group statistics which let readers skip partitions and row
+        groups that don't match filters. Unchanged partitions are written to identical files (as
+        long as dtypes and categories of the whole table stay the same), so content-based syncing
+        only uploads changed partitions.
+
+        :param partition_by: Column to partition by, the first column of primary key by default.
+        :param partition_size: Partition numeric column into ranges of this size instead of by its
+            values, e.g. 10 for decades of years (partition "1990-1999").
+        :param max_workers: Number of threads writing partitions.
+        """
+        if not str(path).endswith(".parquet_partitioned"):
+            raise ValueError(f'filename must end in ".parquet_partitioned": {path}')
+
+        df = pd.DataFrame(self)
+        if self.primary_key:
+            df = df.reset_index()
+
+        partition_by = partition_by or (self.primary_key[0] if self.primary_key else None)
+        if partition_by is None:
+            raise ValueError("partition_by must be given for tables without primary key")
+        if partition_by not in df.columns:
+            raise KeyError(f"Partition column not found in table: {partition_by}")
+
+        if repack:
+            # use smaller data types wherever possible
+            # NOTE: this can be slow for large dataframes
+            df = repack_frame(df)
+
+        codes, labels = _partition_codes(df[partition_by], partition_size)
+        t = pyarrow.Table.from_pandas(df, preserve_index=False)
+
+        # sort rows by partition, null partition (code -1) goes first
+        order = np.argsort(codes, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(codes + 1, minlength=len(labels) + 1))])
+        partitions = [
+            (label, order[bounds[i] : bounds[i + 1]])
+            for i, label in enumerate([NULL_PARTITION] + labels)
+            if bounds[i + 1] > bounds[i]
+        ]
+
+        # remove stale partitions
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        def write_partition(partition: Tuple[str, np.ndarray]) -> None:
+            label, indices = partition
+            partition_dir = join(path, f"{partition_by}={quote(label, safe='')}")
+            os.makedirs(partition_dir)
+            pq.write_table(t.take(indices), join(partition_dir, "part-0.parquet"), write_statistics=True)
+
+        # pyarrow releases the GIL when writing
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(write_partition, partitions))
+
+        self._save_metadata(self.metadata_filename(path))
+
     def _save_metadata(self, filename: str) -> None:
         # write metadata
         with open(filename, "w") as ostream:
             metadata = self.metadata.to_dict()  # type: ignore
             metadata["primary_key"] = self.primary_key
             metadata["fields"] = self._get_fields_as_dict()
+            # remote readers can't list directories, they get partition files from the metadata
+            partitioned_path = filename[: -len(".meta.json")] + ".parquet_partitioned"
+            if os.path.isdir(partitioned_path):
+                metadata["partitions"] = [
+                    os.path.relpath(f, partitioned_path) for f in partition_files(partitioned_path)
+                ]
             json.dump(metadata, ostream, indent=2, default=str)
 
     @classmethod
-    def read_csv(cls, path: Union[str, Path]) -> "Table":
+    def read_csv(cls, path: Union[str, Path], columns: Optional[List[str]] = None) -> "Table":
         """
         Read the table from csv plus accompanying JSON sidecar.
+
+        :param columns: Only load these columns (primary key is always loaded).
         """
         if isinstance(path, Path):
             path = path.as_posix()
@@ -298,15 +463,18 @@ class Table(pd.DataFrame):
         if not path.endswith(".csv"):
             raise ValueError(f'filename must end in ".csv": {path}')
 
-        # load the data
-        df = Table(pd.read_csv(path, index_col=False, na_values=[""], keep_default_na=False))
-
         # load the metadata
         metadata = cls._read_metadata(path)
 
         primary_key = metadata.pop("primary_key") if "primary_key" in metadata else []
         fields = metadata.pop("fields") if "fields" in metadata else {}
 
+        # load the data
+        usecols = None if columns is None else set(columns) | set(primary_key)
+        df = Table(pd.read_csv(path, index_col=False, na_values=[""], keep_default_na=False, usecols=usecols))
+        if columns is not None:
+            fields = {k: v for k, v in fields.items() if k in usecols}  # type: ignore
+
         df.metadata = TableMeta(**metadata)
         df._fields = defaultdict(VariableMeta, {k: VariableMeta.from_dict(v) for k, v in fields.items()})
 
@@ -323,12 +491,16 @@ class Table(pd.DataFrame):
         return self
 
     @classmethod
-    def _add_metadata(cls, df: pd.DataFrame, path: str) -> None:
-        """Read metadata from JSON sidecar and add it to the dataframe."""
-        metadata = cls._read_metadata(path)
+    def _add_metadata(cls, df: pd.DataFrame, path: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Read metadata from JSON sidecar (unless given) and add it to the dataframe. Fields of
+        columns that were not loaded are left out."""
+        if metadata is None:
+            metadata = cls._read_metadata(path)
 
         primary_key = metadata.get("primary_key", [])
         fields = metadata.pop("fields") if "fields" in metadata else {}
+        metadata.pop("partitions", None)
+        fields = {k: v for k, v in fields.items() if k in df.columns}
 
         df.metadata = TableMeta.from_dict(metadata)
         df._set_fields_from_dict(fields)
@@ -338,11 +510,21 @@ class Table(pd.DataFrame):
             df.set_index(primary_key, inplace=True)
 
     @classmethod
-    def read_feather(cls, path: Union[str, Path]) -> "Table":
+    def read_feather(
+        cls,
+        path: Union[str, Path],
+        columns: Optional[List[str]] = None,
+        filters: Optional[Filters] = None,
+        memory_map: Optional[bool] = None,
+    ) -> "Table":
         """
         Read the table from feather plus accompanying JSON sidecar.
 
         The path may be a local file path or a URL.
+
+        :param columns: Only load these columns (primary key is always loaded).
+        :param filters: Only load rows matching these filters, see `Filters`.
+        :param memory_map: Memory-map local file, defaults to `feather_memory_map()`.
         """
         if isinstance(path, Path):
             path = path.as_posix()
@@ -350,17 +532,60 @@ class Table(pd.DataFrame):
         if not path.endswith(".feather"):
             raise ValueError(f'filename must end in ".feather": {path}')
 
+        if memory_map is None:
+            memory_map = feather_memory_map()
+        memory_map = memory_map and not path.startswith("http")
+
+        if columns is None and filters is None:
+            # load the data and add metadata
+            if memory_map:
+                df = Table(cls._arrow_to_pandas(feather.read_table(path, memory_map=True), zero_copy=True))
+            else:
+                df = Table(pd.read_feather(path))
+            cls._add_metadata(df, path)
+            return df
+
+        metadata = cls._read_metadata(path)
+
+        if path.startswith("http"):
+            import requests
+
+            source: Any = pyarrow.BufferReader(requests.get(path).content)
+        else:
+            source = path
+
+        # only the footer is read to get column names, then only selected columns are
+        # read from disk and decompressed
+        with pyarrow.ipc.open_file(source) as reader:
+            names = reader.schema.names
+        to_read, to_keep = cls._columns_to_read(names, metadata.get("primary_key", []), columns, filters)
+
+        t = feather.read_table(source, columns=to_read, memory_map=memory_map)
+        if filters:
+            t = t.filter(pq.filters_to_expression(filters)).select(to_keep)
+
         # load the data and add metadata
-        df = Table(pd.read_feather(path))
-        cls._add_metadata(df, path)
+        df = Table(cls._arrow_to_pandas(t, zero_copy=memory_map))
+        cls._add_metadata(df, path, metadata)
         return df
 
+    @staticmethod
+    def _arrow_to_pandas(t: pyarrow.Table, zero_copy: bool = False) -> pd.DataFrame:
+        # with one block per column, numeric columns without nulls are views of arrow buffers
+        # instead of being copied into a consolidated 2D block
+        return t.to_pandas(use_threads=True, split_blocks=zero_copy)
+
     @classmethod
-    def read_parquet(cls, path: Union[str, Path]) -> "Table":
+    def read_parquet(
+        cls, path: Union[str, Path], columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+    ) -> "Table":
         """
         Read the table from a parquet file plus accompanying JSON sidecar.
 
         The path may be a local file path or a URL.
+
+        :param columns: Only load these columns (primary key is always loaded).
+        :param filters: Only load rows matching these filters, see `Filters`.
         """
         if isinstance(path, Path):
             path = path.as_posix()
@@ -368,11 +593,108 @@ class Table(pd.DataFrame):
         if not path.endswith(".parquet"):
             raise ValueError(f'filename must end in ".parquet": {path}')
 
+        if columns is None and filters is None:
+            # load the data and add metadata
+            df = Table(pd.read_parquet(path))
+            cls._add_metadata(df, path)
+            return df
+
+        metadata = cls._read_metadata(path)
+
+        # filters are pushed down to row groups, rows in groups that can't match are not read
+        names = None if path.startswith("http") else pq.read_schema(path).names
+        _, to_keep = cls._columns_to_read(names, metadata.get("primary_key", []), columns, filters)
+
+        # load the data and add metadata
+        df = Table(pd.read_parquet(path, columns=to_keep, filters=filters))
+        cls._add_metadata(df, path, metadata)
+        return df
+
+    @classmethod
+    def read_partitioned_parquet(
+        cls,
+        path: Union[str, Path],
+        columns: Optional[List[str]] = None,
+        filters: Optional[Filters] = None,
+        partitions: Optional[List[str]] = None,
+    ) -> "Table":
+        """
+        Read the table from a directory of partitioned parquet files plus accompanying JSON sidecar.
+        Rows are ordered by partition.
+
+        The path may be a local directory or a URL. Remote partitions are listed in the JSON
+        sidecar and every partition that is read is downloaded whole.
+
+        :param columns: Only load these columns (primary key is always loaded).
+        :param filters: Only load rows matching these filters, see `Filters`. Partitions and row
+            groups that can't match are skipped using their statistics.
+        :param partitions: Only load these partitions, given by their values (e.g. "France") or
+            ranges (e.g. "1990-1999").
+        """
+        if isinstance(path, Path):
+            path = path.as_posix()
+
+        if not path.endswith(".parquet_partitioned"):
+            raise ValueError(f'filename must end in ".parquet_partitioned": {path}')
+
+        metadata = cls._read_metadata(path)
+
+        if path.startswith("http"):
+            if "partitions" not in metadata:
+                raise ValueError(f"metadata of remote partitioned table does not list its partitions: {path}")
+            all_files = _remote_partition_files(path, metadata["partitions"])
+            files = _remote_partition_files(path, metadata["partitions"], partitions)
+            # download only partitions to read, the first one is needed for the schema anyway
+            downloaded = [_download_parquet(f) for f in files or all_files[:1]]
+            schema = downloaded[0].schema
+            dataset = pyarrow.dataset.dataset(downloaded)
+        else:
+            all_files = partition_files(path)
+            files = partition_files(path, partitions)
+            # schema of all partitions is the same
+            schema = pq.read_schema(all_files[0])
+            dataset = pyarrow.dataset.dataset(files, schema=schema, format="parquet")
+        _, to_keep = cls._columns_to_read(schema.names, metadata.get("primary_key", []), columns, filters)
+
+        if files:
+            expression = pq.filters_to_expression(filters) if filters else None
+            t = dataset.to_table(columns=to_keep, filter=expression)
+        else:
+            t = schema.empty_table()
+            t = t.select(to_keep) if to_keep else t
+
         # load the data and add metadata
-        df = Table(pd.read_parquet(path))
-        cls._add_metadata(df, path)
+        df = Table(t.to_pandas(use_threads=True))
+        cls._add_metadata(df, path, metadata)
         return df
 
+    @staticmethod
+    def _columns_to_read(
+        names: Optional[List[str]],
+        primary_key: List[str],
+        columns: Optional[List[str]],
+        filters: Optional[Filters],
+    ) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+        """Return columns that have to be read from a file to apply filters and columns
+        that should be kept in the table. Primary key is always kept. Columns are in the
+        same order as in the file (if `names` are known)."""
+        if columns is None:
+            if not filters or names is None:
+                return None, None
+            columns = [c for c in names if c not in primary_key]
+
+        if names is not None:
+            missing = set(columns) - set(names)
+            if missing:
+                raise KeyError(f"Columns not found in table: {sorted(missing)}")
+        else:
+            names = list(dict.fromkeys(primary_key + columns))
+
+        filter_columns = {f[0] for f in _flatten_filters(filters)} if filters else set()
+        to_keep = [c for c in names if c in set(primary_key) | set(columns)]
+        to_read = [c for c in names if c in set(to_keep) | filter_columns]
+        return to_read, to_keep
+
     def _get_fields_as_dict(self) -> Dict[str, Any]:
         return {col: self._fields[col].to_dict() for col in self.all_columns}
 
@@ -695,12 +1017,13 @@ class Table(pd.DataFrame):
         if tb is None:
             return None
         tb = tb.copy()
-        for column in list(tb.all_columns):
-            tb._fields[column].processing_log.add_entry(
-                variable=column,
-                parents=[tb.get_column_or_index(column)],
-                operation="dropna",
-            )
+        if pl.enabled():
+            for column in list(tb.all_columns):
+                tb._fields[column].processing_log.add_entry(
+                    variable=column,
+                    parents=[tb.get_column_or_index(column)],
+                    operation="dropna",
+                )
 
         return cast("Table", tb)
 
@@ -712,6 +1035,8 @@ class Table(pd.DataFrame):
         comment: Optional[str] = None,
     ) -> "Table":
         # Append a new entry to the processing log of the required variables.
+        if not pl.enabled():
+            return self
         if variable_names is None:
             # If no variable is specified, assume all (including index columns).
             variable_names = list(self.all_columns)
@@ -735,6 +1060,8 @@ class Table(pd.DataFrame):
     ) -> "Table":
         """Amend operation or comment of the latest processing log entry."""
         # Append a new entry to the processing log of the required variables.
+        if not pl.enabled():
+            return self
         if variable_names is None:
             # If no variable is specified, assume all (including index columns).
             variable_names = list(self.all_columns)
@@ -748,6 +1075,9 @@ class Table(pd.DataFrame):
 
     def sort_values(self, by: str, *args, **kwargs) -> "Table":
         tb = super().sort_values(by=by, *args, **kwargs).copy()
+        if not pl.enabled():
+            return cast("Table", tb)
+
         for column in list(tb.all_columns):
             if isinstance(by, str):
                 parents = [by, column]
@@ -786,6 +1116,9 @@ class Table(pd.DataFrame):
         # The following would have a parents only the scalar, not the scalar and the corresponding variable.
         # tb = update_log(table=tb, operation="+", parents=[other], variable_names=tb.columns)
         # Instead, update the processing log of each variable in the table.
+        if not pl.enabled():
+            # Avoid creating a variable for every column just to discard its log entry.
+            return
         for column in tb.columns:
             if isinstance(other, pd.DataFrame):
                 parents = [tb[column], other[column]]
@@ -910,6 +1243,62 @@ class Table(pd.DataFrame):
         return tb
 
 
+def partition_files(path: Union[str, Path], partitions: Optional[List[str]] = None) -> List[str]:
+    """Return parquet files of a partitioned table, sorted by partition. Only files of given
+    partitions (their values or ranges) if `partitions` is given."""
+    partition_dirs = sorted(p for p in Path(path).iterdir() if p.is_dir() and "=" in p.name)
+
+    if partitions is not None:
+        by_label = {unquote(p.name.split("=", 1)[1]): p for p in partition_dirs}
+        missing = set(partitions) - set(by_label)
+        if missing:
+            raise KeyError(f"Partitions not found in table: {sorted(missing)}")
+        partition_dirs = [p for label, p in by_label.items() if label in set(partitions)]
+
+    return [f.as_posix() for p in partition_dirs for f in sorted(p.glob("*.parquet"))]
+
+
+def _remote_partition_files(url: str, files: List[str], partitions: Optional[List[str]] = None) -> List[str]:
+    """Return URLs of parquet files of a remote partitioned table from the list of its files
+    relative to the table (e.g. "country=France/part-0.parquet"), like `partition_files`."""
+    if partitions is not None:
+        labels = {unquote(f.split("/", 1)[0].split("=", 1)[1]) for f in files}
+        missing = set(partitions) - labels
+        if missing:
+            raise KeyError(f"Partitions not found in table: {sorted(missing)}")
+        files = [f for f in files if unquote(f.split("/", 1)[0].split("=", 1)[1]) in set(partitions)]
+
+    return [f"{url.rstrip('/')}/{f}" for f in files]
+
+
+def _download_parquet(url: str) -> pyarrow.Table:
+    """Download and read a parquet file."""
+    import requests
+
+    resp = requests.get(url)
+    resp.raise_for_status()
+    return pq.read_table(pyarrow.BufferReader(resp.content))
+
+
+def _partition_codes(s: pd.Series, partition_size: Optional[int] = None) -> Tuple[np.ndarray, List[str]]:
+    """Return partition index of every value (-1 for nulls) and sorted partition labels."""
+    if partition_size:
+        start = (s.astype("float64") // partition_size) * partition_size
+        codes, uniques = pd.factorize(start, sort=True)
+        labels = [f"{int(u)}-{int(u) + partition_size - 1}" for u in uniques]
+    else:
+        codes, uniques = pd.factorize(s, sort=True)
+        labels = [str(u) for u in uniques]
+    return codes, labels
+
+
+def _flatten_filters(filters: Filters) -> List[Tuple[str, str, Any]]:
+    """Return all conditions from filters in either flat or nested (OR of ANDs) form."""
+    if filters and isinstance(filters[0], list):
+        return [f for group in filters for f in group]  # type: ignore
+    return filters  # type: ignore
+
+
 def _create_table(df: pd.DataFrame, metadata: TableMeta, fields: Dict[str, VariableMeta]) -> Table:
     """Create a table with metadata."""
     tb = Table(df, metadata=metadata.copy())
@@ -2,7 +2,6 @@
 #  variables.py
 #
 
-import copy
 import json
 import os
 from collections import defaultdict
@@ -234,7 +233,7 @@ class Variable(pd.Series):
             log.warning("Avoid using fillna(inplace=True), which may not handle metadata as expected.")
         variable_name = self.name or UNNAMED_VARIABLE
         variable = Variable(super().fillna(value, *args, **kwargs), name=variable_name)
-        variable._fields = copy.deepcopy(self._fields)
+        variable._fields = self._copy_index_fields()
         variable._fields[variable_name] = combine_variables_metadata(
             variables=[self, value], operation="fillna", name=variable_name
         )
@@ -247,7 +246,7 @@ class Variable(pd.Series):
             log.warning("Avoid using dropna(inplace=True), which may not handle metadata as expected.")
         variable_name = self.name or UNNAMED_VARIABLE
         variable = Variable(super().dropna(*args, **kwargs), name=variable_name)
-        variable._fields = copy.deepcopy(self._fields)
+        variable._fields = self._copy_index_fields()
         variable._fields[variable_name] = combine_variables_metadata(
             variables=[self], operation="dropna", name=variable_name
         )
@@ -291,6 +290,10 @@ class Variable(pd.Series):
         variable: Optional[str] = None,
         comment: Optional[str] = None,
     ) -> "Variable":
+        if not pl.enabled():
+            # Avoid building the entry, it would be discarded anyway.
+            return self
+
         if variable is None:
             # If a variable name is not specified, take it from the variable, or otherwise use UNNAMED_VARIABLE.
             variable = self.name or UNNAMED_VARIABLE
@@ -318,6 +321,13 @@ class Variable(pd.Series):
             new_var._fields = defaultdict(VariableMeta, {k: self._fields[k].copy(deep=deep) for k in field_names})
         return new_var
 
+    def _copy_index_fields(self) -> Dict[str, VariableMeta]:
+        """Copy metadata of index columns only. Variables taken from a table share `_fields` with all its
+        columns, copying them all would make column-by-column operations quadratic in number of columns."""
+        return defaultdict(
+            VariableMeta, {k: self._fields[k].copy() for k in self.index.names if k is not None and k in self._fields}
+        )
+
 
 # dynamically add all metadata properties to the class
 for k in VariableMeta.__dataclass_fields__:
@@ -341,9 +351,8 @@ def _get_metadata_value_from_variables_if_all_identical(
         return None
 
     # Get unique values from list, ignoring Nones.
-    unique_values = set(
-        [getattr(variable.metadata, field) for variable in variables if getattr(variable.metadata, field) is not None]
-    )
+    values = [getattr(variable.metadata, field) for variable in variables]
+    unique_values = set([value for value in values if value is not None])
     if len(unique_values) == 1:
         combined_value = unique_values.pop()
     else:
@@ -357,11 +366,16 @@ def _get_metadata_value_from_variables_if_all_identical(
     return combined_value
 
 
+def _unique(items: List[Any]) -> List[Any]:
+    # Unique items respecting the order, much faster than pd.unique for short lists of objects.
+    return list(dict.fromkeys(items))
+
+
 def get_unique_sources_from_variables(variables: List[Variable]) -> List[Source]:
     # Make a list of all sources of all variables.
     sources = sum([variable.metadata.sources for variable in variables], [])
 
-    return pd.unique(sources).tolist()
+    return _unique(sources)
 
 
 def get_unique_origins_from_variables(variables: List[Variable]) -> List[Origin]:
@@ -369,21 +383,21 @@ def get_unique_origins_from_variables(variables: List[Variable]) -> List[Origin]
     origins = sum([variable.metadata.origins for variable in variables], [])
 
     # Get unique array of tuples of origin fields (respecting the order).
-    return pd.unique(origins).tolist()
+    return _unique(origins)
 
 
 def get_unique_licenses_from_variables(variables: List[Variable]) -> List[License]:
     # Make a list of all licenses of all variables.
     licenses = sum([variable.metadata.licenses for variable in variables], [])
 
-    return pd.unique(licenses).tolist()
+    return _unique(licenses)
 
 
 def get_unique_description_key_points_from_variables(variables: List[Variable]) -> List[str]:
     # Make a list of all description key points of all variables.
     description_key_points = sum([variable.metadata.description_key for variable in variables], [])
 
-    return pd.unique(description_key_points).tolist()
+    return _unique(description_key_points)
 
 
 def combine_variables_processing_logs(variables: List[Variable]) -> ProcessingLog:
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from owid.catalog import checksums, datasets
+
+
+def _make_old(path):
+    # pretend the file was modified a while ago, otherwise it's not cached
+    t = time.time() - 60
+    os.utime(path, (t, t))
+
+
+def test_checksum_cache_hit(tmp_path):
+    cache = checksums.ChecksumCache(tmp_path / "checksums.sqlite")
+    f = tmp_path / "a.txt"
+    f.write_text("hello")
+    _make_old(f)
+
+    md5 = checksums.checksum_file_nocache(f)
+    assert cache.checksum(f, checksums.checksum_file_nocache) == md5
+
+    # second call doesn't compute the checksum again
+    with patch.object(checksums, "checksum_file_nocache", side_effect=AssertionError):
+        assert cache.checksum(f, checksums.checksum_file_nocache) == md5
+
+    # cache persists between instances
+    assert checksums.ChecksumCache(tmp_path / "checksums.sqlite").get(str(f), os.stat(f)) == md5
+
+
+def test_checksum_cache_invalidated_on_change(tmp_path):
+    cache = checksums.ChecksumCache(tmp_path / "checksums.sqlite")
+    f = tmp_path / "a.txt"
+    f.write_text("hello")
+    _make_old(f)
+    md5_1 = cache.checksum(f, checksums.checksum_file_nocache)
+
+    f.write_text("hello world")
+    _make_old(f)
+    md5_2 = cache.checksum(f, checksums.checksum_file_nocache)
+
+    assert md5_1 != md5_2
+    assert md5_2 == checksums.checksum_file_nocache(f)
+
+
+def test_checksum_cache_skips_recent_files(tmp_path):
+    cache = checksums.ChecksumCache(tmp_path / "checksums.sqlite")
+    f = tmp_path / "a.txt"
+    f.write_text("hello")
+
+    cache.checksum(f, checksums.checksum_file_nocache)
+    assert cache.get(str(f), os.stat(f)) is None
+
+
+def test_checksum_file_with_cache(tmp_path):
+    f = tmp_path / "a.txt"
+    f.write_text("hello")
+    _make_old(f)
+
+    try:
+        checksums.enable_checksum_cache(tmp_path / "checksums.sqlite")
+        assert checksums.checksum_file(f) == checksums.checksum_file_nocache(f)
+        assert checksums.get_checksum_cache().get(str(f), os.stat(f)) is not None  # type: ignore
+    finally:
+        checksums.disable_checksum_cache()
+
+
+def test_dos2unix_md5_with_crlf_split_between_chunks(tmp_path):
+    data = b"a" * (2**20 - 1) + b"\r\nb\r\n\r\r\n" + b"c\r"
+    expected = hashlib.md5(data.replace(b"\r\n", b"\n")).hexdigest()
+
+    _hash = checksums.Dos2UnixMD5()
+    for i in range(0, len(data), 3):
+        _hash.update(data[i : i + 3])
+    assert _hash.hexdigest() == expected
+
+    # CRLF right at the boundary of 1MB chunks
+    f = tmp_path / "a.csv"
+    f.write_bytes(data)
+    assert checksums.checksum_file_dos2unix_nocache(f) == expected
+
+
+def test_checksum_file_dos2unix_with_cache(tmp_path):
+    f = tmp_path / "a.csv"
+    f.write_bytes(b"a,b\r\n1,2\r\n")
+    _make_old(f)
+
+    try:
+        cache = checksums.enable_checksum_cache(tmp_path / "checksums.sqlite")
+        md5 = checksums.checksum_file(f)
+        md5_dos2unix = checksums.checksum_file_dos2unix(f)
+        assert md5 != md5_dos2unix
+
+        # both are stored next to each other
+        assert cache.get(str(f), os.stat(f)) == md5
+        assert cache.get(str(f), os.stat(f), kind="md5_dos2unix") == md5_dos2unix
+        with patch.object(checksums, "checksum_file_dos2unix_nocache", side_effect=AssertionError):
+            assert checksums.checksum_file_dos2unix(f) == md5_dos2unix
+    finally:
+        checksums.disable_checksum_cache()
+
+
+def test_deprecated_datasets_checksum_file(tmp_path):
+    f = tmp_path / "a.txt"
+    f.write_text("hello")
+
+    with pytest.warns(DeprecationWarning):
+        checksum = datasets.checksum_file(str(f))
+    assert checksum.hexdigest() == hashlib.md5(b"hello").hexdigest()
+    assert checksum.digest() == hashlib.md5(b"hello").digest()
@@ -18,8 +18,9 @@ from unittest.mock import patch
 import pandas as pd
 import pytest
 import yaml
+from pandas.testing import assert_frame_equal
 
-from owid.catalog import Dataset, DatasetMeta, Table
+from owid.catalog import Dataset, DatasetMeta, Table, checksums
 from owid.catalog.datasets import NonUniqueIndex, PrimaryKeyMissing
 
 from .mocking import mock
@@ -188,6 +189,160 @@ def test_add_table_parquet():
         assert t2.equals_table(t)
 
 
+@pytest.mark.parametrize("format", ["feather", "parquet", "csv"])
+def test_read_columns_and_filters(tmp_path, format):
+    t = Table(
+        pd.DataFrame(
+            {
+                "country": ["France", "France", "Germany", "Germany"],
+                "year": [2000, 2001, 2000, 2001],
+                "gdp": [1.0, 2.0, 3.0, 4.0],
+                "population": [10, 20, 30, 40],
+                "area": [5, 5, 6, 6],
+            }
+        ),
+        short_name="wide",
+    ).set_index(["country", "year"])
+    t.gdp.metadata.unit = "dollars"
+    t.population.metadata.unit = "people"
+
+    ds = Dataset.create_empty(tmp_path / "ds")
+    ds.add(t, formats=[format])
+
+    # only some columns, primary key is always loaded
+    t2 = ds.read("wide", columns=["population", "gdp"])
+    assert t2.primary_key == ["country", "year"]
+    assert list(t2.columns) == ["gdp", "population"]
+    assert t2.gdp.metadata.unit == "dollars"
+    assert set(t2._fields) == {"country", "year", "gdp", "population"}
+    expected = ds["wide"][["gdp", "population"]]
+    assert_frame_equal(pd.DataFrame(t2), pd.DataFrame(expected))
+    assert t2.population.metadata == expected.population.metadata
+
+    if format == "csv":
+        with pytest.raises(NotImplementedError):
+            ds.read("wide", filters=[("year", "==", 2001)])
+        return
+
+    # filter rows, even by columns that are not loaded
+    t3 = ds.read("wide", columns=["gdp"], filters=[("country", "==", "Germany"), ("area", ">", 5)])
+    assert t3.gdp.tolist() == [3.0, 4.0]
+    assert t3.index.get_level_values("country").unique().tolist() == ["Germany"]
+    assert list(t3.columns) == ["gdp"]
+
+    # filters without columns load all columns
+    t4 = ds.read("wide", filters=[[("year", "==", 2000)], [("gdp", ">", 3.5)]])
+    assert list(t4.columns) == ["gdp", "population", "area"]
+    assert t4.gdp.tolist() == [1.0, 3.0, 4.0]
+
+    with pytest.raises(KeyError):
+        ds.read("wide", columns=["unknown"])
+
+
+def test_partitioned_table(tmp_path):
+    t = Table(
+        pd.DataFrame(
+            {
+                "country": ["France", "France", "Germany", "Côte d'Ivoire"],
+                "year": [1995, 2001, 2000, 2011],
+                "gdp": [1.0, 2.5, 3.0, 4.0],
+            }
+        ),
+        short_name="wide",
+    ).set_index(["country", "year"])
+    t.gdp.metadata.unit = "dollars"
+
+    ds = Dataset.create_empty(tmp_path / "ds")
+    ds.add(t, formats=["parquet_partitioned"])
+
+    # partitioned by the first dimension by default
+    partitions = sorted(p.name for p in (tmp_path / "ds" / "wide.parquet_partitioned").iterdir())
+    assert partitions == ["country=C%C3%B4te%20d%27Ivoire", "country=France", "country=Germany"]
+
+    t2 = ds["wide"]
+    assert t2.gdp.metadata.unit == "dollars"
+    # repacked like other formats
+    assert t2.gdp.dtype == "float32"
+    assert t2.sort_index().gdp.tolist() == [4.0, 1.0, 2.5, 3.0]
+
+    # read selected partitions or filter rows
+    assert ds.read("wide", partitions=["France"]).gdp.tolist() == [1.0, 2.5]
+    assert ds.read("wide", filters=[("year", ">=", 2001)]).gdp.tolist() == [4.0, 2.5]
+    assert ds.read("wide", partitions=[]).empty
+    with pytest.raises(KeyError):
+        ds.read("wide", partitions=["Spain"])
+
+    # partition by ranges of years, stale partitions are removed
+    ds.add(t, formats=["parquet_partitioned"], partition_by="year", partition_size=10)
+    partitions = sorted(p.name for p in (tmp_path / "ds" / "wide.parquet_partitioned").iterdir())
+    assert partitions == ["year=1990-1999", "year=2000-2009", "year=2010-2019"]
+    assert ds.read("wide", partitions=["2000-2009"]).gdp.tolist() == [2.5, 3.0]
+
+    assert ds.table_names == ["wide"]
+    assert ds.checksum()
+
+
+def test_partitioned_table_read_from_url(tmp_path):
+    t = Table(
+        pd.DataFrame({"country": ["France", "France", "Germany"], "year": [2000, 2001, 2000], "gdp": [1.0, 2.0, 3.0]}),
+        short_name="wide",
+    ).set_index(["country", "year"])
+    ds = Dataset.create_empty(tmp_path / "ds")
+    # partitions are listed in the metadata even if another format is saved after them
+    ds.add(t, formats=["parquet_partitioned", "feather"])
+
+    # serve files from the dataset folder, directories can't be listed over http
+    base_url = "https://catalog.example.org/garden/ds"
+    requested = []
+
+    class Response:
+        def __init__(self, url: str) -> None:
+            requested.append(url)
+            self.content = (tmp_path / "ds" / url[len(base_url) + 1 :]).read_bytes()
+
+        def json(self) -> Any:
+            return json.loads(self.content)
+
+        def raise_for_status(self) -> None:
+            pass
+
+    with patch("requests.get", side_effect=Response):
+        t2 = Table.read(f"{base_url}/wide.parquet_partitioned")
+        assert t2.sort_index().gdp.tolist() == [1.0, 2.0, 3.0]
+        assert "partitions" not in t2.metadata.to_dict()
+
+        requested.clear()
+        t3 = Table.read_partitioned_parquet(
+            f"{base_url}/wide.parquet_partitioned", partitions=["Germany"], filters=[("year", "==", 2000)]
+        )
+        assert t3.gdp.tolist() == [3.0]
+        # only the requested partition is downloaded
+        assert requested == [
+            f"{base_url}/wide.meta.json",
+            f"{base_url}/wide.parquet_partitioned/country=Germany/part-0.parquet",
+        ]
+
+        with pytest.raises(KeyError):
+            Table.read_partitioned_parquet(f"{base_url}/wide.parquet_partitioned", partitions=["Spain"])
+
+
+def test_partitioned_table_unchanged_partitions_are_identical(tmp_path):
+    t = Table(
+        pd.DataFrame({"country": ["France", "Germany"] * 50, "year": range(100), "gdp": range(100)}),
+        short_name="wide",
+    ).set_index(["country", "year"])
+    t.to_partitioned_parquet(tmp_path / "a.parquet_partitioned")
+
+    t.loc[("Germany", 1), "gdp"] = 98
+    t.to_partitioned_parquet(tmp_path / "b.parquet_partitioned")
+
+    def checksum(name, partition):
+        return checksums.checksum_file(tmp_path / name / partition / "part-0.parquet")
+
+    assert checksum("a.parquet_partitioned", "country=France") == checksum("b.parquet_partitioned", "country=France")
+    assert checksum("a.parquet_partitioned", "country=Germany") != checksum("b.parquet_partitioned", "country=Germany")
+
+
 def test_metadata_roundtrip():
     with temp_dataset_dir() as dirname:
         d = Dataset.create_empty(dirname)
@@ -316,6 +471,23 @@ def test_save_without_valid_channel(tmp_path: Path):
     assert d2.metadata.channel is None
 
 
+def test_save_updates_table_metadata_without_reading_data(tmp_path: Path):
+    d = Dataset.create_empty(tmp_path / "ds", mock(DatasetMeta))
+    d.metadata.short_name = "ds"
+    t = mock_table()
+    d.add(t)
+
+    d.metadata.source_checksum = "abc"
+    with patch.object(Table, "read", side_effect=AssertionError("data should not be read")):
+        d.save()
+
+    t2 = d[t.metadata.short_name]
+    assert t2.metadata.dataset == d.metadata
+    assert t2.metadata.primary_key == t.metadata.primary_key
+    for col in t.all_columns:
+        assert t2.get_column_or_index(col).metadata == t.get_column_or_index(col).metadata
+
+
 @contextmanager
 def temp_dataset_dir(create: bool = False) -> Iterator[str]:
     with tempfile.TemporaryDirectory() as dirname:
@@ -10,6 +10,7 @@ import yaml
 from dataclasses_json import dataclass_json
 
 from owid.catalog import meta
+from owid.catalog.processing_log import LogEntry
 
 
 def test_dict_mixin():
@@ -107,3 +108,26 @@ def test_Origin_date_published():
     assert meta.Origin(producer="p", title="a", date_published="latest").date_published == "latest"  # type: ignore
     with pytest.raises(ValueError):
         assert meta.Origin(producer="p", title="a", date_published="nope")  # type: ignore
+
+
+def test_copy_variable_meta():
+    log = meta.ProcessingLog([LogEntry(variable="a", operation="+", target="a#1", parents=("b",))])
+    m = meta.VariableMeta(
+        title="a",
+        origins=[meta.Origin(producer="p", title="a", date_published="2020")],  # type: ignore
+        display={"numDecimalPlaces": 1},
+        processing_log=log,
+    )
+    m2 = m.copy()
+    assert m2 == m
+
+    # nested objects are copied
+    m2.origins[0].title = "b"
+    m2.display["numDecimalPlaces"] = 2  # type: ignore
+    assert m.origins[0].title == "a"
+    assert m.display == {"numDecimalPlaces": 1}
+
+    # log entries are frozen and shared, the log itself is not
+    assert type(m2.processing_log) is meta.ProcessingLog
+    assert m2.processing_log is not m.processing_log
+    assert m2.processing_log[0] is m.processing_log[0]
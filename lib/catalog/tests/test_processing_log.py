@@ -34,6 +34,16 @@ def test_tables_addition() -> None:
     ]
 
 
+def test_tables_addition_without_processing_log() -> None:
+    t1: Table = Table({"a": [1, 2]})
+    t2: Table = Table({"a": [3, 4]})
+    with pl.disable_processing_log():
+        t3 = (t1 + t2).sort_values("a").dropna()
+        t3["b"] = t3["a"] * 2
+    assert t3["a"].metadata.processing_log == []
+    assert t3["b"].metadata.processing_log == []
+
+
 @enable_pl
 def test_sum() -> None:
     random.seed(0)
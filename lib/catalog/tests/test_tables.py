@@ -3,6 +3,7 @@
 #
 
 import json
+import os
 import tempfile
 from collections import defaultdict
 from os.path import exists, join, splitext
@@ -170,6 +171,46 @@ def test_field_metadata_serialised():
         assert_tables_eq(t1, t2)
 
 
+def test_feather_memory_map(monkeypatch):
+    t1 = Table({"gdp": [100.0, 102.0, 104.0], "country": ["AU", "SE", "CH"]}).set_index("country")
+    t1.gdp.metadata.unit = "dollars"
+
+    monkeypatch.setenv("OWID_FEATHER_COMPRESSION", "uncompressed")
+    monkeypatch.setenv("OWID_FEATHER_MMAP", "1")
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = join(dirname, "test.feather")
+        t1.to_feather(filename)
+
+        t2 = Table.read_feather(filename)
+        assert_tables_eq(t1, t2)
+
+        # numeric columns are read-only views of the memory-mapped file
+        assert not t2.gdp.values.flags.writeable
+
+        t3 = Table.read_feather(filename, memory_map=False)
+        assert t3.gdp.values.flags.writeable
+
+    monkeypatch.setenv("OWID_FEATHER_COMPRESSION", "gzip")
+    with pytest.raises(ValueError):
+        t1.to_feather("/tmp/example.feather")
+
+
+def test_feather_overwrite_memory_mapped_file(monkeypatch):
+    monkeypatch.setenv("OWID_FEATHER_COMPRESSION", "uncompressed")
+    monkeypatch.setenv("OWID_FEATHER_MMAP", "1")
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = join(dirname, "test.feather")
+        Table({"gdp": np.arange(100_000, dtype=float)}).to_feather(filename)
+        t1 = Table.read_feather(filename)
+
+        # overwriting the file must not truncate the memory-mapped one
+        Table({"gdp": [1.0]}).to_feather(filename)
+        assert t1.gdp.sum() == np.arange(100_000, dtype=float).sum()
+        assert Table.read_feather(filename).gdp.tolist() == [1.0]
+        # no temporary files are left behind
+        assert sorted(os.listdir(dirname)) == ["test.feather", "test.meta.json"]
+
+
 def test_tables_from_dataframes_have_variable_columns():
     df = pd.DataFrame({"gdp": [100, 102, 104], "country": ["AU", "SE", "CH"]})
     t = Table(df)
@@ -399,6 +399,21 @@ def test_dropna(table_1) -> None:
     assert tb1["b"].metadata == table_1["b"].metadata
 
 
+def test_fillna_copies_only_metadata_of_index_columns(table_1) -> None:
+    tb1 = table_1.set_index(["country", "year"])
+    tb1.loc[("Spain", 2020), "b"] = pd.NA
+    new_var = tb1["b"].fillna(0)
+    # Metadata of other columns of the table is not copied.
+    assert set(new_var._fields) <= {"country", "year", "b"}
+    assert new_var.metadata == tb1["b"].metadata
+
+    # Metadata of the new variable is not shared with the table.
+    new_var.metadata.title = "New title"
+    new_var._fields["country"].title = "New country title"
+    assert tb1["b"].metadata.title == table_1["b"].metadata.title
+    assert tb1._fields["country"].title == "Country Title"
+
+
 def test_copy() -> None:
     v1 = Variable([1, 2, 3], name="dog")
     v1.metadata.title = "dog"
@@ -441,7 +441,7 @@ def map_series(
     # If given category, only map category names and return category type.
     if series.dtype == "category":
         # Remove unused categories in input series.
-        series = series.cat.remove_unused_categories()
+        series = _remove_unused_categories(series)
 
         new_categories = map_series(
             pd.Series(series.cat.categories),
@@ -454,6 +454,49 @@ def map_series(
         category_mapping = dict(zip(series.cat.categories, new_categories))
         return rename_categories(series, category_mapping)
 
+    if (
+        series.dtype == "object"
+        and not any(pd.isnull(value) for value in mapping)
+        and pd.api.types.infer_dtype(series, skipna=True) == "string"
+    ):
+        # Map only unique values and rebuild the series from their codes. This is much faster than mapping every row
+        # when values are repeated (e.g. country names in a long table).
+        # NOTE: Only strings are factorized, since factorize considers e.g. 1, 1.0 and True identical (and None and nan).
+        codes, uniques = pd.factorize(series)
+        unique_values = pd.Series(uniques, dtype=object)
+        uniques_mapped = _map_values(unique_values, mapping=mapping, make_unmapped_values_nan=make_unmapped_values_nan)
+        series_mapped = pd.Series(uniques_mapped.to_numpy()[codes], index=series.index, name=series.name)
+        # Nulls have code -1 and can't be mapped, so they stay as they are (or become nan).
+        nulls = codes == -1
+        if nulls.any():
+            series_mapped[nulls] = np.nan if make_unmapped_values_nan else series[nulls]
+            unique_values = pd.concat([unique_values, series[nulls].drop_duplicates()])
+    else:
+        unique_values = series
+        series_mapped = _map_values(series, mapping=mapping, make_unmapped_values_nan=make_unmapped_values_nan)
+
+    if warn_on_missing_mappings:
+        unmapped = set(unique_values) - set(mapping)
+        if len(unmapped) > 0:
+            warn_on_list_of_entities(
+                unmapped,
+                f"{len(unmapped)} missing values in mapping.",
+                show_list=show_full_warning,
+            )
+
+    if warn_on_unused_mappings:
+        unused = set(mapping) - set(unique_values)
+        if len(unused) > 0:
+            warn_on_list_of_entities(
+                unused,
+                f"{len(unused)} unused values in mapping.",
+                show_list=show_full_warning,
+            )
+
+    return series_mapped
+
+
+def _map_values(series: pd.Series, mapping: Dict[Any, Any], make_unmapped_values_nan: bool) -> pd.Series:
     # Translate values in series following the mapping.
     series_mapped = series.map(mapping)
     if not make_unmapped_values_nan:
@@ -472,57 +515,52 @@ def map_series(
             # Replace those nans by their original values.
             series_mapped.loc[missing] = series[missing]
 
-    if warn_on_missing_mappings:
-        unmapped = set(series) - set(mapping)
-        if len(unmapped) > 0:
-            warn_on_list_of_entities(
-                unmapped,
-                f"{len(unmapped)} missing values in mapping.",
-                show_list=show_full_warning,
-            )
-
-    if warn_on_unused_mappings:
-        unused = set(mapping) - set(series)
-        if len(unused) > 0:
-            warn_on_list_of_entities(
-                unused,
-                f"{len(unused)} unused values in mapping.",
-                show_list=show_full_warning,
-            )
-
     return series_mapped
 
 
 def rename_categories(series: pd.Series, mapping: Dict[Any, Any]) -> pd.Series:
     """Alternative to pd.Series.cat.rename_categories which supports non-unique categories.
 
-    We do that by replacing non-unique categories first and then mapping with unique categories.
-    Unused categories are removed during the process. It should be as fast as
-    pd.Series.cat.rename_categories if there are no non-unique categories.
+    We do that by merging categories that are mapped to the same value and recoding the series, which only touches
+    its integer codes. Unused categories are removed during the process. It should be as fast as
+    pd.Series.cat.rename_categories, even if there are many non-unique categories.
     """
     if series.dtype != "category":
         raise ValueError("Series must be of type category.")
 
-    series = series.copy()
-
-    new_mapping: Dict[Any, Any] = {}
-    for map_from, map_to in mapping.items():
-        # Map nulls right away
-        if pd.isnull(map_to):
-            series[series == map_from] = np.nan
-
-        # Non-unique category, replace it first
-        elif map_to in new_mapping.values():
-            # Find the category that maps to map_to
-            series[series == map_from] = [k for k, v in new_mapping.items() if v == map_to][0]
-        else:
-            new_mapping[map_from] = map_to
-
+    # Map categories and encode the result, so that categories mapped to the same value (or to nan) get merged. Then
+    # recode the series, without touching its values.
+    new_values = pd.Series([mapping.get(category, category) for category in series.cat.categories], dtype=object)
+    category_codes, new_categories = pd.factorize(new_values.to_numpy())
+    # NOTE: nans in the series have code -1, which is the code of nan in the new categories too.
+    category_codes = np.append(category_codes, -1)
+    new_codes = category_codes[series.cat.codes.to_numpy()]
+
+    categorical = pd.Categorical.from_codes(
+        # Infer the dtype of new categories (e.g. integers), since they may not be strings.
+        new_codes,
+        categories=pd.Index(new_categories.tolist()),
+        ordered=series.cat.ordered,
+    )
     # NOTE: removing unused categories is necessary because of renaming
-    return cast(
-        pd.Series,
-        series.cat.remove_unused_categories().cat.rename_categories(new_mapping).cat.remove_unused_categories(),
+    return _remove_unused_categories(pd.Series(categorical, index=series.index, name=series.name))
+
+
+def _remove_unused_categories(series: pd.Series) -> pd.Series:
+    """Same as series.cat.remove_unused_categories(), but it counts codes instead of sorting them, which is much faster
+    for long series."""
+    codes = series.cat.codes.to_numpy()
+    n_categories = len(series.cat.categories)
+    is_used = np.bincount(codes[codes >= 0], minlength=n_categories) > 0
+    if is_used.all():
+        return series
+
+    # Map old codes to new codes (and -1 to -1).
+    new_codes = np.append(np.cumsum(is_used) - 1, -1).astype(codes.dtype)
+    categorical = pd.Categorical.from_codes(
+        new_codes[codes], categories=series.cat.categories[is_used], ordered=series.cat.ordered
     )
+    return pd.Series(categorical, index=series.index, name=series.name)
 
 
 def concatenate(dfs: List[pd.DataFrame], **kwargs: Any) -> pd.DataFrame:
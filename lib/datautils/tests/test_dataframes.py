@@ -982,6 +982,13 @@ class TestMapSeries:
             series_out
         )
 
+    def test_map_strings_with_nulls(self):
+        series_in = pd.Series(["country_01", None, "country_03", np.nan, "country_01"], index=[4, 3, 2, 1, 0])
+        out = dataframes.map_series(series=series_in, mapping=self.mapping, make_unmapped_values_nan=False)
+        assert out.tolist()[:3] == ["Country 1", None, "country_03"]
+        assert np.isnan(out[1])
+        assert out.index.equals(series_in.index)
+
     def test_map_categorical(self):
         series_in = pd.Series(["country_01", "country_02", "country_03", np.nan]).astype("category")
         series_out = pd.Series(["Country 1", "Country 2", "country_03", np.nan]).astype("category")
@@ -1,13 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, cast
 
 import numpy as np
 import pandas as pd
 
+INTEGER_DTYPES = ("Int64", "int64", "UInt64", "uint64")
+
+# candidate dtypes from the smallest, by whether the column has nulls and negative values
+SIGNED_DTYPES = {False: ["int8", "int16", "int32"], True: ["Int8", "Int16", "Int32"]}
+UNSIGNED_DTYPES = {False: ["uint8", "uint16", "uint32"], True: ["UInt8", "UInt16", "UInt32"]}
+
+# floats in this range can be cast to int64
+INT64_MIN = float(np.iinfo(np.int64).min)
+INT64_MAX = float(np.iinfo(np.int64).max)
+
 
 def repack_frame(
     df: pd.DataFrame,
     remap: Optional[Dict[str, str]] = None,
     dtypes: Optional[Dict[str, Any]] = {},
+    workers: int = 1,
 ) -> pd.DataFrame:
     """
     Convert the DataFrame's columns to the most compact types possible.
@@ -16,6 +29,8 @@ def repack_frame(
 
     :param remap: remap column names
     :param dtypes: dictionary of fixed dtypes to use
+    :param workers: repack columns in this many threads, worth it for wide frames
+        with many rows (NumPy releases the GIL)
     """
     if df.index.names != [None]:
         raise ValueError("repacking is lost for index columns")
@@ -31,10 +46,17 @@ def repack_frame(
         df.reset_index(inplace=True)
 
     # repack each column into the best dtype we can give it
-    df = pd.concat(
-        [repack_series(df[col]) if col not in dtypes else df[col] for col in df.columns],
-        axis=1,
-    )
+    columns = [df[col] for col in df.columns]
+    to_repack = [i for i, col in enumerate(df.columns) if col not in dtypes]
+    if workers > 1 and len(to_repack) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            repacked = list(executor.map(repack_series, [columns[i] for i in to_repack]))
+    else:
+        repacked = [repack_series(columns[i]) for i in to_repack]
+    for i, s in zip(to_repack, repacked):
+        columns[i] = s
+
+    df = pd.concat(columns, axis=1)
 
     # use given dtypes
     if dtypes:
@@ -58,75 +80,69 @@ def repack_frame(
 
 
 def repack_series(s: pd.Series) -> pd.Series:
-    if s.dtype.name in ("Int64", "int64", "UInt64", "uint64"):
+    if s.dtype.name in INTEGER_DTYPES:
         return shrink_integer(s)
 
     if s.dtype.name in ("object", "float64", "Float64"):
-        for strategy in [to_int, to_float, to_category]:
+        try:
+            f = _to_float64(s)
+        except (ValueError, TypeError):
+            # not numeric, strings can still be categories
             try:
-                return strategy(s)
-            except (ValueError, TypeError):
-                continue
+                return to_category(s)
+            except ValueError:
+                return s
+
+        stats = FloatStats.of(f.to_numpy())
+        if stats.is_integer:
+            return _float_to_integer(f, stats)
+        else:
+            return _shrink_float(f)
 
     return s
 
 
 def to_int(s: pd.Series) -> pd.Series:
     # values could be integers or strings
-    v = s.astype("float64").astype("Int64")
-
-    if not series_eq(v, s, cast=float):
+    f = _to_float64(s)
+    stats = FloatStats.of(f.to_numpy())
+    if not stats.is_integer:
         raise ValueError()
 
-    # it's an integer, now pack it smaller
-    return shrink_integer(v)
+    return _float_to_integer(f, stats)
 
 
 def shrink_integer(s: pd.Series) -> pd.Series:
     """
     Take an Int64 series and make it as small as possible.
     """
-    assert s.dtype.name in ("Int64", "int64", "UInt64", "uint64")
-
-    if s.isnull().all():
-        # shrink all NaNs to Int8
-        return s.astype("Int8")
-    elif s.isnull().any():
-        if s.min() < 0:
-            series = ["Int32", "Int16", "Int8"]
-        else:
-            series = ["UInt32", "UInt16", "UInt8"]
+    assert s.dtype.name in INTEGER_DTYPES
+
+    if s.dtype.name in ("int64", "uint64"):
+        # numpy integers can't have nulls
+        values = s.to_numpy()
+        if len(values) == 0:
+            return s.astype("Int8")
+        has_nulls = False
+        lo, hi = values.min(), values.max()
     else:
-        if s.min() < 0:
-            series = ["int32", "int16", "int8"]
-        else:
-            series = ["uint32", "uint16", "uint8"]
-
-    for dtype in series:
-        v = s.astype(dtype)
-        if not (v == s).all():
-            break
-
-        s = v
+        n_nulls = s.isnull().sum()
+        if n_nulls == len(s):
+            # shrink all NaNs to Int8
+            return s.astype("Int8")
+        has_nulls = n_nulls > 0
+        lo, hi = s.min(), s.max()
 
-    return s
+    dtype = _smallest_integer_dtype(lo, hi, has_nulls)
+    return s if dtype is None else s.astype(dtype)
 
 
 def to_float(s: pd.Series) -> pd.Series:
-    options = ["float32", "float64"]
-    for dtype in options:
-        v = s.astype(dtype)
-
-        if series_eq(s, v, float):
-            return v
-
-    raise ValueError()
+    return _shrink_float(_to_float64(s))
 
 
 def to_category(s: pd.Series) -> pd.Series:
-    types = set(s.dropna().apply(type).unique())
-
-    if types.difference({str, type(None)}):
+    if pd.api.types.infer_dtype(s, skipna=True) not in ("string", "empty"):
         raise ValueError()
 
     return s.astype("category")
@@ -138,8 +154,6 @@ def series_eq(lhs: pd.Series, rhs: pd.Series, cast: Any, rtol: float = 1e-5, ato
     NaN != NaN, we want missing or null values to be reported as equal to each
     other.
     """
-    # NOTE: this could be speeded up with numpy methods or smarter comparison,
-    # but it's not bottleneck at the moment
     if len(lhs) != len(rhs):
         return False
 
@@ -151,3 +165,82 @@ def series_eq(lhs: pd.Series, rhs: pd.Series, cast: Any, rtol: float = 1e-5, ato
         func = lambda s: s.apply(cast)  # noqa: E731
 
     return np.allclose(func(lhs), func(rhs), rtol=rtol, atol=atol, equal_nan=True)
+
+
+@dataclass
+class FloatStats:
+    """Statistics of float values needed to pick the smallest dtype for them."""
+
+    nulls: np.ndarray
+    n_nulls: int
+    min: float
+    max: float
+    # all non-null values are whole numbers that fit into int64
+    is_integer: bool
+
+    @classmethod
+    def of(cls, values: np.ndarray) -> "FloatStats":
+        nulls = np.isnan(values)
+        n_nulls = int(nulls.sum())
+        if n_nulls == len(values):
+            # no values, all of them are null
+            return cls(nulls=nulls, n_nulls=n_nulls, min=np.nan, max=np.nan, is_integer=True)
+
+        valid = values[~nulls] if n_nulls else values
+        lo, hi = valid.min(), valid.max()
+        # infinities fail the range check
+        is_integer = bool(INT64_MIN <= lo and hi < INT64_MAX and (np.trunc(valid) == valid).all())
+        return cls(nulls=nulls, n_nulls=n_nulls, min=lo, max=hi, is_integer=is_integer)
+
+
+def _to_float64(s: pd.Series) -> pd.Series:
+    if s.dtype.name == "float64":
+        return s
+    # nulls of nullable and object series become NaN
+    return s.astype("float64")
+
+
+def _float_to_integer(f: pd.Series, stats: FloatStats) -> pd.Series:
+    if stats.n_nulls == len(f):
+        # shrink all NaNs to Int8
+        return f.astype("Int8")
+
+    has_nulls = stats.n_nulls > 0
+    dtype = _smallest_integer_dtype(stats.min, stats.max, has_nulls) or "Int64"
+    if not has_nulls:
+        return f.astype(dtype)
+
+    # build the nullable array from values and mask we already have, it's much faster than astype
+    values = f.to_numpy().copy()
+    values[stats.nulls] = 0
+    array = pd.arrays.IntegerArray(values.astype(dtype.lower()), stats.nulls)
+    return pd.Series(array, index=f.index, name=f.name)
+
+
+def _shrink_float(f: pd.Series, rtol: float = 1e-5, atol: float = 1e-8) -> pd.Series:
+    """Cast to float32 if it doesn't lose precision (as in `np.allclose`)."""
+    values = f.to_numpy()
+    with np.errstate(over="ignore", invalid="ignore"):
+        values32 = values.astype("float32")
+        diff = np.abs(values - values32)
+        # NaN differences come from NaNs or equal infinities
+        is_close = not (diff > atol + rtol * np.abs(values32)).any()
+        # tolerance of values that overflow to inf is inf as well
+        is_close = is_close and not (np.isinf(values32) & ~np.isinf(values)).any()
+
+    if is_close:
+        return pd.Series(values32, index=f.index, name=f.name)
+
+    return f
+
+
+def _smallest_integer_dtype(lo: Any, hi: Any, has_nulls: bool) -> Optional[str]:
+    """Smallest integer dtype (up to 32 bits) that can hold values between lo and hi, None if
+    there's none. Nullable dtypes are used if there are nulls."""
+    candidates = SIGNED_DTYPES[has_nulls] if lo < 0 else UNSIGNED_DTYPES[has_nulls]
+    for dtype in candidates:
+        info = np.iinfo(dtype.lower())
+        if info.min <= lo and hi <= info.max:
+            return dtype
+
+    return None
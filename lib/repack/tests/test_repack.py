@@ -226,3 +226,33 @@ def test_series_eq():
     a = pd.Series([1, np.nan], dtype="float64")
     b = pd.Series([1, np.nan], dtype="float64")
     assert repack.series_eq(a, b, cast=float)
+
+
+def test_repack_float_overflowing_float32():
+    s = pd.Series([1.5, 1e40, None])
+    v = repack.repack_series(s)
+    assert v.dtype.name == "float64"
+
+
+def test_repack_float_large_integers():
+    s = pd.Series([1.0, 2.0**40, None])
+    v = repack.repack_series(s)
+    assert v.dtype.name == "Int64"
+    assert v.tolist() == [1, 2**40, pd.NA]
+
+
+def test_repack_frame_workers():
+    df = pd.DataFrame(
+        {
+            "myint": [1.0, 2.0, None, 3.0],
+            "myfloat": [1.2, 2.0, 3.0, None],
+            "mycat": ["a", None, "b", "c"],
+            "mybig": [1, 2, 3, 70000],
+        }
+    )
+
+    df_serial = repack.repack_frame(df.copy())
+    df_parallel = repack.repack_frame(df.copy(), workers=4)
+
+    assert_frame_equal(df_serial, df_parallel)
+    assert df_parallel.dtypes.astype(str).tolist() == ["UInt8", "float32", "category", "uint32"]
@@ -0,0 +1,106 @@
+"""Benchmark loading feather tables with different storage profiles. Every table is rewritten
+with zstd (the default), lz4 and uncompressed compression, then loaded in a fresh process.
+Uncompressed tables are also loaded memory-mapped (OWID_FEATHER_MMAP=1).
+
+Peak RSS includes pages of memory-mapped files, which are shared by all processes reading
+the same file through the page cache. Private memory (RssAnon) is what every process
+reading the table pays on its own.
+
+Usage:
+    python scripts/benchmark_feather.py --largest 5
+    python scripts/benchmark_feather.py data/garden/faostat/2023-06-12/faostat_qcl/faostat_qcl.feather
+"""
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import click
+from owid.catalog import Table
+
+from etl import paths
+
+PROFILES: List[Tuple[str, str, bool]] = [
+    # (label, compression, memory_map)
+    ("zstd", "zstd", False),
+    ("lz4", "lz4", False),
+    ("uncompressed", "uncompressed", False),
+    ("uncompressed+mmap", "uncompressed", True),
+]
+
+
+def _private_memory_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return float("nan")
+
+
+def _load(path: str, memory_map: bool, queue: multiprocessing.Queue) -> None:
+    start = time.perf_counter()
+    t = Table.read_feather(path, memory_map=memory_map)
+    # touch all values to page in memory-mapped data
+    t.sum(numeric_only=True)
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((elapsed, peak_rss_mb, _private_memory_mb()))
+
+
+def _measure(path: Path, memory_map: bool, repeat: int) -> Dict[str, float]:
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for _ in range(repeat):
+        queue = ctx.Queue()
+        p = ctx.Process(target=_load, args=(path.as_posix(), memory_map, queue))
+        p.start()
+        results.append(queue.get())
+        p.join()
+
+    # best time, memory is the same in every run
+    elapsed, peak_rss_mb, private_mb = min(results)
+    return {"time": elapsed, "peak_rss": peak_rss_mb, "private": private_mb}
+
+
+def _largest_tables(n: int) -> List[Path]:
+    files = sorted((paths.DATA_DIR / "garden").rglob("*.feather"), key=lambda p: p.stat().st_size, reverse=True)
+    return files[:n]
+
+
+@click.command()
+@click.argument("tables", nargs=-1, type=click.Path(exists=True, path_type=Path))
+@click.option("--largest", default=3, type=int, help="Benchmark N largest garden tables if no tables are given")
+@click.option("--repeat", default=3, type=int, help="Number of repetitions, best time is reported")
+def benchmark_feather_cli(tables: List[Path], largest: int, repeat: int) -> None:
+    tables = list(tables) or _largest_tables(largest)
+    if not tables:
+        raise click.ClickException("No feather tables found, run some steps first or pass paths to tables")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for path in tables:
+            print(f"{path} ({path.stat().st_size / 2**20:.1f} MB)")
+            t = Table.read_feather(path)
+            for label, compression, memory_map in PROFILES:
+                profile_path = Path(temp_dir) / compression / path.name
+                if not profile_path.exists():
+                    profile_path.parent.mkdir(exist_ok=True)
+                    t.to_feather(profile_path, repack=False, compression=compression)  # type: ignore
+                    shutil.copy(path.with_suffix(".meta.json"), profile_path.with_suffix(".meta.json"))
+
+                r = _measure(profile_path, memory_map, repeat)
+                size_mb = os.path.getsize(profile_path) / 2**20
+                print(
+                    f"  {label:>18}: {size_mb:>8.1f} MB file, {r['time']:>6.2f}s, "
+                    f"peak RSS {r['peak_rss']:>8.1f} MB, private {r['private']:>8.1f} MB"
+                )
+
+
+if __name__ == "__main__":
+    benchmark_feather_cli()
@@ -0,0 +1,55 @@
+"""Benchmark of the serialisation of indicator data and metadata done by `grapher_import.upsert_table` before uploading
+them to R2, for numeric values and for the same values as strings.
+
+Usage:
+    python scripts/benchmark_grapher_serialisation.py --rows 3000000
+"""
+import time
+from typing import Callable, Dict
+
+import click
+import numpy as np
+import pandas as pd
+
+from apps.backport.datasync.data_metadata import _infer_variable_type, variable_data
+from apps.backport.datasync.datasync import gzip_dict
+
+
+def synthetic_data(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "value": np.round(rng.random(rows) * 1000, 2),
+            "year": rng.integers(1900, 2023, rows),
+            "entityId": rng.integers(1, 300, rows),
+        }
+    )
+
+
+def serialise(df: pd.DataFrame) -> bytes:
+    _infer_variable_type(df["value"])
+    return gzip_dict(variable_data(df))
+
+
+@click.command()
+@click.option("--rows", default=1_000_000, type=int, help="Number of data points")
+@click.option("--repeat", default=1, type=int, help="Number of repetitions, best time is reported")
+def benchmark_grapher_serialisation_cli(rows: int, repeat: int) -> None:
+    df = synthetic_data(rows)
+    print(f"indicator with {rows} data points")
+
+    benchmarks: Dict[str, Callable[[], object]] = {
+        "string values": lambda: serialise(df.assign(value=df["value"].astype(str))),
+        "numeric values": lambda: serialise(df),
+    }
+    for name, func in benchmarks.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        print(f"  {name:>15}: {min(times) * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark_grapher_serialisation_cli()
@@ -0,0 +1,91 @@
+"""Benchmark of country harmonization on long tables with repeated country names, like FAOSTAT (millions of rows of
+country, year and item) or COVID-19 data (one row per country and day).
+
+Usage:
+    python scripts/benchmark_harmonize_countries.py --scale faostat
+    python scripts/benchmark_harmonize_countries.py --rows 1000000 --countries 300
+"""
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+import click
+import numpy as np
+import pandas as pd
+from owid.catalog import Table
+from owid.datautils.dataframes import map_series
+
+from etl.data_helpers.geo import harmonize_countries
+
+# Rows and number of distinct country names of typical inputs.
+SCALES = {
+    "faostat": (5_000_000, 280),
+    "covid": (300_000, 250),
+}
+
+
+def synthetic_table(rows: int, countries: int, seed: int = 0) -> Table:
+    rng = np.random.default_rng(seed)
+    names = np.array([f"country_{i:03d}" for i in range(countries)], dtype=object)
+    return Table(
+        {
+            "country": names[rng.integers(0, countries, rows)],
+            "year": rng.integers(1961, 2023, rows),
+            "value": rng.random(rows),
+        },
+        short_name="benchmark",
+    )
+
+
+def synthetic_mapping(countries: int) -> Dict[str, str]:
+    # A few names are left unmapped, and a few are mapped to the same country.
+    mapping = {f"country_{i:03d}": f"Country {i}" for i in range(countries - 5)}
+    mapping.update({f"country_{i:03d}": "Country 0" for i in range(1, 6)})
+    return mapping
+
+
+@click.command()
+@click.option("--scale", type=click.Choice(list(SCALES)), default="faostat", help="Size of typical inputs")
+@click.option("--rows", type=int, help="Rows of the synthetic table (overrides --scale)")
+@click.option("--countries", type=int, help="Distinct country names (overrides --scale)")
+@click.option("--repeat", default=3, type=int, help="Number of repetitions, best time is reported")
+def benchmark_harmonize_countries_cli(scale: str, rows: int, countries: int, repeat: int) -> None:
+    rows = rows or SCALES[scale][0]
+    countries = countries or SCALES[scale][1]
+    tb = synthetic_table(rows, countries)
+    mapping = synthetic_mapping(countries)
+    print(f"table with {rows} rows and {countries} country names")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        countries_file = Path(temp_dir) / "countries.json"
+        countries_file.write_text(json.dumps(mapping))
+        excluded_countries_file = Path(temp_dir) / "excluded_countries.json"
+        excluded_countries_file.write_text(json.dumps([f"country_{countries - 1:03d}"]))
+
+        kwargs = dict(warn_on_missing_mappings=True, warn_on_unused_mappings=True)
+        benchmarks: Dict[str, Callable[[], object]] = {
+            "series.map (baseline)": lambda: tb["country"].map(mapping),
+            "map_series object": lambda: map_series(pd.Series(tb["country"]), mapping, **kwargs),  # type: ignore
+            "map_series category": lambda: map_series(pd.Series(tb["country"].astype("category")), mapping, **kwargs),  # type: ignore
+            "harmonize_countries": lambda: harmonize_countries(
+                tb,
+                countries_file=countries_file,
+                excluded_countries_file=excluded_countries_file,
+                warn_on_missing_countries=False,
+                warn_on_unused_countries=False,
+            ),
+        }
+
+        for name, func in benchmarks.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+            print(f"  {name:>22}: {min(times) * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark_harmonize_countries_cli()
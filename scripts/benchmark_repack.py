@@ -0,0 +1,64 @@
+"""Benchmark `repack_frame` on wide tables, either given feather tables or a synthetic table
+similar to FAOSTAT wide tables (country, year and many float columns, most of them whole
+numbers with missing values).
+
+Usage:
+    python scripts/benchmark_repack.py --rows 50000 --columns 1000 --workers 8
+    python scripts/benchmark_repack.py data/garden/faostat/2023-06-12/faostat_qcl/faostat_qcl.feather
+"""
+import time
+from pathlib import Path
+from typing import List
+
+import click
+import numpy as np
+import pandas as pd
+from owid.repack import repack_frame
+
+
+def synthetic_wide_table(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {
+        "country": rng.choice([f"country_{i}" for i in range(250)], rows).astype(object),
+        "year": rng.integers(1961, 2022, rows).astype("int64"),
+    }
+    for i in range(columns):
+        values = rng.random(rows) * 10 ** rng.integers(1, 8)
+        if i % 3 != 0:
+            # whole numbers like tonnes or hectares
+            values = np.round(values)
+        values[rng.random(rows) < 0.3] = np.nan
+        data[f"value_{i}"] = values
+    return pd.DataFrame(data)
+
+
+@click.command()
+@click.argument("tables", nargs=-1, type=click.Path(exists=True, path_type=Path))
+@click.option("--rows", default=50000, type=int, help="Rows of the synthetic table")
+@click.option("--columns", default=1000, type=int, help="Value columns of the synthetic table")
+@click.option("--workers", default=8, type=int, help="Threads for parallel repacking")
+@click.option("--repeat", default=3, type=int, help="Number of repetitions, best time is reported")
+def benchmark_repack_cli(tables: List[Path], rows: int, columns: int, workers: int, repeat: int) -> None:
+    if tables:
+        frames = {path.name: pd.read_feather(path) for path in tables}
+    else:
+        frames = {f"synthetic {rows}x{columns}": synthetic_wide_table(rows, columns)}
+
+    for name, df in frames.items():
+        # unpack to float64 and object first, like tables coming from pandas operations
+        df = df.astype({col: "float64" for col in df.columns if pd.api.types.is_numeric_dtype(df[col])})
+        df = df.astype({col: object for col in df.columns if df[col].dtype.name == "category"})
+        print(f"{name}: {df.memory_usage(deep=True).sum() / 2**20:.0f} MB")
+
+        for n_workers in [1, workers]:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                packed = repack_frame(df.copy(), workers=n_workers)
+                times.append(time.perf_counter() - start)
+            size_mb = packed.memory_usage(deep=True).sum() / 2**20
+            print(f"  {n_workers:>3} workers: {min(times):.2f}s, repacked to {size_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    benchmark_repack_cli()
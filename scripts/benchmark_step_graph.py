@@ -0,0 +1,46 @@
+"""Benchmark construction of Step objects from the DAG. Compares parsing every step with
+its dependencies separately (a new object for every path to a dependency) with building
+a shared step graph that has one object per step URI.
+
+Usage:
+    python scripts/benchmark_step_graph.py --grapher --private
+"""
+import time
+from typing import List
+
+import click
+
+from etl import paths
+from etl.command import construct_dag
+from etl.steps import Step, build_step_graph, parse_step, to_dependency_order
+from etl.steps import _walk_steps as walk_steps
+
+
+@click.command()
+@click.option("--grapher/--no-grapher", default=False, type=bool, help="Include grapher steps")
+@click.option("--private/--no-private", default=False, type=bool, help="Include private steps")
+@click.option("--repeat", default=3, type=int, help="Number of repetitions, best time is reported")
+def benchmark_step_graph_cli(grapher: bool, private: bool, repeat: int) -> None:
+    dag = construct_dag(paths.DEFAULT_DAG_FILE, backport=False, grapher=grapher, private=private)
+    step_names = to_dependency_order(dag, [], [])
+    print(f"DAG with {len(step_names)} steps")
+
+    def separate_objects() -> List[Step]:
+        return [parse_step(name, dag) for name in step_names]
+
+    def shared_graph() -> List[Step]:
+        graph = build_step_graph(dag, step_names)
+        return [graph[name] for name in step_names]
+
+    for label, build in [("separate objects", separate_objects), ("shared graph", shared_graph)]:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            steps = build()
+            times.append(time.perf_counter() - start)
+        n_objects = sum(1 for _ in walk_steps(steps))
+        print(f"{label:>17}: {n_objects:>6} Step objects, {min(times):.3f}s")
+
+
+if __name__ == "__main__":
+    benchmark_step_graph_cli()
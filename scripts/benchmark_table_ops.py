@@ -0,0 +1,121 @@
+"""Micro-benchmarks of common `Table` and `Variable` operations, to track the overhead of
+metadata propagation. The table has realistic metadata (origins, licenses, description key
+points, ...) in every column, like tables loaded from the catalog.
+
+Usage:
+    python scripts/benchmark_table_ops.py --rows 1000 --columns 500
+    python scripts/benchmark_table_ops.py --processing-log
+    python scripts/benchmark_table_ops.py -k fillna -k copy
+"""
+import os
+import time
+from typing import Callable, Dict, List
+
+import click
+import numpy as np
+from owid.catalog import License, Origin, Table, VariableMeta
+
+
+def synthetic_table(rows: int, columns: int, seed: int = 0) -> Table:
+    rng = np.random.default_rng(seed)
+    data = {
+        "country": [f"country_{i % 250}" for i in range(rows)],
+        "year": 1900 + np.arange(rows) // 250,
+    }
+    for i in range(columns):
+        values = rng.random(rows) * 100
+        values[rng.random(rows) < 0.2] = np.nan
+        data[f"value_{i}"] = values
+
+    tb = Table(data, short_name="benchmark").set_index(["country", "year"])
+    origin = Origin(producer="Producer", title="Dataset title", date_published="2023-01-01", citation_full="Citation")
+    for col in tb.columns:
+        tb[col].metadata = VariableMeta(
+            title=f"Title of {col}",
+            description_short="Short description.",
+            description_key=["First key point.", "Second key point."],
+            unit="tonnes",
+            short_unit="t",
+            origins=[origin],
+            licenses=[License(name="CC BY 4.0")],
+            display={"numDecimalPlaces": 1},
+            processing_level="minor",
+        )
+    return tb
+
+
+def column_arithmetic(tb: Table) -> None:
+    for col in tb.columns:
+        tb[col] = tb[col] * 100
+
+
+def column_ratio(tb: Table) -> None:
+    first = tb.columns[0]
+    for col in tb.columns:
+        tb[col] = tb[col] / tb[first]
+
+
+def column_fillna(tb: Table) -> None:
+    for col in tb.columns:
+        tb[col] = tb[col].fillna(0)
+
+
+def column_dropna(tb: Table) -> None:
+    for col in tb.columns:
+        tb[col].dropna()
+
+
+def table_arithmetic(tb: Table) -> None:
+    tb * 100
+
+
+def table_copy(tb: Table) -> None:
+    tb.copy()
+
+
+def table_select(tb: Table) -> None:
+    tb[list(tb.columns[: len(tb.columns) // 2])]
+
+
+def table_groupby_sum(tb: Table) -> None:
+    tb.groupby("country").sum()
+
+
+BENCHMARKS: Dict[str, Callable[[Table], None]] = {
+    "column_arithmetic": column_arithmetic,
+    "column_ratio": column_ratio,
+    "column_fillna": column_fillna,
+    "column_dropna": column_dropna,
+    "table_arithmetic": table_arithmetic,
+    "table_copy": table_copy,
+    "table_select": table_select,
+    "table_groupby_sum": table_groupby_sum,
+}
+
+
+@click.command()
+@click.option("--rows", default=1000, type=int, help="Rows of the synthetic table")
+@click.option("--columns", default=500, type=int, help="Value columns of the synthetic table")
+@click.option("--repeat", default=3, type=int, help="Number of repetitions, best time is reported")
+@click.option("--processing-log/--no-processing-log", default=False, help="Run with PROCESSING_LOG enabled")
+@click.option("-k", "names", multiple=True, help="Run only benchmarks containing this string")
+def benchmark_table_ops_cli(rows: int, columns: int, repeat: int, processing_log: bool, names: List[str]) -> None:
+    os.environ["PROCESSING_LOG"] = "1" if processing_log else "0"
+    tb = synthetic_table(rows, columns)
+    print(f"table {rows}x{columns}, processing log {'on' if processing_log else 'off'}")
+
+    for name, func in BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        times = []
+        for _ in range(repeat):
+            # every run starts from a fresh copy, operations may modify the table in place
+            t = tb.copy()
+            start = time.perf_counter()
+            func(t)
+            times.append(time.perf_counter() - start)
+        print(f"  {name:>20}: {min(times) * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark_table_ops_cli()
@@ -0,0 +1,63 @@
+"""Benchmark of slicing a wide multi-dimensional table into grapher variables with `_yield_wide_table`, as done by
+the grapher step. Reports time and peak memory allocated while iterating over all variables (each variable is
+discarded right after it's yielded, as it would be after upserting it).
+
+Usage:
+    python scripts/benchmark_yield_wide_table.py --rows 1000000 --columns 20 --dims 3
+"""
+import time
+import tracemalloc
+from typing import List
+
+import click
+import numpy as np
+import pandas as pd
+from owid.catalog import Table, VariableMeta
+
+from etl.grapher_helpers import _yield_wide_table
+
+
+def synthetic_table(rows: int, columns: int, dims: int, seed: int = 0) -> Table:
+    rng = np.random.default_rng(seed)
+    index = {
+        "entity_id": rng.integers(1, 250, rows),
+        "year": rng.integers(1950, 2023, rows),
+    }
+    dim_names: List[str] = []
+    for i in range(dims):
+        dim_names.append(f"dim_{i}")
+        index[f"dim_{i}"] = pd.Categorical(rng.choice([f"value_{j}" for j in range(4)], rows))
+    data = {f"column_{i}": np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows)) for i in range(columns)}
+    tb = Table(pd.DataFrame({**index, **data}).set_index(["entity_id", "year"] + dim_names), short_name="benchmark")
+    for col in tb.columns:
+        tb[col].metadata = VariableMeta(
+            title=f"Title of {col}",
+            unit="people",
+            description_short=" ".join(f"Description for << {d} >>." for d in dim_names),
+            description_key=[f"Key point for << {d} >>." for d in dim_names],
+        )
+    return tb
+
+
+@click.command()
+@click.option("--rows", default=1_000_000, type=int, help="Number of rows")
+@click.option("--columns", default=20, type=int, help="Number of columns")
+@click.option("--dims", default=3, type=int, help="Number of dimensions (besides entity_id and year)")
+def benchmark_yield_wide_table_cli(rows: int, columns: int, dims: int) -> None:
+    tb = synthetic_table(rows, columns, dims)
+    print(f"table with {rows} rows, {columns} columns and {dims} dimensions ({tb.memory_usage().sum() / 2**20:.0f} MB)")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    n = 0
+    for _ in _yield_wide_table(tb, na_action="drop"):
+        n += 1
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"  {n} variables in {duration * 1000:.0f} ms, peak memory {peak / 2**20:.0f} MB")
+
+
+if __name__ == "__main__":
+    benchmark_yield_wide_table_cli()
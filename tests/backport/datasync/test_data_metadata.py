@@ -1,3 +1,4 @@
+import json
 from unittest import mock
 
 import pandas as pd
@@ -159,6 +160,31 @@ def test_variable_data():
     }
 
 
+def test_variable_data_numeric():
+    for values in [
+        pd.Series([-2, 1, 3]),
+        pd.Series([-2.0, 1.0, 2.1, 9.8e09, 1e20]),
+        pd.Series([0.1, 2.0, 3.5], dtype="float32"),
+        pd.Series([1, 2, 3], dtype="Int64"),
+        pd.Series([2**60 + 1, 1]),
+    ]:
+        data_df = pd.DataFrame({"value": values, "year": 2000, "entityId": range(len(values))})
+        expected = variable_data(data_df.assign(value=values.astype(str)))
+        data = variable_data(data_df)
+        # Numeric values give the same payload as their string representations.
+        assert json.dumps(data) == json.dumps(expected)
+        assert [type(x) for x in data["values"]] == [type(x) for x in expected["values"]]
+        assert _infer_variable_type(values) == _infer_variable_type(values.astype(str))
+
+    assert variable_data(
+        pd.DataFrame({"value": [0.1, 2.0], "year": [2000, 2001], "entityId": [1, 1]}).astype({"value": "float32"})
+    ) == {
+        "values": [0.1, 2],
+        "years": [2000, 2001],
+        "entities": [1, 1],
+    }
+
+
 def test_variable_data_df_from_s3():
     engine = mock.Mock()
     entities = pd.DataFrame(
@@ -0,0 +1,84 @@
+import gzip
+import json
+import threading
+from typing import Any, Dict
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from tenacity.wait import wait_none
+
+from apps.backport.datasync import datasync
+
+
+class FakeS3Client:
+    """In-memory stand-in of S3 client, failing the first `failures` requests with given error."""
+
+    def __init__(self, failures: int = 0, error: Exception = EndpointConnectionError(endpoint_url="r2")):
+        self.objects: Dict[str, Any] = {}
+        self.failures = failures
+        self.error = error
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs) -> None:
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise self.error
+            self.objects[f"{Bucket}/{Key}"] = json.loads(gzip.decompress(Body))
+
+
+def test_uploader_uploads_and_records_metrics():
+    client = FakeS3Client()
+    uploader = datasync.R2Uploader(client=client, workers=4, max_pending=2)
+
+    uploads = (({"values": [i]}, f"s3://owid-api/v1/indicators/{i}.data.json") for i in range(20))
+    uploader.wait(uploader.submit_many(uploads))
+    uploader.shutdown()
+
+    assert len(client.objects) == 20
+    assert client.objects["owid-api/v1/indicators/3.data.json"] == {"values": [3]}
+
+    metrics = uploader.metrics.to_dict()
+    assert metrics["requests"] == 20
+    assert metrics["bytes"] > 0
+    assert metrics["retries"] == 0
+    assert metrics["failures"] == 0
+
+
+def test_uploader_retries():
+    throttled = ClientError({"Error": {"Code": "SlowDown"}, "ResponseMetadata": {"HTTPStatusCode": 503}}, "PutObject")
+    client = FakeS3Client(failures=2, error=throttled)
+    uploader = datasync.R2Uploader(client=client, workers=1, wait=wait_none())
+
+    uploader.submit({"a": 1}, "s3://owid-api/v1/indicators/1.metadata.json").result()
+
+    assert client.objects == {"owid-api/v1/indicators/1.metadata.json": {"a": 1}}
+    assert uploader.metrics.retries == 2
+
+
+def test_uploader_raises_after_max_attempts():
+    client = FakeS3Client(failures=10)
+    uploader = datasync.R2Uploader(client=client, workers=1, max_attempts=3, wait=wait_none())
+
+    with pytest.raises(EndpointConnectionError):
+        uploader.wait([uploader.submit({"a": 1}, "s3://owid-api/v1/indicators/1.data.json")])
+
+    assert uploader.metrics.retries == 2
+    assert uploader.metrics.failures == 1
+
+
+def test_rate_limiter():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds: float) -> None:
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = datasync.RateLimiter(600, clock=lambda: now[0], sleep=sleep)
+    for _ in range(30):
+        limiter.acquire()
+
+    # 10 requests in a burst, then one every 0.1s
+    assert len(sleeps) == 20
+    assert now[0] == pytest.approx(2.0)
@@ -165,7 +165,9 @@ class TestAddPopulationToDataframe:
 class TestHarmonizeCountries:
     def test_one_country_unchanged_and_another_changed(self):
         df_in = pd.DataFrame({"country": ["Country 1", "country_02"], "some_variable": [1, 2]})
-        df_out = pd.DataFrame({"country": ["Country 1", "Country 2"], "some_variable": [1, 2]})
+        df_out = pd.DataFrame({"country": ["Country 1", "Country 2"], "some_variable": [1, 2]}).astype(
+            {"country": "category"}
+        )
         assert geo.harmonize_countries(
             df=df_in,
             countries_file="MOCK_COUNTRIES_FILE",
@@ -178,7 +180,9 @@ class TestHarmonizeCountries:
 
     def test_one_country_unchanged_and_another_unknown(self):
         df_in = pd.DataFrame({"country": ["Country 1", "country_04"], "some_variable": [1, 2]})
-        df_out = pd.DataFrame({"country": ["Country 1", "country_04"], "some_variable": [1, 2]})
+        df_out = pd.DataFrame({"country": ["Country 1", "country_04"], "some_variable": [1, 2]}).astype(
+            {"country": "category"}
+        )
         assert geo.harmonize_countries(
             df=df_in,
             countries_file="MOCK_COUNTRIES_FILE",
@@ -189,7 +193,7 @@ class TestHarmonizeCountries:
     def test_two_unknown_countries_made_nan(self):
         df_in = pd.DataFrame({"country": ["Country 1", "country_04"], "some_variable": [1, 2]})
         df_out = pd.DataFrame({"country": [np.nan, np.nan], "some_variable": [1, 2]})
-        df_out["country"] = df_out["country"].astype(object)
+        df_out["country"] = df_out["country"].astype(object).astype("category")
         assert dataframes.are_equal(
             df1=df_out,
             df2=geo.harmonize_countries(
@@ -203,7 +207,9 @@ class TestHarmonizeCountries:
 
     def test_one_unknown_country_made_nan_and_a_known_country_changed(self):
         df_in = pd.DataFrame({"country": ["Country 1", "country_02"], "some_variable": [1, 2]})
-        df_out = pd.DataFrame({"country": [np.nan, "Country 2"], "some_variable": [1, 2]})
+        df_out = pd.DataFrame({"country": [np.nan, "Country 2"], "some_variable": [1, 2]}).astype(
+            {"country": "category"}
+        )
         assert dataframes.are_equal(
             df1=df_out,
             df2=geo.harmonize_countries(
@@ -218,7 +224,7 @@ class TestHarmonizeCountries:
     def test_on_dataframe_with_no_countries(self):
         df_in = pd.DataFrame({"country": []})
         df_out = pd.DataFrame({"country": []})
-        df_out["country"] = df_out["country"].astype(object)
+        df_out["country"] = df_out["country"].astype(object).astype("category")
         assert dataframes.are_equal(
             df1=df_out,
             df2=geo.harmonize_countries(df=df_in, countries_file="MOCK_COUNTRIES_FILE", warn_on_unused_countries=False),
@@ -226,7 +232,7 @@ class TestHarmonizeCountries:
 
     def test_change_country_column_name(self):
         df_in = pd.DataFrame({"Country": ["country_02"]})
-        df_out = pd.DataFrame({"Country": ["Country 2"]})
+        df_out = pd.DataFrame({"Country": ["Country 2"]}).astype({"Country": "category"})
         assert dataframes.are_equal(
             df1=df_out,
             df2=geo.harmonize_countries(
@@ -265,6 +271,7 @@ class TestHarmonizeCountries:
     def test_all_countries_excluded(self):
         df_in = pd.DataFrame({"country": ["country_05", "country_06"], "some_variable": [1, 2]})
         df_out = pd.DataFrame({"country": [], "some_variable": []}).astype({"country": str, "some_variable": int})
+        df_out["country"] = df_out["country"].astype("category")
         assert geo.harmonize_countries(
             df=df_in,
             countries_file="MOCK_COUNTRIES_FILE",
@@ -275,7 +282,7 @@ class TestHarmonizeCountries:
 
     def test_one_country_harmonized_and_one_excluded(self):
         df_in = pd.DataFrame({"country": ["country_02", "country_05"], "some_variable": [1, 2]})
-        df_out = pd.DataFrame({"country": ["Country 2"], "some_variable": [1]})
+        df_out = pd.DataFrame({"country": ["Country 2"], "some_variable": [1]}).astype({"country": "category"})
         assert geo.harmonize_countries(
             df=df_in,
             countries_file="MOCK_COUNTRIES_FILE",
@@ -286,7 +293,9 @@ class TestHarmonizeCountries:
 
     def test_one_country_left_equal_one_harmonized_and_one_excluded(self):
         df_in = pd.DataFrame({"country": ["country_01", "country_02", "country_05"], "some_variable": [1, 2, 3]})
-        df_out = pd.DataFrame({"country": ["country_01", "Country 2"], "some_variable": [1, 2]})
+        df_out = pd.DataFrame({"country": ["country_01", "Country 2"], "some_variable": [1, 2]}).astype(
+            {"country": "category"}
+        )
         assert geo.harmonize_countries(
             df=df_in,
             countries_file="MOCK_COUNTRIES_FILE",
@@ -1517,3 +1526,31 @@ class TestAddRegionsToTable(unittest.TestCase):
                 ds_income_groups=ds_income_groups,
                 countries_that_must_have_data={"Unknown region": ["Random"]},
             )
+
+    def test_region_that_is_member_of_another_region(self):
+        tb_in = Table.from_records(
+            [
+                ("France", 2020, 1),
+                ("Italy", 2020, 2),
+                ("Europe", 2020, 100),
+            ],
+            columns=["country", "year", "a"],
+        )
+        # The aggregate of "Europe" is replaced first, and then used to build the aggregate of "Europe and Italy".
+        tb_out = geo.add_regions_to_table(
+            tb=tb_in,
+            regions={"Europe": {}, "Europe and Italy": {"additional_members": ["Europe", "Italy"]}},
+            ds_regions=ds_regions,
+            ds_income_groups=ds_income_groups,
+            check_for_region_overlaps=False,
+        )
+        tb_expected = Table.from_records(
+            [
+                ("Europe", 2020, 3),
+                ("Europe and Italy", 2020, 5),
+                ("France", 2020, 1),
+                ("Italy", 2020, 2),
+            ],
+            columns=["country", "year", "a"],
+        )
+        assert dataframes.are_equal(tb_out, tb_expected)[0]
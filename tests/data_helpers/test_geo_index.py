@@ -0,0 +1,111 @@
+"""Test functions in etl.data_helpers.geo_index module.
+
+"""
+import shutil
+from pathlib import Path
+
+import pytest
+from owid.catalog import Dataset, DatasetMeta, Table
+
+from etl.data_helpers import geo, geo_index
+
+
+def _regions_table(members_of_europe: str = '["FRA", "ITA", "OWID_USS"]') -> Table:
+    return Table(
+        {
+            "code": ["OWID_EUR", "FRA", "ITA", "RUS", "OWID_USS", "OWID_EU"],
+            "name": ["Europe", "France", "Italy", "Russia", "USSR", "Europe"],
+            "members": [members_of_europe, "[]", "[]", "[]", "[]", '["RUS"]'],
+            "successors": ["[]", "[]", "[]", "[]", '["RUS"]', "[]"],
+            "aliases": [None, '["French Republic"]', None, '["Russian Federation"]', '["Soviet Union"]', None],
+        },
+        short_name="regions",
+    ).set_index("code")
+
+
+@pytest.fixture
+def geo_index_dir(tmp_path, monkeypatch) -> Path:
+    monkeypatch.setattr(geo_index, "GEO_INDEX_DIR", tmp_path / "cache")
+    monkeypatch.setattr(geo_index, "_REGIONS_INDEXES", {})
+    return tmp_path / "cache"
+
+
+def _create_regions_dataset(path: Path, tb_regions: Table) -> Dataset:
+    ds = Dataset.create_empty(path, DatasetMeta(short_name="regions"))
+    ds.add(tb_regions)
+    return ds
+
+
+def test_regions_index_matches_regions_dataset(tmp_path, geo_index_dir):
+    ds_regions = _create_regions_dataset(tmp_path / "regions", _regions_table())
+    index = geo_index.load_regions_index(ds_regions)
+
+    for subregion_type in ["members", "successors"]:
+        expected = geo.create_table_of_regions_and_subregions(ds_regions, subregion_type)[subregion_type].to_dict()
+        assert index.subregions(subregion_type) == expected
+    assert index.subregions("members") == {"Europe": ["France", "Italy", "USSR", "Russia"]}
+
+    assert index.canonical_name("russian federation") == "Russia"
+    assert index.canonical_name("OWID_USS") == "USSR"
+    assert index.canonical_name("Atlantis") is None
+    assert index.valid_names == {"Europe", "France", "Italy", "Russia", "USSR"}
+
+
+def test_regions_index_is_cached_and_rebuilt_on_change(tmp_path, geo_index_dir, monkeypatch):
+    ds_regions = _create_regions_dataset(tmp_path / "regions", _regions_table())
+    geo_index.load_regions_index(ds_regions)
+    (cached_path,) = geo_index_dir.glob("regions-*")
+
+    # A new process loads the index from the cache, without reading the regions table.
+    geo_index._REGIONS_INDEXES.clear()
+    with monkeypatch.context() as m:
+        m.setattr(geo_index.RegionsIndex, "from_dataset", None)
+        assert geo_index.load_regions_index(ds_regions).subregions("members")["Europe"][0] == "France"
+
+    # Running the regions step again makes the index stale.
+    ds_regions = _create_regions_dataset(tmp_path / "regions", _regions_table('["ITA"]'))
+    assert geo_index.load_regions_index(ds_regions).subregions("members")["Europe"] == ["Italy", "Russia"]
+    assert list(geo_index_dir.glob("regions-*")) != [cached_path]
+    assert len(list(geo_index_dir.glob("regions-*"))) == 1
+
+
+def test_load_population(tmp_path, geo_index_dir):
+    tb_population = Table(
+        {"country": ["France", "France", "Italy"], "year": [2000, 2001, 2000], "population": [60.0, 61.0, 57.0]},
+        short_name="population",
+    ).set_index(["country", "year"])
+    tb_population["population"].metadata.unit = "people"
+    ds_population = Dataset.create_empty(tmp_path / "population", DatasetMeta(short_name="population"))
+    ds_population.add(tb_population)
+
+    for _ in range(2):
+        tb = geo_index.load_population(ds_population)
+        assert tb.equals(ds_population["population"])
+        assert tb["population"].metadata.unit == "people"
+        assert tb.metadata.dataset.short_name == "population"  # type: ignore
+    assert len(list(geo_index_dir.glob("population-*/population.feather"))) == 1
+
+
+def test_indexes_of_different_datasets_are_kept(tmp_path, geo_index_dir):
+    ds_a = _create_regions_dataset(tmp_path / "a" / "regions", _regions_table())
+    ds_b = _create_regions_dataset(tmp_path / "b" / "regions", _regions_table('["ITA"]'))
+    geo_index.load_regions_index(ds_a)
+    geo_index.load_regions_index(ds_b)
+    assert len(list(geo_index_dir.glob("regions-*"))) == 2
+
+
+def test_index_removed_by_another_process_is_rebuilt(tmp_path, geo_index_dir, monkeypatch):
+    ds_regions = _create_regions_dataset(tmp_path / "regions", _regions_table())
+    load = geo_index.RegionsIndex.load
+    calls = []
+
+    def load_removed_once(path):
+        # another process prunes the index right before we load it
+        if not calls:
+            shutil.rmtree(path)
+        calls.append(path)
+        return load(path)
+
+    monkeypatch.setattr(geo_index.RegionsIndex, "load", load_removed_once)
+    assert geo_index.load_regions_index(ds_regions).subregions("members")["Europe"][0] == "France"
+    assert len(calls) == 2
@@ -11,6 +11,7 @@ import time
 import pytest
 
 from etl import command as cmd
+from etl import paths
 
 
 def test_timed_run():
@@ -70,3 +71,49 @@ def test_exec_graph_parallel():
 
     # Assert that all tasks have been completed
     assert all(task in done for task in exec_graph.keys())
+
+
+def test_exec_graph_parallel_priorities():
+    done = []
+
+    exec_graph = {
+        "task1": [],
+        "task2": [],
+        "task3": ["task1"],
+    }
+
+    def mock_func(task: str, **kwargs):
+        done.append(task)
+
+    # tasks with higher priority are executed first
+    priorities = {"task1": 1, "task2": 3, "task3": 2}
+    cmd.exec_graph_parallel(exec_graph, mock_func, workers=1, use_threads=True, priorities=priorities)
+
+    assert done == ["task2", "task1", "task3"]
+
+
+def test_steps_for_changed_files():
+    dag = {
+        "data://garden/energy/2023-01-01/energy": {"data://meadow/energy/2023-01-01/energy"},
+        "data://garden/energy/2023-01-01/mix": {"data://meadow/energy/2023-01-01/energy"},
+        "data-private://garden/energy/2023-01-01/secret": set(),
+        "grapher://grapher/energy/2023-01-01/energy": {"data://grapher/energy/2023-01-01/energy"},
+    }
+    step_dir = paths.STEP_DIR / "data"
+
+    assert cmd.steps_for_changed_files([step_dir / "garden/energy/2023-01-01/energy.meta.yml"], dag) == {
+        "data://garden/energy/2023-01-01/energy"
+    }
+    assert cmd.steps_for_changed_files([step_dir / "meadow/energy/2023-01-01/energy.py"], dag) == {
+        "data://meadow/energy/2023-01-01/energy"
+    }
+
+    # shared files belong to all steps in the folder
+    assert cmd.steps_for_changed_files([step_dir / "garden/energy/2023-01-01/shared.py"], dag) == {
+        "data://garden/energy/2023-01-01/energy",
+        "data://garden/energy/2023-01-01/mix",
+        "data-private://garden/energy/2023-01-01/secret",
+    }
+
+    # files outside of steps are ignored
+    assert cmd.steps_for_changed_files([paths.STEP_DIR / "__init__.py"], dag) == set()
@@ -1,7 +1,7 @@
 import pandas as pd
 from owid.catalog import Dataset, DatasetMeta, Table
 
-from etl.datadiff import DatasetDiff, _data_diff
+from etl.datadiff import DatasetDiff, _changed_partitions, _data_diff
 
 
 def test_DatasetDiff_summary(tmp_path):
@@ -50,3 +50,29 @@ def test_data_diff():
 [violet]- Avg. change: 1.00 (40%)
     """.strip()
     )
+
+
+def test_DatasetDiff_partitioned_tables(tmp_path):
+    datasets = []
+    for name, values in [("catalog_a", [1, 2, 3]), ("catalog_b", [1, 2, 4])]:
+        ds = Dataset.create_empty(tmp_path / name / "ds", DatasetMeta(namespace="n", version="v", short_name="ds"))
+        ds.metadata.channel = "garden"  # type: ignore
+        tab = Table(
+            pd.DataFrame({"country": ["France", "Germany", "Italy"], "year": [2000, 2000, 2000], "a": values}),
+            short_name="tab",
+        ).set_index(["country", "year"])
+        ds.add(tab, formats=["parquet_partitioned"])
+        datasets.append(ds)
+
+    ds_a, ds_b = datasets
+
+    # only the changed partition is compared
+    assert _changed_partitions(ds_a, ds_b, "tab") == (["Italy"], ["Italy"])
+
+    out = []
+    DatasetDiff(ds_a, ds_b, print=lambda x: out.append(x)).summary()
+    assert out == [
+        "[white]= Dataset [b]garden/n/v/ds[/b]",
+        "\t[white]= Table [b]tab[/b]",
+        "\t\t[yellow]~ Column [b]a[/b] (changed [u]data[/u])",
+    ]
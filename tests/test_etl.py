@@ -5,6 +5,7 @@
 """
 Check the integrity of the DAG.
 """
+import os
 from pathlib import Path
 from typing import List, Union
 from unittest.mock import patch
@@ -63,3 +64,18 @@ def get_all_steps(filename: Union[str, Path] = paths.DEFAULT_DAG_FILE) -> List[S
     dag = load_dag(filename)
     steps = compile_steps(dag, [])
     return steps
+
+
+def test_load_dag_cache(tmp_path):
+    dag_file = tmp_path / "dag.yml"
+    dag_file.write_text("steps:\n  data://a:\n    - data://b\n")
+    os.utime(dag_file, ns=(0, 0))
+
+    with patch("etl.files.CACHE_DIR", tmp_path):
+        assert load_dag(dag_file) == {"data://a": {"data://b"}}
+        # second load comes from the cache
+        assert load_dag(dag_file) == {"data://a": {"data://b"}}
+
+        # modifying the DAG invalidates the cache
+        dag_file.write_text("steps:\n  data://a:\n    - data://c\n")
+        assert load_dag(dag_file) == {"data://a": {"data://c"}}
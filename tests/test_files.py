@@ -1,3 +1,5 @@
+import os
+
 from etl import files
 
 
@@ -60,3 +62,23 @@ def test_checksum_file_regions(tmp_path):
     checksum2 = files.checksum_file(tmp_path / "regions.yml")
 
     assert checksum1 == checksum2
+
+
+def test_mtime_cache(tmp_path):
+    source = tmp_path / "source.yml"
+    source.write_text("a: 1")
+    # pretend the file was modified long ago, otherwise it wouldn't be cached
+    os.utime(source, ns=(0, 0))
+
+    cache = files.MtimeCache("test", "key", cache_dir=tmp_path)
+    assert cache.get() is None
+
+    cache.set({"a": 1}, [source])
+    assert cache.get() == {"a": 1}
+
+    # different key has its own entry
+    assert files.MtimeCache("test", "other", cache_dir=tmp_path).get() is None
+
+    # changing the source file invalidates the cache
+    source.write_text("a: 2")
+    assert cache.get() is None
@@ -69,6 +69,36 @@ def test_yield_wide_table_with_dimensions():
     assert t[t.columns[0]].metadata.title == "Deaths - Age group: 19-25"
 
 
+def test_yield_wide_table_does_not_modify_table():
+    df = pd.DataFrame(
+        {
+            "year": [2019, 2019, 2020, 2020],
+            "entity_id": [1, 1, 1, 1],
+            "sex": ["male", "female", "male", "female"],
+            "deaths": [1.0, 2.0, None, 4.0],
+        }
+    )
+    table = Table(df.set_index(["entity_id", "year", "sex"]))
+    table.deaths.metadata.unit = "people"
+    table.deaths.metadata.title = "Deaths of << sex >>"
+    table.deaths.metadata.description_key = ["Deaths of << sex >>."]
+
+    grapher_tables = list(gh._yield_wide_table(table, na_action="drop"))
+
+    t = grapher_tables[1]
+    assert t.columns[0] == "deaths__sex_male"
+    assert t.reset_index().to_dict(orient="list") == {"entity_id": [1], "year": [2019], "deaths__sex_male": [1.0]}
+    assert t[t.columns[0]].metadata.title == "Deaths of male"
+    assert t[t.columns[0]].metadata.description_key == ["Deaths of male."]
+    assert t[t.columns[0]].metadata.additional_info["dimensions"]["originalName"] == "Deaths of male"  # type: ignore
+
+    # original table is intact
+    assert table.deaths.metadata.title == "Deaths of << sex >>"
+    assert table.deaths.metadata.description_key == ["Deaths of << sex >>."]
+    assert table.deaths.metadata.additional_info is None
+    assert len(table) == 4
+
+
 def test_long_to_wide_tables():
     deaths_meta = VariableMeta(title="Deaths", unit="people")
     births_meta = VariableMeta(title="Births", unit="people")
@@ -197,6 +227,26 @@ def test_adapt_table_for_grapher_multiindex():
         assert out_table.columns.tolist() == ["deaths"]
 
 
+def test_entity_resolver():
+    with mock.patch("etl.grapher_helpers._get_entities_from_db") as mock_get_entities_from_db, mock.patch(
+        "etl.grapher_helpers._get_and_create_entities_in_db"
+    ) as mock_get_and_create_entities_in_db:
+        mock_get_entities_from_db.return_value = {"Poland": 1, "France": 2}
+        mock_get_and_create_entities_in_db.return_value = {"Atlantis": 3}
+
+        resolver = gh.EntityResolver()
+        country = pd.Series(["France", "Poland", "Atlantis", "France"], dtype="category")
+        entity_id = gh.country_to_entity_id(country, create_entities=True, entity_resolver=resolver)
+        assert entity_id.tolist() == [2, 1, 3, 2]
+        mock_get_entities_from_db.assert_called_once_with({"France", "Poland", "Atlantis"}, by="name")
+        mock_get_and_create_entities_in_db.assert_called_once_with({"Atlantis"})
+
+        # entities are served from cache
+        entity_id = gh.country_to_entity_id(pd.Series(["Atlantis", "Poland"]), entity_resolver=resolver)
+        assert entity_id.tolist() == [3, 1]
+        assert mock_get_entities_from_db.call_count == 1
+
+
 def test_expand_jinja():
     m = VariableMeta(
         title="Title << foo >>",
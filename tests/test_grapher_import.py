@@ -0,0 +1,119 @@
+from unittest import mock
+
+import pandas as pd
+from owid.catalog import DatasetMeta, Origin, Table
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session
+
+from etl import config
+from etl import grapher_import as gi
+
+
+def _checksums(values=[1.0, 2.0], title="Deaths", source_checksum="abc", links=None):
+    tb = Table({"year": [2000, 2001], "entity_id": [1, 2], "deaths": values}).set_index(["year", "entity_id"])
+    tb.metadata.dataset = DatasetMeta(short_name="deaths", title="Deaths", source_checksum=source_checksum)
+    tb.deaths.metadata.title = title
+    return gi._variable_checksums(tb, "grapher/a/latest/b/b#deaths", None, links)
+
+
+def test_variable_checksums():
+    data_checksum, metadata_checksum = _checksums()
+
+    # the same variable in a dataset whose inputs changed
+    assert _checksums(source_checksum="def") == (data_checksum, metadata_checksum)
+
+    # changed data
+    assert _checksums(values=[1.0, 3.0]) == (_checksums(values=[1.0, 3.0])[0], metadata_checksum)
+    assert _checksums(values=[1.0, 3.0])[0] != data_checksum
+    # ints are uploaded differently from floats
+    assert _checksums(values=[1, 2])[0] != data_checksum
+
+    # changed metadata
+    assert _checksums(title="Deaths (%)") == (data_checksum, _checksums(title="Deaths (%)")[1])
+    assert _checksums(title="Deaths (%)")[1] != metadata_checksum
+
+    # topic tag created after the last upsert
+    assert _checksums(links={"tag_ids": [1], "gdoc_ids": []})[1] != metadata_checksum
+
+    # staging server with a copy of production DB uploads elsewhere
+    with mock.patch.object(config, "BAKED_VARIABLES_PATH", "s3://owid-api-staging/my-branch/v1/indicators"):
+        staging_checksums = _checksums()
+    assert staging_checksums[0] != data_checksum
+    assert staging_checksums[1] != metadata_checksum
+
+
+def test_variable_checksums_table():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(
+            text("CREATE TABLE variables (id INTEGER PRIMARY KEY, datasetId INT, shortName TEXT, sourceId INT)")
+        )
+        conn.execute(
+            text("INSERT INTO variables VALUES (1, 10, 'deaths', 5), (2, 10, 'births', 5), (3, 11, 'deaths', 6)")
+        )
+
+    with Session(engine) as session:
+        # the table is created on first use
+        assert gi._load_unchanged_variables(session, 10, {"deaths": ("a", "b")}) == {}
+
+        gi._set_variable_checksums(session, {1: ("a", "b"), 2: ("c", "d"), 3: ("a", "b")})
+        unchanged = gi._load_unchanged_variables(session, 10, {"deaths": ("a", "b"), "births": ("c", "x")})
+        assert unchanged == {"deaths": gi.VariableUpsertResult(1, 5)}
+
+        # reset before upload
+        gi._set_variable_checksums(session, {1: (None, None)})
+        assert gi._load_unchanged_variables(session, 10, {"deaths": ("a", "b")}) == {}
+
+        gi._set_variable_checksums(session, {1: ("e", "f")})
+        assert gi._load_unchanged_variables(session, 10, {"deaths": ("e", "f")}) == {
+            "deaths": gi.VariableUpsertResult(1, 5)
+        }
+
+
+def test_upsert_tables_streams_data_of_changed_variables():
+    def tables():
+        calls.append(1)
+        for name, values in [("deaths", [1.0, 2.0]), ("births", [3.0, 4.0]), ("unchanged", [5.0, 6.0])]:
+            tb = Table({"year": [2000, 2001], "entity_id": [1, 2], name: values}).set_index(["year", "entity_id"])
+            tb.metadata.short_name = name
+            tb[name].metadata.title = name.title()
+            tb[name].metadata.unit = "people"
+            tb[name].metadata.origins = [Origin(producer="Producer", title="Title")]
+            yield tb, f"grapher/a/latest/b/b#{name}", None
+
+    calls = []
+    uploads = {}
+    resolver = mock.Mock()
+    resolver.entities.return_value = pd.DataFrame(
+        {"entityId": [1, 2], "entityName": ["A", "B"], "entityCode": [None, None]}
+    )
+    uploader = mock.Mock()
+    uploader.submit_many.side_effect = lambda it: [uploads.__setitem__(path, d) for d, path in it]
+
+    with mock.patch.object(config, "GRAPHER_VARIABLE_CHECKSUMS", True), mock.patch.object(
+        gi, "_resolved_links", side_effect=lambda session, metas: [{}] * len(metas)
+    ), mock.patch.object(gi, "Session"), mock.patch.object(
+        gi,
+        "_load_unchanged_variables",
+        return_value={"unchanged": gi.VariableUpsertResult(3, None)},  # type: ignore
+    ), mock.patch.object(gi.gm.Origin, "bulk_upsert", side_effect=lambda session, origins: origins), mock.patch.object(
+        gi.gm.Variable, "bulk_upsert", return_value=[1, 2]
+    ) as bulk_upsert, mock.patch.object(gi, "_update_links"), mock.patch.object(
+        gi, "variables_metadata_loader", return_value=lambda variable_id, df: {"id": variable_id, "rows": len(df)}
+    ), mock.patch.object(gi, "get_uploader", return_value=uploader), mock.patch.object(
+        gi, "_set_variable_checksums"
+    ) as set_checksums:
+        results = gi.upsert_tables(mock.Mock(), tables, gi.DatasetUpsertResult(1, {}), entity_resolver=resolver)
+
+    # tables are sliced twice instead of being held in memory
+    assert len(calls) == 2
+    assert [v.shortName for v in bulk_upsert.call_args[0][1]] == ["deaths", "births"]
+    assert sorted(r.variable_id for r in results) == [1, 2, 3]
+
+    assert uploads[f"{config.BAKED_VARIABLES_PATH}/1.data.json"]["values"] == [1, 2]
+    assert uploads[f"{config.BAKED_VARIABLES_PATH}/2.metadata.json"] == {"id": 2, "rows": 2}
+    assert len(uploads) == 4
+    # checksums are reset before upload and set after it
+    assert set_checksums.call_args_list[0][0][1] == {1: (None, None), 2: (None, None)}
+    assert set(set_checksums.call_args[0][1]) == {1, 2}
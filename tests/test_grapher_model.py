@@ -1,3 +1,9 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import Session, create_engine, select
+
 from etl import grapher_model as gm
 
 
@@ -9,3 +15,129 @@ def test_source_description():
     s = gm.Source(**d)
     assert "link" in s.description
     assert s.description["link"] == "ABC"
+
+
+def _links(session, cls, column):
+    return sorted(session.query(cls.variableId, getattr(cls, column), cls.displayOrder).all())
+
+
+def test_link_with_variables():
+    engine = create_engine("sqlite://")
+    gm.TagsVariablesTopicTagsLink.__table__.create(engine)  # type: ignore
+    link = gm.TagsVariablesTopicTagsLink
+
+    with Session(engine) as session:
+        link.link_with_variables(session, {1: [10, 11], 2: [10]})
+        session.commit()
+        assert _links(session, link, "tagId") == [(1, 10, 0), (1, 11, 1), (2, 10, 0)]
+
+        # only variables passed are synced, changed display order is updated
+        link.link_with_variables(session, {1: [11, 12]})
+        session.commit()
+        assert _links(session, link, "tagId") == [(1, 11, 0), (1, 12, 1), (2, 10, 0)]
+
+        # single variable version
+        link.link_with_variable(session, 2, [])
+        session.commit()
+        assert _links(session, link, "tagId") == [(1, 11, 0), (1, 12, 1)]
+
+
+def test_origin_bulk_upsert():
+    engine = create_engine("sqlite://")
+    gm.Origin.__table__.create(engine)  # type: ignore
+
+    with Session(engine) as session:
+        existing = gm.Origin(producer="A", title="a", dateAccessed="2023-01-01")
+        session.add(existing)
+        session.commit()
+
+        origins = gm.Origin.bulk_upsert(
+            session,
+            [
+                gm.Origin(producer="A", title="a", dateAccessed="2023-01-01"),
+                gm.Origin(producer="A", title="b"),
+                gm.Origin(producer=None, title="b"),
+                gm.Origin(producer="A", title="b"),
+            ],
+        )
+        assert origins[0].id == existing.id
+        assert origins[1].id is not None and origins[1].id != existing.id
+        assert origins[2].id not in (existing.id, origins[1].id)
+        # duplicates are upserted only once
+        assert origins[3] is origins[1]
+
+        # strings are compared ignoring case and accents like in MySQL
+        (origin,) = gm.Origin.bulk_upsert(session, [gm.Origin(producer="A", title="Á", dateAccessed="2023-01-01")])
+        assert origin.id == existing.id
+
+
+def test_variable_match_existing():
+    def _row(id, short_name, name):
+        return SimpleNamespace(id=id, shortName=short_name, name=name)
+
+    def _variable(short_name, name):
+        return gm.Variable(shortName=short_name, name=name)
+
+    a, b = _row(1, "a", "A"), _row(2, "b", "B")
+
+    # match on shortName, then on name
+    assert gm.Variable._match_existing([_variable("a", "X"), _variable("c", "B")], [a, b]) == [a, b]
+
+    # name of a row claimed by shortName belongs to the new variable once the row is renamed
+    assert gm.Variable._match_existing([_variable("a", "X"), _variable("c", "A")], [a, b]) == [a, None]
+
+    # updating a variable to the name of another row would overwrite that row
+    with pytest.raises(ValueError):
+        gm.Variable._match_existing([_variable("a", "B")], [a, b])
+
+    with pytest.raises(ValueError):
+        gm.Variable._match_existing([_variable("c", "C"), _variable("d", "C")], [a, b])
+
+
+@pytest.mark.skipif(
+    os.environ.get("TEST_GRAPHER_DB") not in ("True", "true", "1"),
+    reason="requires local grapher MySQL (e.g. from docker-compose), set TEST_GRAPHER_DB=1",
+)
+def test_variable_bulk_upsert_mysql():
+    with Session(gm.get_engine()) as session:
+        ds = session.exec(select(gm.Dataset)).first()
+        if ds is None:
+            pytest.skip("no dataset in grapher DB")
+
+        def _variable(short_name: str, **kwargs) -> gm.Variable:
+            kwargs.setdefault("name", short_name)
+            kwargs.setdefault("unit", "")
+            return gm.Variable(
+                datasetId=ds.id,
+                shortName=short_name,
+                coverage="",
+                timespan="2000-2020",
+                display={},
+                **kwargs,
+            )
+
+        try:
+            ids = gm.Variable.bulk_upsert(session, [_variable("__test_a", code="a"), _variable("__test_b")])
+            assert len(set(ids)) == 2
+
+            # existing variables are updated in place, code is kept if not specified
+            new_ids = gm.Variable.bulk_upsert(
+                session, [_variable("__test_b", unit="%"), _variable("__test_a"), _variable("__test_c")]
+            )
+            assert new_ids[:2] == ids[::-1]
+
+            a = session.exec(select(gm.Variable).where(gm.Variable.id == ids[0])).one()
+            b = session.exec(select(gm.Variable).where(gm.Variable.id == ids[1])).one()
+            assert a.code == "a"
+            assert b.unit == "%"
+
+            # new variable takes the name of a renamed one, the unique key on name must not merge them
+            d_ids = gm.Variable.bulk_upsert(
+                session, [_variable("__test_d", name="__test_a"), _variable("__test_a", name="__test_a2")]
+            )
+            assert d_ids[1] == ids[0]
+            assert d_ids[0] not in ids + new_ids
+            session.refresh(a)
+            assert (a.shortName, a.name) == ("__test_a", "__test_a2")
+        finally:
+            session.rollback()
@@ -0,0 +1,102 @@
+import hashlib
+import http.server
+import threading
+from functools import partial
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from etl import config, paths
+from etl.prefetch import Download, _Fetcher, prefetch, walden_downloads
+from etl.steps import SnapshotStep
+
+CONTENT = b"a,b\r\n1,2\r\n"
+
+
+@pytest.fixture()
+def remote(tmp_path):
+    """Local HTTP server standing in for the DVC remote."""
+    remote_dir = tmp_path / "remote"
+    handler = partial(http.server.SimpleHTTPRequestHandler, directory=str(remote_dir))
+    handler.log_message = lambda *args: None  # type: ignore
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield remote_dir, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def _write_snapshot(tmp_path, remote_dir, md5: str) -> None:
+    dvc_file = tmp_path / "snapshots/ns/2023-01-01/test.csv.dvc"
+    dvc_file.parent.mkdir(parents=True, exist_ok=True)
+    dvc_file.write_text(
+        f"""meta:
+  origin:
+    producer: Producer
+    title: Test
+wdir: ../../../data/snapshots/ns/2023-01-01
+outs:
+- md5: {md5}
+  size: {len(CONTENT)}
+  path: test.csv
+"""
+    )
+    # DVC remote stores files under their md5
+    (remote_dir / md5[:2]).mkdir(parents=True, exist_ok=True)
+    (remote_dir / md5[:2] / md5[2:]).write_bytes(CONTENT)
+
+
+def test_prefetch_snapshots(tmp_path, remote):
+    remote_dir, remote_url = remote
+    data_file = tmp_path / "data/snapshots/ns/2023-01-01/test.csv"
+
+    with patch.object(paths, "DATA_DIR", tmp_path / "data"), patch.object(
+        paths, "SNAPSHOTS_DIR", tmp_path / "snapshots"
+    ), patch.object(config, "SNAPSHOTS_URL", remote_url):
+        # md5 of text file as computed by DVC 2
+        _write_snapshot(tmp_path, remote_dir, hashlib.md5(CONTENT.replace(b"\r\n", b"\n")).hexdigest())
+        assert prefetch([SnapshotStep("ns/2023-01-01/test.csv")], workers=2) == (1, 0)
+        assert data_file.read_bytes() == CONTENT
+
+        # file is already there
+        assert prefetch([SnapshotStep("ns/2023-01-01/test.csv")], workers=2) == (0, 0)
+
+        # downloaded file doesn't match checksum
+        data_file.unlink()
+        _write_snapshot(tmp_path, remote_dir, "f" * 32)
+        assert prefetch([SnapshotStep("ns/2023-01-01/test.csv")], workers=2) == (0, 1)
+        assert not data_file.exists()
+        assert list(data_file.parent.iterdir()) == []
+
+
+def test_walden_downloads_only_public_cached_datasets():
+    def step(**kwargs):
+        dataset = SimpleNamespace(
+            **{
+                "owid_data_url": "https://walden.owid.io/a.csv",
+                "source_data_url": "https://example.com/a.csv",
+                "is_public": True,
+                "local_path": "/tmp/a.csv",
+                "md5": "abc",
+                **kwargs,
+            }
+        )
+        return SimpleNamespace(_walden_dataset=dataset, is_dirty=lambda: True)
+
+    assert [d.url for d in walden_downloads(step())] == ["https://walden.owid.io/a.csv"]  # type: ignore
+    assert walden_downloads(step(is_public=False)) == []  # type: ignore
+    assert walden_downloads(step(owid_data_url=None)) == []  # type: ignore
+
+
+def test_download_with_crlf_split_between_chunks(tmp_path):
+    fetcher = _Fetcher(workers=1)
+    md5 = hashlib.md5(CONTENT.replace(b"\r\n", b"\n")).hexdigest()
+    d = Download(url="https://example.com/test.csv", path=tmp_path / "test.csv", md5=md5, dos2unix=True)
+
+    # chunks can be split anywhere, e.g. between CR and LF
+    with patch.object(_Fetcher, "_iter_chunks", return_value=[CONTENT[:4], CONTENT[4:]]):
+        fetcher.download(d)
+
+    assert CONTENT[3:5] == b"\r\n"
+    assert d.path.read_bytes() == CONTENT
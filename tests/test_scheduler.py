@@ -0,0 +1,70 @@
+from etl import scheduler
+
+
+def test_critical_paths():
+    # a -> b -> d, a -> c -> d (dependent -> dependencies)
+    exec_graph = {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b", "c"}}
+    durations = {"a": 1.0, "b": 10.0, "c": 2.0, "d": 1.0}
+
+    assert scheduler.critical_paths(exec_graph, durations) == {
+        "a": 12.0,
+        "b": 11.0,
+        "c": 3.0,
+        "d": 1.0,
+    }
+
+
+def test_pick_ready_by_priority():
+    priorities = {"a": 1.0, "b": 5.0, "c": 3.0}
+    assert scheduler.pick_ready(["a", "b", "c"], priorities, running=[], workers=2) == ["b", "c"]
+    assert scheduler.pick_ready(["a", "b", "c"], priorities, running=["x"], workers=2) == ["b"]
+
+
+def test_pick_ready_grapher_first_with_same_priority():
+    ready = ["snapshot://a", "data://garden/b", "grapher://grapher/c"]
+    priorities = {"snapshot://a": 1.0, "data://garden/b": 1.0, "grapher://grapher/c": 1.0}
+    assert scheduler.pick_ready(ready, priorities, running=[], workers=2) == ["grapher://grapher/c", "snapshot://a"]
+
+    # priority still comes first
+    priorities["data://garden/b"] = 2.0
+    assert scheduler.pick_ready(ready, priorities, running=[], workers=1) == ["data://garden/b"]
+
+
+def test_pick_ready_with_memory_budget():
+    priorities = {"a": 3.0, "b": 2.0, "c": 1.0}
+    memory = {"a": 8, "b": 8, "c": 2}
+
+    # b doesn't fit next to a, but c does
+    assert scheduler.pick_ready(["a", "b", "c"], priorities, [], 3, memory, max_memory=10) == ["a", "c"]
+
+    # a step is always started if nothing else is running
+    assert scheduler.pick_ready(["a"], priorities, [], 3, memory, max_memory=4) == ["a"]
+
+
+def test_predict_makespan():
+    exec_graph = {"a": set(), "b": {"a"}, "c": set()}
+    durations = {"a": 5.0, "b": 5.0, "c": 3.0}
+
+    assert scheduler.predict_makespan(exec_graph, durations, workers=1) == 13.0
+    assert scheduler.predict_makespan(exec_graph, durations, workers=2) == 10.0
+
+    # memory budget prevents running a and c together
+    memory = {"a": 10, "b": 10, "c": 10}
+    assert scheduler.predict_makespan(exec_graph, durations, workers=2, memory=memory, max_memory=15) == 13.0
+
+
+def test_step_history(tmp_path):
+    path = tmp_path / "step_history.json"
+    scheduler.StepHistory(path).record("data://a", 10.0, peak_rss=100)
+    scheduler.StepHistory(path).record("data://b", 20.0)
+
+    history = scheduler.StepHistory.load(path)
+    assert history.records["data://a"] == scheduler.StepRecord(duration=10.0, peak_rss=100)
+
+    # unknown steps get median duration
+    assert history.durations(["data://a", "data://b", "data://c"]) == {
+        "data://a": 10.0,
+        "data://b": 20.0,
+        "data://c": 15.0,
+    }
+    assert history.peak_memory(["data://a", "data://b", "data://c"]) == {"data://a": 100, "data://b": 0, "data://c": 0}
@@ -1,9 +1,13 @@
+import hashlib
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 from owid.catalog import Origin
 
-from etl.snapshot import SnapshotMeta, _parse_snapshot_path
+from etl import paths
+from etl.files import checksum_file
+from etl.snapshot import Snapshot, SnapshotMeta, _parse_snapshot_path
 
 
 def test_parse_snapshot_path():
@@ -37,3 +41,43 @@ def test_snapshot_to_yaml():
         "version": "2023-04-18",
         "origin": {"title": "Aviation Statistics by Period", "producer": "Producer"},
     }
+
+
+def test_snapshot_is_dirty_without_dvc(tmp_path):
+    data_file = tmp_path / "data/snapshots/ns/2023-01-01/test.csv"
+    data_file.parent.mkdir(parents=True)
+    data_file.write_bytes(b"a,b\r\n1,2\r\n")
+
+    dvc_file = tmp_path / "snapshots/ns/2023-01-01/test.csv.dvc"
+    dvc_file.parent.mkdir(parents=True)
+
+    def write_dvc_file(md5: str, size: int) -> None:
+        dvc_file.write_text(
+            f"""meta:
+  origin:
+    producer: Producer
+    title: Test
+wdir: ../../../data/snapshots/ns/2023-01-01
+outs:
+- md5: {md5}
+  size: {size}
+  path: test.csv
+"""
+        )
+
+    with patch.object(paths, "DATA_DIR", tmp_path / "data"), patch.object(
+        paths, "SNAPSHOTS_DIR", tmp_path / "snapshots"
+    ), patch.object(Snapshot, "_dvc_is_dirty", return_value=True) as dvc_is_dirty:
+        # md5 of the file itself
+        write_dvc_file(checksum_file(data_file), data_file.stat().st_size)
+        assert not Snapshot("ns/2023-01-01/test.csv").is_dirty()
+
+        # md5 of the file with LF line endings, as computed by DVC 2 for text files
+        write_dvc_file(hashlib.md5(b"a,b\n1,2\n").hexdigest(), data_file.stat().st_size)
+        assert not Snapshot("ns/2023-01-01/test.csv").is_dirty()
+        dvc_is_dirty.assert_not_called()
+
+        # files that don't match are checked by DVC
+        write_dvc_file("0" * 32, data_file.stat().st_size)
+        assert Snapshot("ns/2023-01-01/test.csv").is_dirty()
+        dvc_is_dirty.assert_called_once()
@@ -9,19 +9,21 @@ Test that the different step types work as expected.
 import random
 import shutil
 import string
+import sys
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Iterator, List
 from unittest.mock import patch
 
 import pandas as pd
 from owid.catalog import Dataset
 
-from etl import paths
+from etl import build_cache, config, paths
 from etl.steps import (
     BackportStepPrivate,
     DataStep,
     DataStepPrivate,
     Step,
+    cached_result,
     compile_steps,
     filter_to_subgraph,
     get_etag,
@@ -53,6 +55,33 @@ def test_data_step():
         Dataset((paths.DATA_DIR / step_name).as_posix())
 
 
+def test_data_step_forked():
+    with temporary_step() as step_name, patch.object(config, "FORK_STEPS", True):
+        _create_mock_py_file(step_name)
+        DataStep(step_name, []).run()
+        Dataset((paths.DATA_DIR / step_name).as_posix())
+
+        # step module was imported only in the forked child
+        assert f"etl.steps.data.{step_name}" not in sys.modules
+
+
+def test_data_step_build_cache(tmp_path):
+    with temporary_step() as step_name, patch.object(config, "DEBUG", True), patch.object(
+        config, "BUILD_CACHE", True
+    ), patch.object(build_cache, "LOCAL_BUILD_CACHE_DIR", tmp_path):
+        _create_mock_py_file(step_name)
+        d = DataStep(step_name, [])
+        d.run()
+        assert (tmp_path / step_name / d.checksum_input() / "index.json").exists()
+
+        # output is restored from the cache without running the step
+        shutil.rmtree(paths.DATA_DIR / step_name)
+        assert d.is_dirty()
+        with patch.object(DataStep, "_run_py_isolated", side_effect=AssertionError):
+            d.run()
+        assert not d.is_dirty()
+
+
 def test_data_step_becomes_dirty_when_pandas_version_changes():
     pandas_version = pd.__version__
     try:
@@ -119,7 +148,7 @@ def test_dependency_filtering():
 @patch("etl.steps.parse_step")
 def test_selection_selects_parents(parse_step):
     "When you pick a step, it should select everything that step depends on."
-    parse_step.side_effect = lambda name, _: DummyStep(name)  # type: ignore
+    parse_step.side_effect = lambda name, *_: DummyStep(name)  # type: ignore
 
     dag = {"a": ["b"], "d": ["a"], "c": ["a"]}
 
@@ -130,6 +159,14 @@ def test_selection_selects_parents(parse_step):
     assert set(s.path for s in steps) == {"b", "a", "d"}
 
 
+def test_compile_steps_shares_dependencies():
+    "Steps with a common dependency should share the same object."
+    dag = {"data://a": {"data://c"}, "data://b": {"data://c"}}
+    steps = {str(s): s for s in compile_steps(dag, [], [])}
+    assert steps["data://a"].dependencies[0] is steps["data://c"]  # type: ignore
+    assert steps["data://b"].dependencies[0] is steps["data://c"]  # type: ignore
+
+
 class DummyStep(Step):  # type: ignore
     def __init__(self, name: str):
         self.path = name
@@ -171,6 +208,29 @@ def test_select_dirty_steps():
     assert all([s.is_dirty() for s in select_dirty_steps(steps, 10)])  # type: ignore
 
 
+def test_select_dirty_steps_checks_shared_dependency_once():
+    calls = []
+
+    class CountingStep(DummyStep):
+        def __init__(self, name: str, dependencies: List[Step]):
+            super().__init__(name)
+            self.dependencies = dependencies
+
+        @cached_result
+        def is_dirty(self) -> bool:
+            calls.append(self.path)
+            return self.path == "c" or any(d.is_dirty() for d in self.dependencies)
+
+    c = CountingStep("c", [])
+    steps = [CountingStep("a", [c]), CountingStep("b", [c])]
+    assert len(select_dirty_steps(steps, 2)) == 2  # type: ignore
+    assert sorted(calls) == ["a", "b", "c"]
+
+    # results are not cached outside of dirty detection
+    c.is_dirty()
+    assert calls.count("c") == 2
+
+
 def test_get_etag():
     etag = get_etag("https://raw.githubusercontent.com/owid/owid-grapher/master/README.md")
     assert etag
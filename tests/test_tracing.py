@@ -0,0 +1,26 @@
+import json
+
+from etl import command as cmd
+from etl import tracing
+
+
+def test_trace_spans_and_export(tmp_path):
+    events_file = tmp_path / "trace.jsonl"
+    tracing.enable(events_file)
+    try:
+        with tracing.span("outer", cat="test", step="a"):
+            tracing.traced("inner", cat="test")(lambda: None)()
+
+        exec_graph = {"task1": set(), "task2": {"task1"}}
+        cmd.exec_graph_parallel(exec_graph, lambda task, **kwargs: None, workers=1, use_threads=True)
+    finally:
+        tracing.disable()
+
+    # nothing is recorded when tracing is disabled
+    with tracing.span("disabled"):
+        pass
+
+    trace = json.loads(tracing.export_chrome_trace(events_file).read_text())
+    events = {(e["name"], e["args"].get("step")) for e in trace["traceEvents"]}
+    assert events == {("outer", "a"), ("inner", None), ("queued", "task1"), ("queued", "task2")}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace["traceEvents"])